@@ -0,0 +1,78 @@
+import os
+import re
+import threading
+from typing import Dict, Optional
+from fastapi import Header, HTTPException
+from sqlalchemy.exc import IntegrityError
+
+from .database import SessionLocal, DEFAULT_USER_ID, seed_user
+from .services.shared_state import host_lock
+
+USER_ID_PATTERN = re.compile(r"^[A-Za-z0-9_.@-]{1,64}$")
+
+# Trust the X-User-Id header; only behind an authenticating proxy or in the bench harness,
+# since any client can set it
+ALLOW_USER_HEADER = os.getenv("ALLOW_USER_HEADER", "false").lower() == "true"
+
+def parse_api_tokens(value: str) -> Dict[str, str]:
+    """API_TOKENS is a comma-separated list of token:user_id pairs"""
+    tokens = {}
+    for pair in value.split(","):
+        token, _, user_id = pair.strip().partition(":")
+        if token and user_id:
+            tokens[token] = user_id
+    return tokens
+
+API_TOKENS = parse_api_tokens(os.getenv("API_TOKENS", ""))
+# Reject requests without credentials instead of serving the default user;
+# on by default once tokens are issued, i.e. when there is more than one user
+REQUIRE_AUTH = os.getenv("REQUIRE_AUTH", "true" if API_TOKENS else "false").lower() == "true"
+
+_known_users = set()
+_seed_lock = threading.Lock()
+
+def ensure_user(user_id: str):
+    """Create the user and their default categories the first time they are seen"""
+    if user_id in _known_users:
+        return
+    # Other worker processes on this host may be seeding the same new user
+    with _seed_lock, host_lock("seed"):
+        if user_id in _known_users:
+            return
+        db = SessionLocal()
+        try:
+            seed_user(db, user_id)
+            db.commit()
+        except IntegrityError:
+            # Seeded concurrently by a worker on another host
+            db.rollback()
+        finally:
+            db.close()
+        _known_users.add(user_id)
+
+def get_current_user_id(
+    authorization: Optional[str] = Header(None),
+    x_user_id: Optional[str] = Header(None)
+) -> str:
+    """
+    Resolve the requesting user from a bearer token or the X-User-Id header,
+    falling back to the default user. Every query is scoped by the result.
+    """
+    user_id = None
+    if authorization:
+        scheme, _, token = authorization.partition(" ")
+        if scheme.lower() != "bearer" or token.strip() not in API_TOKENS:
+            raise HTTPException(status_code=401, detail="Invalid token")
+        user_id = API_TOKENS[token.strip()]
+    elif x_user_id and ALLOW_USER_HEADER:
+        user_id = x_user_id.strip()
+    elif not REQUIRE_AUTH:
+        user_id = DEFAULT_USER_ID
+    
+    if user_id is None:
+        raise HTTPException(status_code=401, detail="Authentication required")
+    if not USER_ID_PATTERN.match(user_id):
+        raise HTTPException(status_code=400, detail="Invalid user id")
+    
+    ensure_user(user_id)
+    return user_id
@@ -1,23 +1,99 @@
-from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime, Boolean, ForeignKey
+from sqlalchemy import create_engine, event, inspect, insert, select, Column, Integer, String, Float, DateTime, Boolean, ForeignKey, Index, Text, UniqueConstraint
 from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.exc import DBAPIError
 from sqlalchemy.orm import sessionmaker, relationship
 from datetime import datetime
+import hashlib
 import os
 from dotenv import load_dotenv
 
+# The one place .env is read; every app module imports this one first
 load_dotenv()
 
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./smart_bud.db")
 
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
+# Pool settings; ignored for in-memory SQLite, which uses a single shared connection
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+
+# User served when a request carries no credentials (single-household installs)
+DEFAULT_USER_ID = os.getenv("DEFAULT_USER_ID", "001")
+
+def is_sqlite(url: str) -> bool:
+    return url.startswith("sqlite")
+
+def async_database_url(url: str) -> str:
+    """The async driver variant of a database URL (aiosqlite / asyncpg)"""
+    scheme, rest = url.split("://", 1)
+    dialect = scheme.split("+", 1)[0]
+    if dialect == "sqlite":
+        return f"sqlite+aiosqlite://{rest}"
+    if dialect in ("postgresql", "postgres"):
+        return f"postgresql+asyncpg://{rest}"
+    return url
+
+def is_memory_sqlite(url: str) -> bool:
+    return is_sqlite(url) and (":memory:" in url or url.split("://", 1)[1] in ("", "/"))
+
+def engine_options(url: str, poolclass=None) -> dict:
+    options = {"pool_pre_ping": DB_POOL_PRE_PING}
+    if is_sqlite(url):
+        options["connect_args"] = {"check_same_thread": False}
+        if is_memory_sqlite(url):
+            return options
+    if poolclass is not None:
+        options["poolclass"] = poolclass
+    options.update(
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_recycle=DB_POOL_RECYCLE
+    )
+    return options
+
+def configure_sqlite(dbapi_connection, connection_record):
+    """
+    WAL lets readers run alongside a writer, so dashboard reads don't queue
+    behind an upload; NORMAL sync is safe under WAL, and the busy timeout makes
+    concurrent writers wait instead of failing with "database is locked"
+    """
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+    cursor.close()
+
+engine = create_engine(DATABASE_URL, **engine_options(DATABASE_URL))
+if is_sqlite(DATABASE_URL):
+    event.listen(engine, "connect", configure_sqlite)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# The async engine is created on first use so the sync-only paths (workers,
+# scripts) don't need the async driver installed
+_async_engine = None
+_async_session_factory = None
+
+def get_async_engine():
+    global _async_engine, _async_session_factory
+    if _async_engine is None:
+        from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+        from sqlalchemy.pool import AsyncAdaptedQueuePool
+        url = async_database_url(DATABASE_URL)
+        # aiosqlite would otherwise default to NullPool and reconnect per session
+        _async_engine = create_async_engine(url, **engine_options(url, AsyncAdaptedQueuePool))
+        if is_sqlite(url):
+            event.listen(_async_engine.sync_engine, "connect", configure_sqlite)
+        _async_session_factory = async_sessionmaker(_async_engine, autoflush=False, expire_on_commit=False)
+    return _async_engine
+
 Base = declarative_base()
 
 class User(Base):
     __tablename__ = "users"
     
-    id = Column(String, primary_key=True, default="001")
+    id = Column(String, primary_key=True, default=DEFAULT_USER_ID)
     name = Column(String, default="Default User")
     created_at = Column(DateTime, default=datetime.utcnow)
     
@@ -27,12 +103,18 @@ class User(Base):
 
 class Category(Base):
     __tablename__ = "categories"
+    __table_args__ = (
+        # Every category lookup is scoped to one user
+        Index("ix_categories_user_name", "user_id", "name"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(String, ForeignKey("users.id"), default="001")
+    user_id = Column(String, ForeignKey("users.id"), default=DEFAULT_USER_ID)
     name = Column(String, index=True)
     color = Column(String, default="#3B82F6")
     budget_limit = Column(Float, default=0.0)
+    # Which part of the needs/wants/savings budget split this category counts towards
+    budget_group = Column(String, default="wants")
     is_custom = Column(Boolean, default=False)
     created_at = Column(DateTime, default=datetime.utcnow)
     
@@ -41,9 +123,17 @@ class Category(Base):
 
 class Transaction(Base):
     __tablename__ = "transactions"
+    __table_args__ = (
+        # Re-uploaded rows hash the same, so duplicates are rejected by the database
+        Index("ux_transactions_user_content_hash", "user_id", "content_hash", unique=True),
+        # Keyset pagination on (date, id) for listings and the review queue
+        Index("ix_transactions_user_date", "user_id", "date", "id"),
+        Index("ix_transactions_user_review_date", "user_id", "needs_review", "date", "id"),
+        Index("ix_transactions_user_category_date", "user_id", "category_id", "date", "id"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(String, ForeignKey("users.id"), default="001")
+    user_id = Column(String, ForeignKey("users.id"), default=DEFAULT_USER_ID)
     date = Column(DateTime)
     amount = Column(Float)
     description = Column(String)
@@ -51,6 +141,9 @@ class Transaction(Base):
     confidence_score = Column(Float, default=0.0)
     file_source = Column(String)
     needs_review = Column(Boolean, default=False)
+    content_hash = Column(String, nullable=True)
+    # Which tier assigned the category: llm, cache, classifier or user
+    category_source = Column(String, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
@@ -61,7 +154,7 @@ class BudgetPlan(Base):
     __tablename__ = "budget_plans"
     
     id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(String, ForeignKey("users.id"), default="001")
+    user_id = Column(String, ForeignKey("users.id"), default=DEFAULT_USER_ID)
     income = Column(Float)
     needs_pct = Column(Float, default=50.0)
     wants_pct = Column(Float, default=30.0)
@@ -70,8 +163,264 @@ class BudgetPlan(Base):
     
     user = relationship("User", back_populates="budget_plans")
 
+class MerchantCategory(Base):
+    """Cached categorization for a normalized merchant description"""
+    __tablename__ = "merchant_categories"
+    __table_args__ = (UniqueConstraint("user_id", "merchant_key"),)
+    
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(String, ForeignKey("users.id"), default=DEFAULT_USER_ID)
+    merchant_key = Column(String)
+    category_name = Column(String)
+    confidence_score = Column(Float, default=0.0)
+    categories_version = Column(String)
+    hits = Column(Integer, default=0)
+    last_used_at = Column(DateTime, default=datetime.utcnow, index=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class ExtractionCacheEntry(Base):
+    """LLM extraction result for a statement, keyed on a hash of its content, the prompt and the model"""
+    __tablename__ = "extraction_cache"
+    
+    key = Column(String, primary_key=True)
+    model = Column(String)
+    transactions = Column(Text)
+    row_count = Column(Integer, default=0)
+    size_bytes = Column(Integer, default=0)
+    hits = Column(Integer, default=0)
+    last_used_at = Column(DateTime, default=datetime.utcnow, index=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class CategoryRule(Base):
+    """User rule: descriptions containing `pattern` (within the amount range) go to a category"""
+    __tablename__ = "category_rules"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(String, ForeignKey("users.id"), default=DEFAULT_USER_ID, index=True)
+    pattern = Column(String)
+    category_id = Column(Integer, ForeignKey("categories.id"))
+    min_amount = Column(Float, nullable=True)
+    max_amount = Column(Float, nullable=True)
+    priority = Column(Integer, default=0)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    category = relationship("Category")
+
+class MonthlyRollup(Base):
+    """
+    Per (user, month, category) totals maintained alongside transactions so
+    dashboards don't scan raw rows. category_id 0 holds uncategorized rows.
+    """
+    __tablename__ = "monthly_rollups"
+    __table_args__ = (UniqueConstraint("user_id", "month", "category_id"),)
+    
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(String, ForeignKey("users.id"), default=DEFAULT_USER_ID)
+    month = Column(String)
+    category_id = Column(Integer, default=0)
+    total = Column(Float, default=0.0)
+    count = Column(Integer, default=0)
+    min_amount = Column(Float, nullable=True)
+    max_amount = Column(Float, nullable=True)
+    # Expenses (as positive amounts) and income, as the dashboard shows them
+    spent = Column(Float, default=0.0)
+    spent_count = Column(Integer, default=0)
+    income = Column(Float, default=0.0)
+
+class RecurringSeries(Base):
+    """
+    Running state of one merchant's transactions for a user, kept up to date as
+    rows are saved, from which recurring charges and their next date are read
+    """
+    __tablename__ = "recurring_series"
+    __table_args__ = (
+        UniqueConstraint("user_id", "merchant_key"),
+        Index("ix_recurring_series_user_recurring", "user_id", "is_recurring", "next_expected"),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(String, ForeignKey("users.id"), default=DEFAULT_USER_ID)
+    merchant_key = Column(String)
+    # Latest description and category seen for the merchant, for display
+    description = Column(String)
+    category_id = Column(Integer, ForeignKey("categories.id"), nullable=True)
+    count = Column(Integer, default=0)
+    last_date = Column(DateTime, nullable=True)
+    last_amount = Column(Float, nullable=True)
+    # JSON list of the most recent dates (YYYY-MM-DD), oldest first
+    recent_dates = Column(Text, default="[]")
+    # Running mean and sum of squared deviations of the amount (Welford)
+    amount_mean = Column(Float, default=0.0)
+    amount_m2 = Column(Float, default=0.0)
+    interval_days = Column(Float, nullable=True)
+    cadence = Column(String, nullable=True)
+    is_recurring = Column(Boolean, default=False)
+    next_expected = Column(DateTime, nullable=True)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class IngestJob(Base):
+    """Background upload processed by the ingestion workers"""
+    __tablename__ = "ingest_jobs"
+    __table_args__ = (
+        # An identical file submitted while its job is still active joins that job
+        Index("ix_ingest_jobs_user_file_hash", "user_id", "file_hash"),
+    )
+    
+    id = Column(String, primary_key=True)
+    user_id = Column(String, ForeignKey("users.id"), default=DEFAULT_USER_ID)
+    filename = Column(String)
+    file_path = Column(String)
+    file_hash = Column(String, nullable=True)
+    status = Column(String, default="queued", index=True)
+    # The JobQueue that owns the job refreshes heartbeat_at while it is active
+    worker_id = Column(String, nullable=True)
+    heartbeat_at = Column(DateTime, nullable=True)
+    rows_extracted = Column(Integer, default=0)
+    rows_categorized = Column(Integer, default=0)
+    rows_saved = Column(Integer, default=0)
+    error = Column(Text, nullable=True)
+    result = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class UploadLock(Base):
+    """
+    A file being processed, keyed on the user and the file's hash, so worker
+    processes never work on the same upload at once. The holder refreshes
+    heartbeat_at; a lock that stops being refreshed can be taken over.
+    """
+    __tablename__ = "upload_locks"
+    
+    key = Column(String, primary_key=True)
+    owner = Column(String)
+    filename = Column(String)
+    heartbeat_at = Column(DateTime, default=datetime.utcnow)
+
+class SchemaVersion(Base):
+    """Fingerprint of the schema the database was last brought up to date with"""
+    __tablename__ = "schema_version"
+    
+    id = Column(Integer, primary_key=True)
+    version = Column(String)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+# Bump for schema changes the models don't describe (raw SQL objects, backfills)
+SCHEMA_REVISION = 2
+
+# Substring index over transaction descriptions. On SQLite an external-content
+# FTS5 table with the trigram tokenizer (SQLite 3.34+), kept in sync by
+# triggers; on Postgres a pg_trgm GIN index, which the database maintains.
+SEARCH_TABLE = "transactions_fts"
+
+SQLITE_SEARCH_DDL = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE}
+        USING fts5(description, content='transactions', content_rowid='id', tokenize='trigram')""",
+    f"""CREATE TRIGGER IF NOT EXISTS transactions_fts_insert AFTER INSERT ON transactions BEGIN
+        INSERT INTO {SEARCH_TABLE}(rowid, description) VALUES (new.id, new.description);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS transactions_fts_delete AFTER DELETE ON transactions BEGIN
+        INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}, rowid, description) VALUES ('delete', old.id, old.description);
+    END""",
+    # Only description changes touch the index; recategorizing doesn't
+    f"""CREATE TRIGGER IF NOT EXISTS transactions_fts_update AFTER UPDATE OF description ON transactions BEGIN
+        INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}, rowid, description) VALUES ('delete', old.id, old.description);
+        INSERT INTO {SEARCH_TABLE}(rowid, description) VALUES (new.id, new.description);
+    END""",
+]
+
+POSTGRES_SEARCH_DDL = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX IF NOT EXISTS ix_transactions_description_trgm ON transactions USING gin (description gin_trgm_ops)",
+]
+
+def schema_fingerprint() -> str:
+    """Hash of the declared tables, columns and indexes; any model change alters it"""
+    parts = [str(SCHEMA_REVISION)]
+    for table in Base.metadata.sorted_tables:
+        parts.append(table.name)
+        parts.extend(f"{column.name} {column.type}" for column in table.columns)
+        parts.extend(sorted(index.name for index in table.indexes))
+    return hashlib.sha256("\n".join(parts).encode("utf-8")).hexdigest()[:16]
+
 def create_tables():
     Base.metadata.create_all(bind=engine)
+    migrate_schema()
+    create_search_index()
+    with SessionLocal() as db:
+        db.merge(SchemaVersion(id=1, version=schema_fingerprint()))
+        db.commit()
+
+def ensure_schema() -> bool:
+    """
+    Run create_tables() only if the database was last migrated by a different
+    version of the models, so a routine start costs one query instead of
+    inspecting every table. Returns whether the schema was updated.
+    """
+    table = SchemaVersion.__table__
+    try:
+        # A Core query: it doesn't wait on mapper configuration like an ORM one would
+        with engine.connect() as conn:
+            stored = conn.scalar(select(table.c.version).where(table.c.id == 1))
+    except DBAPIError:
+        # No schema_version table yet: a new database or one from before versioning
+        stored = None
+    if stored == schema_fingerprint():
+        return False
+    create_tables()
+    return True
+
+def migrate_schema():
+    """
+    Bring tables created by older versions up to date.
+    create_all() only creates missing tables, so new columns and indexes are added here.
+    """
+    inspector = inspect(engine)
+    changed = False
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            
+            existing_columns = {col["name"] for col in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing_columns:
+                    column_type = column.type.compile(dialect=engine.dialect)
+                    conn.exec_driver_sql(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}')
+                    changed = True
+            
+            existing_indexes = {index["name"] for index in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name not in existing_indexes:
+                    index.create(bind=conn)
+                    changed = True
+    
+    if changed:
+        # Pooled SQLite connections keep the old schema cached; e.g. ON CONFLICT
+        # targets on a new unique index aren't seen until they reconnect
+        engine.dispose()
+
+def create_search_index():
+    """
+    Create the description search index if it is missing, indexing the rows
+    already stored. Without it (no FTS5 trigram tokenizer, or no permission
+    to add pg_trgm) search falls back to LIKE scans.
+    """
+    dialect = engine.dialect.name
+    try:
+        if dialect == "sqlite":
+            with engine.begin() as conn:
+                existed = inspect(conn).has_table(SEARCH_TABLE)
+                for statement in SQLITE_SEARCH_DDL:
+                    conn.exec_driver_sql(statement)
+                if not existed:
+                    conn.exec_driver_sql(f"INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}) VALUES ('rebuild')")
+        elif dialect == "postgresql":
+            with engine.begin() as conn:
+                for statement in POSTGRES_SEARCH_DDL:
+                    conn.exec_driver_sql(statement)
+    except DBAPIError as e:
+        print(f"Could not create the transaction search index: {str(e)}")
 
 def get_db():
     db = SessionLocal()
@@ -80,42 +429,66 @@ def get_db():
     finally:
         db.close()
 
+async def get_async_db():
+    get_async_engine()
+    async with _async_session_factory() as db:
+        yield db
+
+async def dispose_async_engine():
+    if _async_engine is not None:
+        await _async_engine.dispose()
+
+DEFAULT_CATEGORIES = [
+    {"name": "Groceries", "color": "#10B981", "budget_group": "needs"},
+    {"name": "Dining", "color": "#F59E0B", "budget_group": "wants"},
+    {"name": "Transportation", "color": "#3B82F6", "budget_group": "needs"},
+    {"name": "Bills", "color": "#EF4444", "budget_group": "needs"},
+    {"name": "Entertainment", "color": "#8B5CF6", "budget_group": "wants"},
+    {"name": "Shopping", "color": "#EC4899", "budget_group": "wants"},
+    {"name": "Healthcare", "color": "#06B6D4", "budget_group": "needs"},
+    {"name": "Other", "color": "#6B7280", "budget_group": "wants"},
+]
+
+def seed_user(db, user_id: str, name: str = None):
+    """
+    Create a user and their default categories if missing; the caller commits.
+    One lookup for the user, one for their categories and one bulk insert.
+    """
+    if db.get(User, user_id) is None:
+        db.add(User(id=user_id, name=name or f"User {user_id}"))
+        db.flush()
+    
+    existing = {
+        category.name: category
+        for category in db.scalars(select(Category).where(
+            Category.user_id == user_id,
+            Category.name.in_([cat_data["name"] for cat_data in DEFAULT_CATEGORIES])
+        ))
+    }
+    missing = [
+        {
+            "user_id": user_id,
+            "name": cat_data["name"],
+            "color": cat_data["color"],
+            "budget_group": cat_data["budget_group"],
+            "is_custom": False
+        }
+        for cat_data in DEFAULT_CATEGORIES if cat_data["name"] not in existing
+    ]
+    if missing:
+        db.execute(insert(Category), missing)
+    
+    for cat_data in DEFAULT_CATEGORIES:
+        category = existing.get(cat_data["name"])
+        if category is not None and category.budget_group is None:
+            # Categories created before budget groups existed
+            category.budget_group = cat_data["budget_group"]
+
 def init_default_data():
     """Initialize default user and categories"""
     db = SessionLocal()
     try:
-        # Create default user
-        user = db.query(User).filter(User.id == "001").first()
-        if not user:
-            user = User(id="001", name="Default User")
-            db.add(user)
-        
-        # Create default categories
-        default_categories = [
-            {"name": "Groceries", "color": "#10B981"},
-            {"name": "Dining", "color": "#F59E0B"},
-            {"name": "Transportation", "color": "#3B82F6"},
-            {"name": "Bills", "color": "#EF4444"},
-            {"name": "Entertainment", "color": "#8B5CF6"},
-            {"name": "Shopping", "color": "#EC4899"},
-            {"name": "Healthcare", "color": "#06B6D4"},
-            {"name": "Other", "color": "#6B7280"},
-        ]
-        
-        for cat_data in default_categories:
-            existing = db.query(Category).filter(
-                Category.user_id == "001",
-                Category.name == cat_data["name"]
-            ).first()
-            if not existing:
-                category = Category(
-                    user_id="001",
-                    name=cat_data["name"],
-                    color=cat_data["color"],
-                    is_custom=False
-                )
-                db.add(category)
-        
+        seed_user(db, DEFAULT_USER_ID, "Default User")
         db.commit()
     finally:
         db.close()
@@ -1,13 +1,27 @@
 from fastapi import FastAPI, File, UploadFile, Depends, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from sqlalchemy import select, delete
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+from pydantic import BaseModel
 from datetime import datetime
-from typing import List
+from typing import List, Optional
+import asyncio
+import io
 import os
 
-from .database import get_db, create_tables, init_default_data, User, Category, Transaction
+from .database import SessionLocal, get_db, get_async_db, dispose_async_engine, ensure_schema, init_default_data, User, Category, Transaction, IngestJob, CategoryRule
+from .auth import get_current_user_id
+from . import metrics
 from .services.file_processor import FileProcessor
 from .services.categorizer import TransactionCategorizer
+from .services.category_cache import CategoryCache
+from .services.local_classifier import LocalClassifier
+from .services.rule_engine import RuleEngine
+from .services.ingestion import IngestionPipeline, JobQueue, job_to_dict
+from .services.shared_state import host_lock
+from .services import analytics, export, listing, llm_client, recurring, review, rollups, search, upload_lock
 
 app = FastAPI(title="Smart Budget Companion", version="1.0.0")
 
@@ -19,147 +33,360 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# Route latency histograms, served on /metrics
+app.add_middleware(metrics.MetricsMiddleware)
 
-# Initialize services
+# Initialize services; they are cheap to build, LLM clients are created on first call
 file_processor = FileProcessor()
 categorizer = TransactionCategorizer()
+category_cache = CategoryCache()
+local_classifier = LocalClassifier()
+rule_engine = RuleEngine()
+pipeline = IngestionPipeline(file_processor, categorizer, category_cache, local_classifier, rule_engine)
+job_queue = JobQueue(pipeline)
+
+# Most corrections accepted by one /api/review-queue/resolve call
+MAX_REVIEW_BATCH = int(os.getenv("MAX_REVIEW_BATCH", "1000"))
+
+class TransactionUpdate(BaseModel):
+    category_id: int
+
+class Correction(BaseModel):
+    id: int
+    category_id: int
+
+class ReviewResolution(BaseModel):
+    corrections: List[Correction]
+    apply_to_similar: bool = False
+
+class RuleRequest(BaseModel):
+    pattern: str
+    category_id: int
+    min_amount: Optional[float] = None
+    max_amount: Optional[float] = None
+    priority: int = 0
+
+def rule_to_dict(rule: CategoryRule, category_name: Optional[str]) -> dict:
+    return {
+        "id": rule.id,
+        "pattern": rule.pattern,
+        "category_id": rule.category_id,
+        "category": category_name,
+        "min_amount": rule.min_amount,
+        "max_amount": rule.max_amount,
+        "priority": rule.priority
+    }
+
+async def validate_rule(db: AsyncSession, user_id: str, request: RuleRequest):
+    """Check a rule request against the user's categories; returns the cleaned pattern and the category"""
+    pattern = " ".join(request.pattern.split())
+    if not pattern:
+        raise HTTPException(status_code=400, detail="Pattern must not be empty")
+    category = await db.scalar(select(Category).where(
+        Category.id == request.category_id,
+        Category.user_id == user_id
+    ))
+    if not category:
+        raise HTTPException(status_code=400, detail="Unknown category")
+    if request.min_amount is not None and request.max_amount is not None and request.min_amount > request.max_amount:
+        raise HTTPException(status_code=400, detail="min_amount must not exceed max_amount")
+    return pattern, category
 
 @app.on_event("startup")
 async def startup_event():
     """Initialize database and default data on startup"""
-    create_tables()
-    init_default_data()
+    # Worker processes start together; one migrates and seeds while the others wait.
+    # Migrations only run when the models changed since the database was last migrated
+    with host_lock("startup"):
+        ensure_schema()
+        init_default_data()
+        db = SessionLocal()
+        try:
+            rollups.ensure_rollups(db)
+            recurring.ensure_recurring(db)
+        finally:
+            db.close()
+    # Look up the search index now rather than on the first search
+    search.index_ready()
+    await job_queue.start()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await job_queue.stop()
+    await llm_client.close_client()
+    await dispose_async_engine()
 
 @app.get("/")
 async def root():
     return {"message": "Smart Budget Companion API", "status": "running"}
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """Prometheus scrape endpoint: stage and LLM timings, token and cache counters, route latencies"""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
 @app.post("/api/upload")
 async def upload_file(
     file: UploadFile = File(...),
+    background: bool = False,
+    user_id: str = Depends(get_current_user_id),
     db: Session = Depends(get_db)
 ):
     """
-    Upload and process a financial statement file
+    Upload and process a financial statement file.
+    With background=true the file is queued and a job id is returned right away.
     """
+    if background:
+        return await job_queue.submit(db, user_id, file.file, file.filename)
+    
     try:
-        # Read file content
-        content = await file.read()
-        file_content = content.decode('utf-8')
-        
-        # Extract transactions using LLM
-        extracted_transactions = await file_processor.extract_transactions(
-            file_content, file.filename
-        )
-        
-        if not extracted_transactions:
-            return {
-                "success": False,
-                "message": "No transactions found in the file",
-                "transactions_processed": 0
-            }
-        
-        # Get available categories
-        categories = db.query(Category).filter(Category.user_id == "001").all()
-        category_data = [{"id": cat.id, "name": cat.name} for cat in categories]
-        
-        # Categorize transactions using LLM
-        categorized_transactions = await categorizer.categorize_batch(
-            extracted_transactions, category_data
-        )
-        
-        # Save transactions to database
-        saved_transactions = []
-        for trans_data in categorized_transactions:
-            # Get category ID
-            category_id = categorizer.get_category_id_by_name(
-                trans_data["category_name"], category_data
-            )
-            
-            # Parse date
+        # Workers coordinate on the file's hash so the same file isn't processed twice at once
+        digest = await asyncio.to_thread(upload_lock.file_digest, file.file)
+        async with upload_lock.hold(user_id, digest, file.filename):
+            # Decode the spooled upload incrementally instead of reading it into memory
+            stream = io.TextIOWrapper(file.file, encoding="utf-8-sig", newline="")
             try:
-                transaction_date = datetime.fromisoformat(trans_data["date"].replace('Z', '+00:00'))
-            except:
-                transaction_date = datetime.now()
-            
-            # Create transaction record
-            transaction = Transaction(
-                user_id="001",
-                date=transaction_date,
-                amount=trans_data["amount"],
-                description=trans_data["description"],
-                category_id=category_id,
-                confidence_score=trans_data["confidence_score"],
-                file_source=file.filename,
-                needs_review=trans_data["needs_review"]
-            )
-            
-            db.add(transaction)
-            saved_transactions.append({
-                "description": trans_data["description"],
-                "amount": trans_data["amount"],
-                "category": trans_data["category_name"],
-                "confidence": trans_data["confidence_score"],
-                "needs_review": trans_data["needs_review"]
-            })
-        
-        db.commit()
-        
-        # Count transactions needing review
-        review_count = sum(1 for t in saved_transactions if t["needs_review"])
-        
-        return {
-            "success": True,
-            "message": f"Successfully processed {len(saved_transactions)} transactions",
-            "transactions_processed": len(saved_transactions),
-            "needs_review": review_count,
-            "transactions": saved_transactions[:10]  # Return first 10 for preview
-        }
-        
+                return await pipeline.run(db, user_id, stream, file.filename)
+            finally:
+                stream.detach()
+    
+    except upload_lock.UploadInProgress:
+        raise HTTPException(status_code=409, detail="This file is already being processed")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error processing file: {str(e)}")
 
+@app.get("/api/jobs/{job_id}")
+async def get_job(
+    job_id: str,
+    user_id: str = Depends(get_current_user_id),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Get the status and progress of a background upload
+    """
+    job = await db.scalar(select(IngestJob).where(
+        IngestJob.id == job_id,
+        IngestJob.user_id == user_id
+    ))
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    
+    return job_to_dict(job)
+
 @app.get("/api/transactions")
 async def get_transactions(
     limit: int = 100,
+    cursor: str = None,
     needs_review: bool = None,
-    db: Session = Depends(get_db)
+    start_date: datetime = None,
+    end_date: datetime = None,
+    category_id: int = None,
+    min_amount: float = None,
+    max_amount: float = None,
+    q: str = None,
+    user_id: str = Depends(get_current_user_id),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Get transactions with optional filtering, newest first.
+    Pass the returned next_cursor to fetch the following page.
+    """
+    query = listing.apply_filters(
+        listing.transaction_rows(), user_id,
+        needs_review=needs_review,
+        start_date=start_date,
+        end_date=end_date,
+        category_id=category_id,
+        min_amount=min_amount,
+        max_amount=max_amount,
+        q=q
+    )
+    try:
+        query, limit = listing.keyset_page(query, cursor, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    transactions = (await db.execute(query)).all()
+    result = [listing.row_to_dict(trans) for trans in transactions[:limit]]
+    
+    return {
+        "transactions": result,
+        "total": len(result),
+        "next_cursor": listing.next_cursor(transactions, limit)
+    }
+
+@app.get("/api/transactions/export")
+async def export_transactions(
+    format: str = "ndjson",
+    gzip: bool = False,
+    needs_review: bool = None,
+    start_date: datetime = None,
+    end_date: datetime = None,
+    category_id: int = None,
+    min_amount: float = None,
+    max_amount: float = None,
+    q: str = None,
+    user_id: str = Depends(get_current_user_id)
 ):
     """
-    Get transactions with optional filtering
+    Stream every matching transaction, newest first, as NDJSON or CSV
+    (optionally gzipped). Takes the same filters as /api/transactions.
     """
-    query = db.query(Transaction).filter(Transaction.user_id == "001")
+    if format not in export.FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of: {', '.join(export.FORMATS)}")
     
-    if needs_review is not None:
-        query = query.filter(Transaction.needs_review == needs_review)
+    query = listing.newest_first(listing.apply_filters(
+        listing.transaction_rows(), user_id,
+        needs_review=needs_review,
+        start_date=start_date,
+        end_date=end_date,
+        category_id=category_id,
+        min_amount=min_amount,
+        max_amount=max_amount,
+        q=q
+    ))
+    media_type, extension = export.FORMATS[format]
+    filename = f"transactions-{datetime.utcnow():%Y%m%d}.{extension}"
+    if gzip:
+        media_type, filename = "application/gzip", filename + ".gz"
     
-    transactions = query.order_by(Transaction.date.desc()).limit(limit).all()
+    return StreamingResponse(
+        export.stream_export(query, format, compress=gzip),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+@app.get("/api/transactions/search")
+async def search_transactions(
+    q: str,
+    limit: int = 50,
+    offset: int = 0,
+    needs_review: bool = None,
+    start_date: datetime = None,
+    end_date: datetime = None,
+    category_id: int = None,
+    min_amount: float = None,
+    max_amount: float = None,
+    user_id: str = Depends(get_current_user_id),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Search transaction descriptions: every term (or "quoted phrase") in q must
+    appear. Results are ranked by relevance, then newest first, and take the
+    same filters as /api/transactions.
+    """
+    if not search.search_terms(q):
+        raise HTTPException(status_code=400, detail="q must contain a search term")
     
-    result = []
-    for trans in transactions:
-        result.append({
-            "id": trans.id,
-            "date": trans.date.isoformat(),
-            "amount": trans.amount,
-            "description": trans.description,
-            "category": trans.category.name if trans.category else "Uncategorized",
-            "category_id": trans.category_id,
-            "confidence_score": trans.confidence_score,
-            "needs_review": trans.needs_review,
-            "file_source": trans.file_source
-        })
+    query, limit = search.search_query(
+        user_id, q,
+        limit=limit,
+        offset=offset,
+        needs_review=needs_review,
+        start_date=start_date,
+        end_date=end_date,
+        category_id=category_id,
+        min_amount=min_amount,
+        max_amount=max_amount
+    )
+    rows = (await db.execute(query)).all()
+    results = [{**listing.row_to_dict(row), "score": round(row.score, 4)} for row in rows]
     
     return {
-        "transactions": result,
-        "total": len(result)
+        "results": results,
+        "total": len(results),
+        "limit": limit,
+        "offset": offset
+    }
+
+@app.put("/api/transactions/{transaction_id}")
+async def update_transaction(
+    transaction_id: int,
+    update: TransactionUpdate,
+    user_id: str = Depends(get_current_user_id),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Correct a transaction's category (e.g. from the review queue)
+    """
+    transaction = await db.scalar(select(Transaction).where(
+        Transaction.id == transaction_id,
+        Transaction.user_id == user_id
+    ))
+    if not transaction:
+        raise HTTPException(status_code=404, detail="Transaction not found")
+    
+    categories = (await db.scalars(select(Category).where(Category.user_id == user_id))).all()
+    category = next((cat for cat in categories if cat.id == update.category_id), None)
+    if not category:
+        raise HTTPException(status_code=400, detail="Unknown category")
+    
+    previous_category_id = transaction.category_id
+    transaction.category_id = category.id
+    transaction.confidence_score = 1.0
+    transaction.needs_review = False
+    transaction.category_source = "user"
+    
+    # The correction replaces whatever the cache had for this merchant
+    category_data = [{"id": cat.id, "name": cat.name} for cat in categories]
+    await db.run_sync(
+        category_cache.record_correction, user_id, transaction.description, category.name, category_data
+    )
+    if previous_category_id != category.id:
+        await db.flush()
+        await db.run_sync(rollups.refresh_cells, user_id, [
+            (transaction.date, previous_category_id),
+            (transaction.date, category.id)
+        ])
+        await db.run_sync(recurring.set_category, user_id, [(transaction.description, category.id)])
+    await db.commit()
+    await asyncio.to_thread(local_classifier.learn, user_id, [(transaction.description, category.name)])
+    
+    return {
+        "id": transaction.id,
+        "category": category.name,
+        "category_id": category.id,
+        "confidence_score": transaction.confidence_score,
+        "needs_review": transaction.needs_review
     }
 
+@app.delete("/api/transactions/{transaction_id}")
+async def delete_transaction(
+    transaction_id: int,
+    user_id: str = Depends(get_current_user_id),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Delete a transaction
+    """
+    transaction = await db.scalar(select(Transaction).where(
+        Transaction.id == transaction_id,
+        Transaction.user_id == user_id
+    ))
+    if not transaction:
+        raise HTTPException(status_code=404, detail="Transaction not found")
+    
+    await db.delete(transaction)
+    await db.flush()
+    await db.run_sync(rollups.refresh_cells, user_id, [(transaction.date, transaction.category_id)])
+    await db.run_sync(recurring.remove_rows, user_id, [{
+        "date": transaction.date,
+        "amount": transaction.amount,
+        "description": transaction.description
+    }])
+    await db.commit()
+    
+    return {"deleted": transaction_id}
+
 @app.get("/api/categories")
-async def get_categories(db: Session = Depends(get_db)):
+async def get_categories(
+    user_id: str = Depends(get_current_user_id),
+    db: AsyncSession = Depends(get_async_db)
+):
     """
     Get all categories for the user
     """
-    categories = db.query(Category).filter(Category.user_id == "001").all()
+    categories = (await db.scalars(select(Category).where(Category.user_id == user_id))).all()
     
     result = []
     for cat in categories:
@@ -168,37 +395,217 @@ async def get_categories(db: Session = Depends(get_db)):
             "name": cat.name,
             "color": cat.color,
             "budget_limit": cat.budget_limit,
+            "budget_group": cat.budget_group,
             "is_custom": cat.is_custom
         })
     
     return {"categories": result}
 
+@app.get("/api/rules")
+async def get_rules(
+    user_id: str = Depends(get_current_user_id),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    List the user's categorization rules
+    """
+    rows = (await db.execute(
+        select(CategoryRule, Category.name)
+        .outerjoin(Category, CategoryRule.category_id == Category.id)
+        .where(CategoryRule.user_id == user_id)
+        .order_by(CategoryRule.priority.desc(), CategoryRule.id)
+    )).all()
+    return {"rules": [rule_to_dict(rule, category_name) for rule, category_name in rows]}
+
+@app.post("/api/rules")
+async def create_rule(
+    request: RuleRequest,
+    user_id: str = Depends(get_current_user_id),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Add a rule: descriptions containing `pattern` (case-insensitive), optionally
+    within an amount range, are put in the category without asking the LLM
+    """
+    pattern, category = await validate_rule(db, user_id, request)
+    rule = CategoryRule(
+        user_id=user_id,
+        pattern=pattern,
+        category_id=request.category_id,
+        min_amount=request.min_amount,
+        max_amount=request.max_amount,
+        priority=request.priority
+    )
+    db.add(rule)
+    await db.commit()
+    return rule_to_dict(rule, category.name)
+
+@app.put("/api/rules/{rule_id}")
+async def update_rule(
+    rule_id: int,
+    request: RuleRequest,
+    user_id: str = Depends(get_current_user_id),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Replace a rule
+    """
+    rule = await db.scalar(select(CategoryRule).where(
+        CategoryRule.id == rule_id,
+        CategoryRule.user_id == user_id
+    ))
+    if not rule:
+        raise HTTPException(status_code=404, detail="Rule not found")
+    
+    rule.pattern, category = await validate_rule(db, user_id, request)
+    rule.category_id = request.category_id
+    rule.min_amount = request.min_amount
+    rule.max_amount = request.max_amount
+    rule.priority = request.priority
+    await db.commit()
+    return rule_to_dict(rule, category.name)
+
+@app.delete("/api/rules/{rule_id}")
+async def delete_rule(
+    rule_id: int,
+    user_id: str = Depends(get_current_user_id),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Delete a rule
+    """
+    result = await db.execute(delete(CategoryRule).where(
+        CategoryRule.id == rule_id,
+        CategoryRule.user_id == user_id
+    ))
+    if not result.rowcount:
+        raise HTTPException(status_code=404, detail="Rule not found")
+    await db.commit()
+    return {"deleted": rule_id}
+
+@app.get("/api/dashboard")
+async def get_dashboard(
+    user_id: str = Depends(get_current_user_id),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Dashboard totals, this month's budget and the spending trend in one response
+    """
+    return await db.run_sync(analytics.dashboard_summary, user_id)
+
+@app.get("/api/analytics/spending")
+async def get_spending(
+    group_by: str = "category",
+    start_date: datetime = None,
+    end_date: datetime = None,
+    user_id: str = Depends(get_current_user_id),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Spending aggregated per category, month or ISO week ("2025-W01")
+    """
+    if group_by == "category":
+        rows = await db.run_sync(analytics.spending_by_category, user_id, start_date, end_date)
+        return {"group_by": group_by, "rows": rows}
+    if group_by in ("month", "week"):
+        rows = await db.run_sync(analytics.spending_by_period, user_id, group_by, start_date, end_date)
+        return {"group_by": group_by, "rows": rows}
+    raise HTTPException(status_code=400, detail="group_by must be category, month or week")
+
+@app.get("/api/analytics/budget")
+async def get_budget(
+    month: str = None,
+    user_id: str = Depends(get_current_user_id),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Budget vs. actual for one month (YYYY-MM, defaults to the current month)
+    """
+    month = month or datetime.now().strftime("%Y-%m")
+    try:
+        return await db.run_sync(analytics.budget_vs_actual, user_id, month)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="month must be in YYYY-MM format")
+
+@app.get("/api/recurring")
+async def get_recurring(
+    days: int = 30,
+    include_inactive: bool = False,
+    user_id: str = Depends(get_current_user_id),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Recurring charges and subscriptions, with the charges expected in the next `days` days
+    """
+    if days < 0 or days > 366:
+        raise HTTPException(status_code=400, detail="days must be between 0 and 366")
+    return await db.run_sync(recurring.list_recurring, user_id, days, include_inactive)
+
 @app.get("/api/review-queue")
-async def get_review_queue(db: Session = Depends(get_db)):
+async def get_review_queue(
+    limit: int = 100,
+    cursor: str = None,
+    user_id: str = Depends(get_current_user_id),
+    db: AsyncSession = Depends(get_async_db)
+):
     """
-    Get transactions that need manual review
+    Get transactions that need manual review, one page at a time
     """
-    transactions = db.query(Transaction).filter(
-        Transaction.user_id == "001",
-        Transaction.needs_review == True
-    ).order_by(Transaction.date.desc()).all()
+    query = listing.apply_filters(listing.transaction_rows(), user_id, needs_review=True)
+    try:
+        query, limit = listing.keyset_page(query, cursor, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    transactions = (await db.execute(query)).all()
     
     result = []
-    for trans in transactions:
+    for trans in transactions[:limit]:
         result.append({
             "id": trans.id,
             "date": trans.date.isoformat(),
             "amount": trans.amount,
             "description": trans.description,
-            "category": trans.category.name if trans.category else "Uncategorized",
+            "category": trans.category_name or "Uncategorized",
             "confidence_score": trans.confidence_score
         })
     
     return {
         "transactions": result,
-        "count": len(result)
+        "count": len(result),
+        "next_cursor": listing.next_cursor(transactions, limit)
     }
 
+@app.post("/api/review-queue/resolve")
+async def resolve_review_queue(
+    request: ReviewResolution,
+    user_id: str = Depends(get_current_user_id),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Correct many transactions at once. With apply_to_similar every other row
+    awaiting review with the same merchant gets the same category. Corrections
+    feed the merchant cache and the local classifier, so the merchants don't
+    come back for review on later uploads.
+    """
+    if len(request.corrections) > MAX_REVIEW_BATCH:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_REVIEW_BATCH} corrections per request")
+    
+    try:
+        result = await db.run_sync(
+            review.resolve, user_id,
+            [(correction.id, correction.category_id) for correction in request.corrections],
+            request.apply_to_similar, category_cache
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    await db.commit()
+    
+    await asyncio.to_thread(local_classifier.learn, user_id, result.pop("examples"))
+    metrics.REVIEW_CORRECTIONS.inc(result["corrected"], kind="direct")
+    metrics.REVIEW_CORRECTIONS.inc(result["applied_to_similar"], kind="similar")
+    return result
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,195 @@
+import bisect
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Sequence, Tuple
+
+# Spans slower than this (seconds) are also printed as a JSON line; 0 disables
+SLOW_SPAN_SECONDS = float(os.getenv("METRICS_SLOW_SPAN_SECONDS", "0"))
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+_registry: List["_Metric"] = []
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class _Metric:
+    kind = ""
+    
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        _registry.append(self)
+    
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+    
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+class Counter(_Metric):
+    """A monotonically increasing count, one series per label combination"""
+    kind = "counter"
+    
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+    
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+    
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+    
+    def render(self) -> List[str]:
+        lines = super().render()
+        with self._lock:
+            values = sorted(self._values.items())
+        for key, value in values:
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+class Histogram(_Metric):
+    """Observations counted into cumulative buckets, plus their sum and count"""
+    kind = "histogram"
+    
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Per series: [count per bucket (+Inf last), sum]
+        self._series: Dict[Tuple[str, ...], list] = {}
+    
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+    
+    def render(self) -> List[str]:
+        lines = super().render()
+        with self._lock:
+            series = sorted((key, list(counts), total) for key, (counts, total) in self._series.items())
+        for key, counts, total in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, f'le="{_format_value(bound)}"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+def render() -> str:
+    """All metrics in the Prometheus text exposition format"""
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+# Pipeline stages: extract, dedupe, categorize, persist
+STAGE_SECONDS = Histogram("smart_bud_stage_seconds", "Time spent in each upload pipeline stage", ["stage"])
+LLM_CALL_SECONDS = Histogram("smart_bud_llm_call_seconds", "Latency of LLM calls, including retries", ["operation"])
+LLM_CALLS = Counter("smart_bud_llm_calls_total", "LLM calls by operation and outcome", ["operation", "outcome"])
+LLM_TOKENS = Counter("smart_bud_llm_tokens_total", "LLM tokens used, as reported by the API", ["operation", "kind"])
+LLM_RETRIES = Counter("smart_bud_llm_retries_total", "LLM calls retried after a rate limit or server error", ["operation"])
+CATEGORIZATION_FALLBACKS = Counter("smart_bud_categorization_fallbacks_total", "Transactions given the fallback category after the LLM failed")
+CATEGORIZED_ROWS = Counter("smart_bud_categorized_rows_total", "Uploaded rows by what categorized them", ["source"])
+MERCHANT_CACHE = Counter("smart_bud_merchant_cache_total", "Merchant cache lookups", ["result"])
+REVIEW_CORRECTIONS = Counter("smart_bud_review_corrections_total", "Rows corrected through the review queue, directly or as a similar merchant", ["kind"])
+EXTRACTION_CACHE = Counter("smart_bud_extraction_cache_total", "Extraction cache lookups for statements sent to the LLM", ["result"])
+REJECTED_ROWS = Counter("smart_bud_rejected_rows_total", "Uploaded rows left out because their date, amount or description could not be read")
+HTTP_SECONDS = Histogram("smart_bud_http_request_duration_seconds", "HTTP request latency by route", ["method", "route", "status"])
+
+class Span:
+    def __init__(self, name: str, labels: Dict[str, str]):
+        self.name = name
+        self.labels = labels
+        self.seconds = 0.0
+
+@contextmanager
+def span(histogram: Histogram, name: str, **labels):
+    """
+    Time a block into `histogram`. Works around awaits too, since it only
+    reads the clock on entry and exit. The span's seconds are set on exit.
+    """
+    current = Span(name, labels)
+    started = time.perf_counter()
+    try:
+        yield current
+    finally:
+        current.seconds = time.perf_counter() - started
+        histogram.observe(current.seconds, **labels)
+        if SLOW_SPAN_SECONDS and current.seconds >= SLOW_SPAN_SECONDS:
+            print(json.dumps({"span": name, "seconds": round(current.seconds, 4), **labels}))
+
+def record_usage(operation: str, usage):
+    """Count the tokens of one completion response's `usage`, when the API reports it"""
+    if usage is None:
+        return
+    LLM_TOKENS.inc(usage.prompt_tokens or 0, operation=operation, kind="prompt")
+    LLM_TOKENS.inc(usage.completion_tokens or 0, operation=operation, kind="completion")
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording every request's latency under its route template
+    (e.g. /api/transactions/{transaction_id}), so the label set stays small.
+    Plain ASGI rather than BaseHTTPMiddleware, which would buffer streamed responses.
+    """
+    
+    def __init__(self, app):
+        self.app = app
+        self._route_paths: Optional[Dict[object, str]] = None
+    
+    def _route_path(self, scope) -> str:
+        if self._route_paths is None:
+            self._route_paths = {
+                getattr(route, "endpoint", None) or getattr(route, "app", None): route.path
+                for route in scope["app"].routes
+            }
+        return self._route_paths.get(scope.get("endpoint"), "unmatched")
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
+        status = [500]
+        
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+        
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            HTTP_SECONDS.observe(
+                time.perf_counter() - started,
+                method=scope["method"],
+                route=self._route_path(scope),
+                status=str(status[0])
+            )
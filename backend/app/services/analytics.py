@@ -0,0 +1,229 @@
+from datetime import date, datetime, time
+from typing import Dict, List, Any, Optional
+from sqlalchemy import func, case
+from sqlalchemy.orm import Session
+
+from ..database import Category, Transaction, BudgetPlan, MonthlyRollup
+
+# strftime / to_char patterns for each grouping period, per dialect. Weeks are
+# grouped by day and labelled in Python, since the dialects number weeks differently.
+PERIOD_FORMATS = {
+    "sqlite": {"month": "%Y-%m", "day": "%Y-%m-%d"},
+    "postgresql": {"month": "YYYY-MM", "day": "YYYY-MM-DD"},
+}
+
+BUDGET_GROUPS = ("needs", "wants", "savings")
+
+def period_expression(db: Session, period: str):
+    """SQL expression turning Transaction.date into a month ("2025-07") or day ("2025-07-04") label"""
+    dialect = db.get_bind().dialect.name
+    formats = PERIOD_FORMATS.get(dialect, PERIOD_FORMATS["sqlite"])
+    if dialect == "postgresql":
+        return func.to_char(Transaction.date, formats[period])
+    return func.strftime(formats[period], Transaction.date)
+
+def iso_week(day: str) -> str:
+    """ISO 8601 week ("2025-W01") of a "YYYY-MM-DD" day; weeks start on Monday and belong to the year of their Thursday"""
+    year, week, _ = date.fromisoformat(day).isocalendar()
+    return f"{year}-W{week:02d}"
+
+def month_bounds(month: str):
+    """Start and (exclusive) end of a "YYYY-MM" month"""
+    start = datetime.strptime(month, "%Y-%m")
+    if start.month == 12:
+        return start, start.replace(year=start.year + 1, month=1)
+    return start, start.replace(month=start.month + 1)
+
+def _month_aligned(value: Optional[datetime]) -> bool:
+    return value is None or (value.day == 1 and value.time() == time())
+
+def _rollup_filtered(query, user_id: str, start_date: Optional[datetime], end_date: Optional[datetime]):
+    """Restrict a MonthlyRollup query to the months in [start_date, end_date)"""
+    query = query.filter(MonthlyRollup.user_id == user_id)
+    if start_date is not None:
+        query = query.filter(MonthlyRollup.month >= start_date.strftime("%Y-%m"))
+    if end_date is not None:
+        query = query.filter(MonthlyRollup.month < end_date.strftime("%Y-%m"))
+    return query
+
+def _filtered(query, user_id: str, start_date: Optional[datetime], end_date: Optional[datetime]):
+    query = query.filter(Transaction.user_id == user_id)
+    if start_date is not None:
+        query = query.filter(Transaction.date >= start_date)
+    if end_date is not None:
+        query = query.filter(Transaction.date < end_date)
+    return query
+
+def spending_by_category(db: Session, user_id: str, start_date: Optional[datetime] = None, end_date: Optional[datetime] = None) -> List[Dict[str, Any]]:
+    """Total expenses per category (amounts are negative for expenses)"""
+    if _month_aligned(start_date) and _month_aligned(end_date):
+        rows = _rollup_filtered(
+            db.query(
+                MonthlyRollup.category_id,
+                func.sum(MonthlyRollup.spent),
+                func.sum(MonthlyRollup.spent_count)
+            ),
+            user_id, start_date, end_date
+        ).group_by(MonthlyRollup.category_id).having(func.sum(MonthlyRollup.spent_count) > 0).all()
+        
+        return [
+            {"category_id": category_id or None, "spent": round(spent, 2), "count": count}
+            for category_id, spent, count in rows
+        ]
+    
+    # Arbitrary date ranges need the raw rows
+    query = db.query(
+        Transaction.category_id,
+        func.sum(Transaction.amount),
+        func.count(Transaction.id)
+    ).filter(Transaction.amount < 0)
+    rows = _filtered(query, user_id, start_date, end_date).group_by(Transaction.category_id).all()
+    
+    return [
+        {"category_id": category_id, "spent": round(-total, 2), "count": count}
+        for category_id, total, count in rows
+    ]
+
+def spending_by_period(db: Session, user_id: str, period: str, start_date: Optional[datetime] = None, end_date: Optional[datetime] = None) -> List[Dict[str, Any]]:
+    """Expenses and income per month or week, oldest first"""
+    if period == "month" and _month_aligned(start_date) and _month_aligned(end_date):
+        rows = _rollup_filtered(
+            db.query(
+                MonthlyRollup.month,
+                func.sum(MonthlyRollup.spent),
+                func.sum(MonthlyRollup.income),
+                func.sum(MonthlyRollup.count)
+            ),
+            user_id, start_date, end_date
+        ).group_by(MonthlyRollup.month).order_by(MonthlyRollup.month).all()
+        
+        return [
+            {"period": month, "spent": round(spent, 2), "income": round(income, 2), "count": count}
+            for month, spent, income, count in rows
+        ]
+    
+    label = period_expression(db, "month" if period == "month" else "day")
+    query = db.query(
+        label,
+        func.sum(case((Transaction.amount < 0, -Transaction.amount), else_=0.0)),
+        func.sum(case((Transaction.amount > 0, Transaction.amount), else_=0.0)),
+        func.count(Transaction.id)
+    )
+    rows = _filtered(query, user_id, start_date, end_date).group_by(label).order_by(label).all()
+    
+    if period == "week":
+        # Days come in order, so each ISO week's days are consecutive
+        weeks: Dict[str, List[float]] = {}
+        for day, spent, income, count in rows:
+            totals = weeks.setdefault(iso_week(day), [0.0, 0.0, 0])
+            totals[0] += spent
+            totals[1] += income
+            totals[2] += count
+        rows = [(week, spent, income, count) for week, (spent, income, count) in weeks.items()]
+    
+    return [
+        {"period": period_label, "spent": round(spent, 2), "income": round(income, 2), "count": count}
+        for period_label, spent, income, count in rows
+    ]
+
+def budget_vs_actual(db: Session, user_id: str, month: str) -> Dict[str, Any]:
+    """
+    Compare a month's spending with each category's budget_limit and with the
+    latest BudgetPlan's needs/wants/savings split
+    """
+    start_date, end_date = month_bounds(month)
+    categories = db.query(Category).filter(Category.user_id == user_id).all()
+    spent = {row["category_id"]: row["spent"] for row in spending_by_category(db, user_id, start_date, end_date)}
+    
+    income = _rollup_filtered(
+        db.query(func.coalesce(func.sum(MonthlyRollup.income), 0.0)),
+        user_id, start_date, end_date
+    ).scalar()
+    
+    category_rows = []
+    group_spent = {group: 0.0 for group in BUDGET_GROUPS}
+    for cat in categories:
+        cat_spent = spent.get(cat.id, 0.0)
+        group = cat.budget_group if cat.budget_group in BUDGET_GROUPS else "wants"
+        group_spent[group] += cat_spent
+        category_rows.append({
+            "category_id": cat.id,
+            "name": cat.name,
+            "color": cat.color,
+            "budget_group": group,
+            "budget_limit": cat.budget_limit,
+            "spent": cat_spent,
+            "remaining": round(cat.budget_limit - cat_spent, 2) if cat.budget_limit else None
+        })
+    # Uncategorized spending counts as a want
+    group_spent["wants"] += spent.get(None, 0.0)
+    
+    plan = db.query(BudgetPlan).filter(
+        BudgetPlan.user_id == user_id
+    ).order_by(BudgetPlan.created_at.desc()).first()
+    
+    split = None
+    if plan is not None:
+        plan_income = plan.income or income
+        percentages = {"needs": plan.needs_pct, "wants": plan.wants_pct, "savings": plan.savings_pct}
+        split = {
+            group: {
+                "target": round(plan_income * percentages[group] / 100.0, 2),
+                "actual": round(group_spent[group], 2)
+            }
+            for group in BUDGET_GROUPS
+        }
+        # Savings is whatever income was left over, plus anything categorized as savings
+        split["savings"]["actual"] = round(
+            income - group_spent["needs"] - group_spent["wants"], 2
+        )
+    
+    return {
+        "month": month,
+        "income": round(income, 2),
+        "categories": category_rows,
+        "groups": {group: round(total, 2) for group, total in group_spent.items()},
+        "plan": split
+    }
+
+def dashboard_summary(db: Session, user_id: str, today: Optional[datetime] = None) -> Dict[str, Any]:
+    """Everything the dashboard shows, computed in the database"""
+    today = today or datetime.now()
+    month = today.strftime("%Y-%m")
+    start_date, end_date = month_bounds(month)
+    
+    total = db.query(func.coalesce(func.sum(MonthlyRollup.count), 0)).filter(
+        MonthlyRollup.user_id == user_id
+    ).scalar()
+    # Served by the (user_id, needs_review, date, id) index
+    review_count = db.query(func.count(Transaction.id)).filter(
+        Transaction.user_id == user_id,
+        Transaction.needs_review == True
+    ).scalar()
+    
+    budget = budget_vs_actual(db, user_id, month)
+    categories = db.query(Category).filter(Category.user_id == user_id).all()
+    
+    # Trend over the last twelve months, including this one
+    year, month_index = divmod(today.year * 12 + today.month - 12, 12)
+    trend_start = datetime(year, month_index + 1, 1)
+    
+    return {
+        "total_transactions": total,
+        "needs_review": review_count,
+        "month": month,
+        "month_spending": round(sum(budget["groups"].values()), 2),
+        "categories": [
+            {
+                "id": cat.id,
+                "name": cat.name,
+                "color": cat.color,
+                "budget_limit": cat.budget_limit,
+                "budget_group": cat.budget_group,
+                "is_custom": cat.is_custom
+            }
+            for cat in categories
+        ],
+        "budget": budget,
+        "monthly_trend": spending_by_period(db, user_id, "month", trend_start, end_date)
+    }
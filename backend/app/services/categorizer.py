@@ -1,17 +1,74 @@
-import openai
+import asyncio
 import json
 import os
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Optional
 from sqlalchemy.orm import Session
-from dotenv import load_dotenv
 
-load_dotenv()
+from .rate_limiter import RateLimiter
+from . import llm_client
+from .. import metrics
 
 class TransactionCategorizer:
     def __init__(self):
-        self.client = openai.OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+        self.model = os.getenv("CATEGORIZER_MODEL", "gpt-4")
+        self.concurrency = int(os.getenv("CATEGORIZER_CONCURRENCY", "8"))
+        # Transactions per LLM call; 1 disables packing
+        self.pack_size = max(1, int(os.getenv("CATEGORIZER_PACK_SIZE", "10")))
+        self.max_retries = int(os.getenv("CATEGORIZER_MAX_RETRIES", "4"))
+        self.backoff_base = float(os.getenv("CATEGORIZER_BACKOFF_BASE", "0.5"))
+        self.backoff_max = float(os.getenv("CATEGORIZER_BACKOFF_MAX", "20"))
+        # The limits are account-wide; each worker process gets an even share
+        workers = max(1, int(os.getenv("WEB_CONCURRENCY", "1")))
+        self.rate_limiter = RateLimiter(
+            requests_per_minute=int(os.getenv("CATEGORIZER_RPM", "500")) // workers,
+            tokens_per_minute=int(os.getenv("CATEGORIZER_TPM", "30000")) // workers
+        )
     
-    async def categorize_transaction(self, description: str, amount: float, categories: List[Dict[str, str]]) -> Dict[str, Any]:
+    @property
+    def client(self):
+        """
+        The shared client, created on first call. It doesn't retry on its own,
+        so the retries below can go through the rate limiter.
+        """
+        return llm_client.get_client()
+    
+    async def _complete(self, messages: List[Dict[str, str]], max_tokens: int, user_id: Optional[str] = None, operation: str = "categorize"):
+        """
+        Run one chat completion under the rate limiter, retrying 429/5xx with backoff.
+        Calls are queued per user so users share the account's budget fairly.
+        """
+        # Rough estimate (~4 characters per token) so the limiter can budget ahead
+        estimated_tokens = sum(len(m["content"]) for m in messages) // 4 + max_tokens
+        retryable_errors = llm_client.retryable_errors()
+        
+        with metrics.span(metrics.LLM_CALL_SECONDS, "llm", operation=operation):
+            for attempt in range(self.max_retries + 1):
+                await self.rate_limiter.acquire(estimated_tokens, key=user_id)
+                try:
+                    response = await self.client.chat.completions.create(
+                        model=self.model,
+                        messages=messages,
+                        temperature=0.1,
+                        max_tokens=max_tokens
+                    )
+                except retryable_errors as e:
+                    if attempt == self.max_retries:
+                        metrics.LLM_CALLS.inc(operation=operation, outcome="error")
+                        raise
+                    metrics.LLM_RETRIES.inc(operation=operation)
+                    await asyncio.sleep(llm_client.retry_delay(e, attempt, self.backoff_base, self.backoff_max))
+                    continue
+                except Exception:
+                    metrics.LLM_CALLS.inc(operation=operation, outcome="error")
+                    raise
+                
+                metrics.LLM_CALLS.inc(operation=operation, outcome="ok")
+                metrics.record_usage(operation, response.usage)
+                if response.usage is not None:
+                    self.rate_limiter.record_usage(estimated_tokens, response.usage.total_tokens)
+                return response
+    
+    async def categorize_transaction(self, description: str, amount: float, categories: List[Dict[str, str]], user_id: Optional[str] = None) -> Dict[str, Any]:
         """
         Categorize a single transaction using LLM
         """
@@ -41,62 +98,148 @@ class TransactionCategorizer:
         """
         
         try:
-            response = self.client.chat.completions.create(
-                model="gpt-4",
-                messages=[
+            response = await self._complete(
+                [
                     {"role": "system", "content": "You are a financial categorization expert. Return only valid JSON."},
                     {"role": "user", "content": prompt}
                 ],
-                temperature=0.1,
-                max_tokens=200
+                max_tokens=200,
+                user_id=user_id
             )
             
             result = response.choices[0].message.content.strip()
             
             try:
-                categorization = json.loads(result)
-                
-                # Validate the response
-                if not all(key in categorization for key in ["category", "confidence", "reasoning"]):
-                    return self._fallback_categorization()
-                
-                # Ensure category exists in our list
-                if categorization["category"] not in category_list:
-                    categorization["category"] = "Other"
-                    categorization["confidence"] = 0.5
-                    categorization["reasoning"] = "Category not found in available options"
-                
-                # Ensure confidence is a valid float
-                try:
-                    categorization["confidence"] = float(categorization["confidence"])
-                    if not 0.0 <= categorization["confidence"] <= 1.0:
-                        categorization["confidence"] = 0.5
-                except (ValueError, TypeError):
-                    categorization["confidence"] = 0.5
-                
-                return categorization
-                
+                categorization = self._validate_categorization(json.loads(result), category_list)
+                return categorization or self._fallback_categorization()
+            
             except json.JSONDecodeError:
                 print(f"Failed to parse categorization response: {result}")
                 return self._fallback_categorization()
-                
+        
         except Exception as e:
             print(f"Error categorizing transaction: {str(e)}")
             return self._fallback_categorization()
     
-    async def categorize_batch(self, transactions: List[Dict[str, Any]], categories: List[Dict[str, str]]) -> List[Dict[str, Any]]:
+    async def categorize_packed(self, transactions: List[Dict[str, Any]], categories: List[Dict[str, str]], user_id: Optional[str] = None) -> Dict[int, Dict[str, Any]]:
         """
-        Categorize multiple transactions in batch
+        Categorize several transactions in a single LLM call.
+        Returns validated categorizations keyed by position in `transactions`;
+        rows the model skipped or got wrong are simply missing from the result.
         """
-        categorized_transactions = []
+        category_list = [cat["name"] for cat in categories]
+        rows = "\n".join(
+            f'        [{index}] "{transaction["description"]}" ${abs(transaction["amount"]):.2f}'
+            for index, transaction in enumerate(transactions)
+        )
+        
+        prompt = f"""
+        Categorize each of these financial transactions:
+
+{rows}
+        
+        Available categories: {', '.join(category_list)}
         
-        for transaction in transactions:
-            categorization = await self.categorize_transaction(
-                transaction["description"],
-                transaction["amount"],
-                categories
+        Return a JSON array with one object per transaction in this exact format:
+        [
+            {{
+                "index": 0,
+                "category": "category_name",
+                "confidence": 0.95,
+                "reasoning": "brief explanation why this category fits"
+            }}
+        ]
+        
+        Rules:
+        - "index" is the number in square brackets before each transaction
+        - Choose the most appropriate category from the available list
+        - Confidence should be 0.0 to 1.0 (1.0 = completely certain)
+        - If confidence is below 0.7, the transaction will need manual review
+        - Use "Other" if no category fits well
+        - Only return valid JSON, no explanations
+        """
+        
+        try:
+            response = await self._complete(
+                [
+                    {"role": "system", "content": "You are a financial categorization expert. Return only valid JSON."},
+                    {"role": "user", "content": prompt}
+                ],
+                max_tokens=80 * len(transactions) + 50,
+                user_id=user_id,
+                operation="categorize_packed"
             )
             
+            result = response.choices[0].message.content.strip()
+            
+            try:
+                answers = json.loads(result)
+            except json.JSONDecodeError:
+                print(f"Failed to parse packed categorization response: {result}")
+                return {}
+            
+            if not isinstance(answers, list):
+                return {}
+            
+            categorized = {}
+            for answer in answers:
+                if not isinstance(answer, dict):
+                    continue
+                try:
+                    index = int(answer.get("index"))
+                except (ValueError, TypeError):
+                    continue
+                if not 0 <= index < len(transactions) or index in categorized:
+                    continue
+                categorization = self._validate_categorization(answer, category_list)
+                if categorization:
+                    categorization.pop("index", None)
+                    categorized[index] = categorization
+            
+            return categorized
+        
+        except Exception as e:
+            print(f"Error categorizing packed transactions: {str(e)}")
+            return {}
+    
+    async def categorize_batch(self, transactions: List[Dict[str, Any]], categories: List[Dict[str, str]], user_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Categorize multiple transactions concurrently, keeping the original row order.
+        With pack_size > 1 rows are sent pack_size at a time; rows missing from a
+        packed answer fall back to single-row calls. LLM calls are queued
+        under `user_id` so concurrent users take turns on the rate budget.
+        """
+        semaphore = asyncio.Semaphore(self.concurrency)
+        categorizations: Dict[int, Dict[str, Any]] = {}
+        
+        async def categorize_pack(start: int):
+            pack = transactions[start:start + self.pack_size]
+            async with semaphore:
+                answers = await self.categorize_packed(pack, categories, user_id)
+            for offset, categorization in answers.items():
+                categorizations[start + offset] = categorization
+        
+        async def categorize_one(index: int):
+            transaction = transactions[index]
+            async with semaphore:
+                categorizations[index] = await self.categorize_transaction(
+                    transaction["description"],
+                    transaction["amount"],
+                    categories,
+                    user_id
+                )
+        
+        if self.pack_size > 1:
+            await asyncio.gather(*(
+                categorize_pack(start) for start in range(0, len(transactions), self.pack_size)
+            ))
+        
+        missing = [index for index in range(len(transactions)) if index not in categorizations]
+        await asyncio.gather(*(categorize_one(index) for index in missing))
+        
+        for index, transaction in enumerate(transactions):
+            categorization = categorizations[index]
+            
             # Add categorization info to transaction
             transaction.update({
                 "category_name": categorization["category"],
@@ -104,13 +247,37 @@ class TransactionCategorizer:
                 "needs_review": categorization["confidence"] < 0.7,
                 "reasoning": categorization["reasoning"]
             })
-            
-            categorized_transactions.append(transaction)
         
-        return categorized_transactions
+        return transactions
+    
+    def _validate_categorization(self, categorization: Any, category_list: List[str]) -> Dict[str, Any]:
+        """Validate one categorization answer from the LLM, or return None if unusable"""
+        if not isinstance(categorization, dict):
+            return None
+        
+        # Validate the response
+        if not all(key in categorization for key in ["category", "confidence", "reasoning"]):
+            return None
+        
+        # Ensure category exists in our list
+        if categorization["category"] not in category_list:
+            categorization["category"] = "Other"
+            categorization["confidence"] = 0.5
+            categorization["reasoning"] = "Category not found in available options"
+        
+        # Ensure confidence is a valid float
+        try:
+            categorization["confidence"] = float(categorization["confidence"])
+            if not 0.0 <= categorization["confidence"] <= 1.0:
+                categorization["confidence"] = 0.5
+        except (ValueError, TypeError):
+            categorization["confidence"] = 0.5
+        
+        return categorization
     
     def _fallback_categorization(self) -> Dict[str, Any]:
         """Fallback categorization when LLM fails"""
+        metrics.CATEGORIZATION_FALLBACKS.inc()
         return {
             "category": "Other",
             "confidence": 0.0,
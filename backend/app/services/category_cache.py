@@ -0,0 +1,235 @@
+import hashlib
+import os
+import re
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, List, Any, Tuple
+from sqlalchemy.orm import Session
+
+from ..database import MerchantCategory
+from .shared_state import bump_after_commit, generations, on_local_bump
+from .. import metrics
+
+# Only confident answers are worth remembering
+MIN_CACHE_CONFIDENCE = 0.7
+
+DATE_PATTERN = re.compile(r"\b\d{1,4}[/.-]\d{1,2}(?:[/.-]\d{2,4})?\b")
+REFERENCE_PATTERN = re.compile(r"\b(?:ref|id|conf|txn|trans|auth|seq|trace)\b[#:.\s]*\w*\d\w*")
+STORE_NUMBER_PATTERN = re.compile(r"(?:#|\b(?:store|str|no|num)\b\.?)\s*\d+|\b\w*\d{3,}\w*\b")
+NON_WORD_PATTERN = re.compile(r"[^\w&']+")
+
+def normalize_description(description: str) -> str:
+    """
+    Reduce a statement description to a merchant key:
+    case-folded, with dates, reference IDs and store numbers removed
+    """
+    text = str(description).casefold()
+    text = DATE_PATTERN.sub(" ", text)
+    text = REFERENCE_PATTERN.sub(" ", text)
+    text = STORE_NUMBER_PATTERN.sub(" ", text)
+    text = NON_WORD_PATTERN.sub(" ", text)
+    return " ".join(text.split())
+
+def categories_version(categories: List[Dict[str, Any]]) -> str:
+    """Fingerprint of a user's category names; cached entries from another version are stale"""
+    names = "\n".join(sorted(cat["name"] for cat in categories))
+    return hashlib.sha1(names.encode("utf-8")).hexdigest()
+
+class CategoryCache:
+    """
+    Merchant -> category cache in front of the LLM categorizer.
+    
+    Entries persist in the merchant_categories table, which every worker
+    process shares; an in-process LRU per user keeps their hot merchants in
+    memory, so one tenant's bulk import can't evict everyone else's entries.
+    Corrections bump the user's shared generation, which makes the other
+    workers drop their copy; the worker that made them keeps its own. An entry only applies while the user's category
+    list is unchanged (see categories_version).
+    """
+    
+    def __init__(self):
+        self.max_entries = int(os.getenv("MERCHANT_CACHE_SIZE", "10000"))
+        self.max_users = int(os.getenv("MERCHANT_CACHE_USERS", "1000"))
+        self.max_rows_per_user = int(os.getenv("MERCHANT_CACHE_MAX_ROWS", "50000"))
+        # user -> (generation the entries were loaded at, entries)
+        self._lru: "OrderedDict[str, Tuple[int, OrderedDict[str, Tuple[str, float, str]]]]" = OrderedDict()
+        # Lookups run on to_thread workers, alongside the saves of other uploads
+        self._lock = threading.Lock()
+        on_local_bump(self._adopt_generation)
+    
+    def _adopt_generation(self, user_id: str, generation: int):
+        """This worker's own correction: its entries already hold it, so they stay current"""
+        with self._lock:
+            cached = self._lru.get(user_id)
+            if cached is not None and cached[0] == generation - 1:
+                self._lru[user_id] = (generation, cached[1])
+    
+    def _user_lru(self, user_id: str) -> "OrderedDict[str, Tuple[str, float, str]]":
+        """
+        The user's in-memory entries; least recently active users are dropped first,
+        and entries another worker has since corrected are dropped altogether.
+        Called with the lock held.
+        """
+        generation = generations().get(user_id)
+        cached = self._lru.get(user_id)
+        if cached is None or cached[0] != generation:
+            cached = self._lru[user_id] = (generation, OrderedDict())
+            while len(self._lru) > self.max_users:
+                self._lru.popitem(last=False)
+        self._lru.move_to_end(user_id)
+        return cached[1]
+    
+    def _remember(self, user_id: str, merchant_key: str, entry: Tuple[str, float, str]):
+        with self._lock:
+            entries = self._user_lru(user_id)
+            entries[merchant_key] = entry
+            entries.move_to_end(merchant_key)
+            while len(entries) > self.max_entries:
+                entries.popitem(last=False)
+    
+    def categorize_cached(self, db: Session, user_id: str, transactions: List[Dict[str, Any]], categories: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Fill in categorization for transactions with a cached merchant.
+        Returns the transactions that still need the LLM.
+        """
+        version = categories_version(categories)
+        keys = [normalize_description(t["description"]) for t in transactions]
+        
+        entries: Dict[str, Tuple[str, float, str]] = {}
+        to_load = set()
+        with self._lock:
+            user_lru = self._user_lru(user_id)
+            for key in set(keys):
+                entry = user_lru.get(key)
+                if entry is not None:
+                    user_lru.move_to_end(key)
+                    entries[key] = entry
+                elif key:
+                    to_load.add(key)
+        
+        if to_load:
+            rows = db.query(MerchantCategory).filter(
+                MerchantCategory.user_id == user_id,
+                MerchantCategory.merchant_key.in_(to_load)
+            ).all()
+            for row in rows:
+                entry = (row.category_name, row.confidence_score, row.categories_version)
+                entries[row.merchant_key] = entry
+                self._remember(user_id, row.merchant_key, entry)
+        
+        uncached = []
+        for transaction, key in zip(transactions, keys):
+            entry = entries.get(key)
+            if entry is None or entry[2] != version:
+                uncached.append(transaction)
+                continue
+            
+            transaction.update({
+                "category_name": entry[0],
+                "confidence_score": entry[1],
+                "needs_review": entry[1] < 0.7,
+                "reasoning": "Matched a previously categorized merchant",
+                "category_source": "cache"
+            })
+        
+        metrics.MERCHANT_CACHE.inc(len(transactions) - len(uncached), result="hit")
+        metrics.MERCHANT_CACHE.inc(len(uncached), result="miss")
+        return uncached
+    
+    def record_hits(self, db: Session, user_id: str, transactions: List[Dict[str, Any]]):
+        """
+        Bump hit counts and recency for the merchants that answered from the cache.
+        Separate from categorize_cached so the write can wait for the caller's save.
+        """
+        used_keys = {
+            normalize_description(t["description"])
+            for t in transactions if t.get("category_source") == "cache"
+        }
+        if used_keys:
+            db.query(MerchantCategory).filter(
+                MerchantCategory.user_id == user_id,
+                MerchantCategory.merchant_key.in_(used_keys)
+            ).update(
+                {
+                    MerchantCategory.hits: MerchantCategory.hits + 1,
+                    MerchantCategory.last_used_at: datetime.utcnow()
+                },
+                synchronize_session=False
+            )
+    
+    def store_batch(self, db: Session, user_id: str, transactions: List[Dict[str, Any]], categories: List[Dict[str, Any]]):
+        """Remember confident categorizations; the caller commits"""
+        version = categories_version(categories)
+        answers = {}
+        for transaction in transactions:
+            if transaction["confidence_score"] < MIN_CACHE_CONFIDENCE:
+                continue
+            key = normalize_description(transaction["description"])
+            if key:
+                answers[key] = (transaction["category_name"], transaction["confidence_score"])
+        
+        if answers:
+            self._upsert(db, user_id, answers, version)
+    
+    def record_correction(self, db: Session, user_id: str, description: str, category_name: str, categories: List[Dict[str, Any]]):
+        """Replace the cached entry for a merchant with a user's manual correction"""
+        self.record_corrections(db, user_id, [(description, category_name)], categories)
+    
+    def record_corrections(self, db: Session, user_id: str, corrections: List[Tuple[str, str]], categories: List[Dict[str, Any]]):
+        """Replace the cached entries for several (description, category name) corrections at once"""
+        answers = {}
+        for description, category_name in corrections:
+            key = normalize_description(description)
+            if key:
+                answers[key] = (category_name, 1.0)
+        if answers:
+            self._upsert(db, user_id, answers, categories_version(categories))
+            bump_after_commit(db, user_id)
+    
+    def _upsert(self, db: Session, user_id: str, answers: Dict[str, Tuple[str, float]], version: str):
+        now = datetime.utcnow()
+        existing = {
+            row.merchant_key: row
+            for row in db.query(MerchantCategory).filter(
+                MerchantCategory.user_id == user_id,
+                MerchantCategory.merchant_key.in_(answers.keys())
+            )
+        }
+        
+        for key, (category_name, confidence) in answers.items():
+            row = existing.get(key)
+            if row is None:
+                db.add(MerchantCategory(
+                    user_id=user_id,
+                    merchant_key=key,
+                    category_name=category_name,
+                    confidence_score=confidence,
+                    categories_version=version,
+                    last_used_at=now
+                ))
+            else:
+                row.category_name = category_name
+                row.confidence_score = confidence
+                row.categories_version = version
+                row.last_used_at = now
+            self._remember(user_id, key, (category_name, confidence, version))
+        
+        db.flush()
+        self._evict(db, user_id)
+    
+    def _evict(self, db: Session, user_id: str):
+        """Keep each user's persisted cache under max_rows_per_user, dropping least recently used"""
+        count = db.query(MerchantCategory).filter(MerchantCategory.user_id == user_id).count()
+        excess = count - self.max_rows_per_user
+        if excess <= 0:
+            return
+        
+        stale_ids = [
+            row.id for row in db.query(MerchantCategory.id).filter(
+                MerchantCategory.user_id == user_id
+            ).order_by(MerchantCategory.last_used_at).limit(excess)
+        ]
+        db.query(MerchantCategory).filter(MerchantCategory.id.in_(stale_ids)).delete(
+            synchronize_session=False
+        )
@@ -0,0 +1,116 @@
+import hashlib
+import json
+import os
+from datetime import datetime, timedelta
+from typing import Dict, List, Any, Optional, TextIO
+from sqlalchemy import func, select
+from sqlalchemy.exc import IntegrityError
+
+from ..database import SessionLocal, ExtractionCacheEntry
+from .. import metrics
+
+# Part of every key; bump it when the shape of the stored rows changes
+FORMAT_VERSION = 2
+
+class ExtractionCache:
+    """
+    Content-addressed cache of LLM statement extractions, so a re-uploaded
+    statement skips the LLM entirely.
+    
+    Keys hash the normalized file content together with the prompt and model,
+    so changing either misses naturally. Entries live in the extraction_cache
+    table, expire after a TTL, and the least recently used are evicted once the
+    table grows past its size budget. Each call uses its own short session and
+    blocks, so callers run it in a thread.
+    """
+    
+    def __init__(self):
+        self.enabled = os.getenv("EXTRACTION_CACHE_ENABLED", "true").lower() == "true"
+        self.ttl = timedelta(days=float(os.getenv("EXTRACTION_CACHE_TTL_DAYS", "30")))
+        self.max_bytes = int(os.getenv("EXTRACTION_CACHE_MAX_MB", "100")) * 1024 * 1024
+    
+    def key(self, stream: TextIO, model: str, prompt: str) -> str:
+        """
+        Hash the statement line by line, ignoring blank lines, surrounding whitespace
+        and line endings, which don't change what the LLM extracts. Reads the stream to the end.
+        """
+        digest = hashlib.sha256()
+        digest.update(f"{FORMAT_VERSION}\0{model}\0{prompt}\0".encode("utf-8"))
+        for line in stream:
+            line = line.strip()
+            if line:
+                digest.update(line.encode("utf-8"))
+                digest.update(b"\n")
+        return digest.hexdigest()
+    
+    def get(self, key: str) -> Optional[List[Dict[str, Any]]]:
+        if not self.enabled:
+            return None
+        db = SessionLocal()
+        try:
+            entry = db.get(ExtractionCacheEntry, key)
+            if entry is not None and entry.created_at < datetime.utcnow() - self.ttl:
+                db.delete(entry)
+                db.commit()
+                entry = None
+            if entry is None:
+                metrics.EXTRACTION_CACHE.inc(result="miss")
+                return None
+            
+            entry.hits += 1
+            entry.last_used_at = datetime.utcnow()
+            transactions = json.loads(entry.transactions)
+            db.commit()
+            metrics.EXTRACTION_CACHE.inc(result="hit")
+            return transactions
+        finally:
+            db.close()
+    
+    def put(self, key: str, model: str, transactions: List[Dict[str, Any]]):
+        if not self.enabled:
+            return
+        payload = json.dumps(transactions, default=datetime.isoformat)
+        db = SessionLocal()
+        try:
+            db.merge(ExtractionCacheEntry(
+                key=key,
+                model=model,
+                transactions=payload,
+                row_count=len(transactions),
+                size_bytes=len(payload),
+                hits=0,
+                last_used_at=datetime.utcnow(),
+                created_at=datetime.utcnow()
+            ))
+            db.flush()
+            self._evict(db)
+            db.commit()
+        except IntegrityError:
+            # A concurrent upload of the same file stored it first
+            db.rollback()
+        finally:
+            db.close()
+    
+    def _evict(self, db):
+        """Drop expired entries, then the least recently used until the table fits its budget"""
+        db.query(ExtractionCacheEntry).filter(
+            ExtractionCacheEntry.created_at < datetime.utcnow() - self.ttl
+        ).delete(synchronize_session=False)
+        
+        total = db.scalar(select(func.coalesce(func.sum(ExtractionCacheEntry.size_bytes), 0)))
+        if total <= self.max_bytes:
+            return
+        
+        stale = []
+        rows = db.execute(
+            select(ExtractionCacheEntry.key, ExtractionCacheEntry.size_bytes)
+            .order_by(ExtractionCacheEntry.last_used_at)
+        )
+        for key, size in rows:
+            if total <= self.max_bytes:
+                break
+            stale.append(key)
+            total -= size
+        db.query(ExtractionCacheEntry).filter(
+            ExtractionCacheEntry.key.in_(stale)
+        ).delete(synchronize_session=False)
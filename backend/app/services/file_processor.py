@@ -1,23 +1,18 @@
-import openai
+import asyncio
+import io
 import json
 import os
-from datetime import datetime
-from typing import List, Dict, Any
-from dotenv import load_dotenv
+from typing import List, Dict, Any, Iterator, Optional, TextIO, Tuple
 
-load_dotenv()
+from .statement_parser import StatementParser
+from .extraction_cache import ExtractionCache
+from .normalizer import normalize_rows
+from . import llm_client
+from .. import metrics
 
-openai.api_key = os.getenv("OPENAI_API_KEY")
+SYSTEM_PROMPT = "You are a financial data extraction expert. Return only valid JSON."
 
-class FileProcessor:
-    def __init__(self):
-        self.client = openai.OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-    
-    async def extract_transactions(self, file_content: str, filename: str) -> List[Dict[str, Any]]:
-        """
-        Extract transactions from any file format using LLM
-        """
-        prompt = f"""
+EXTRACTION_PROMPT = """
         Extract all financial transactions from this file content. The file may be CSV, TXT, PDF text, or any format.
         
         File name: {filename}
@@ -40,80 +35,256 @@ class FileProcessor:
         - Clean up merchant names and descriptions
         - If you cannot extract clear transactions, return an empty array []
         - Only return valid JSON, no explanations
+"""
+
+class FileProcessor:
+    def __init__(self):
+        self.max_retries = int(os.getenv("EXTRACTION_MAX_RETRIES", "3"))
+        self.backoff_base = float(os.getenv("EXTRACTION_BACKOFF_BASE", "0.5"))
+        self.backoff_max = float(os.getenv("EXTRACTION_BACKOFF_MAX", "20"))
+        self.statement_parser = StatementParser()
+        self.extraction_cache = ExtractionCache()
+        self.model = os.getenv("EXTRACTION_MODEL", "gpt-4.1")
+        self.max_tokens = 4000
+        # Chunks are sized so both the prompt and the JSON answer fit comfortably
+        self.chunk_chars = int(os.getenv("EXTRACTION_CHUNK_TOKENS", "3000")) * 4
+        self.chunk_rows = int(os.getenv("EXTRACTION_CHUNK_ROWS", "60"))
+        self.overlap_lines = int(os.getenv("EXTRACTION_OVERLAP_LINES", "2"))
+        self.concurrency = int(os.getenv("EXTRACTION_CONCURRENCY", "4"))
+    
+    @property
+    def client(self):
+        """The shared client, created on first call; retries happen in _complete"""
+        return llm_client.get_client()
+    
+    async def _complete(self, messages: List[Dict[str, str]]):
+        """Run one extraction call, retrying 429/5xx with backoff"""
+        retryable_errors = llm_client.retryable_errors()
+        
+        with metrics.span(metrics.LLM_CALL_SECONDS, "llm", operation="extract"):
+            for attempt in range(self.max_retries + 1):
+                try:
+                    response = await self.client.chat.completions.create(
+                        model=self.model,
+                        messages=messages,
+                        temperature=0.1,
+                        max_tokens=self.max_tokens
+                    )
+                except retryable_errors as e:
+                    if attempt == self.max_retries:
+                        metrics.LLM_CALLS.inc(operation="extract", outcome="error")
+                        raise
+                    metrics.LLM_RETRIES.inc(operation="extract")
+                    await asyncio.sleep(llm_client.retry_delay(e, attempt, self.backoff_base, self.backoff_max))
+                    continue
+                except Exception:
+                    metrics.LLM_CALLS.inc(operation="extract", outcome="error")
+                    raise
+                
+                metrics.LLM_CALLS.inc(operation="extract", outcome="ok")
+                metrics.record_usage("extract", response.usage)
+                return response
+    
+    async def extract_transactions(self, file_content: str, filename: str, rejected: Optional[List[Dict[str, Any]]] = None) -> List[Dict[str, Any]]:
+        """
+        Extract transactions from file content already held in memory
+        """
+        return await self.extract_transactions_stream(io.StringIO(file_content), filename, rejected)
+    
+    async def extract_transactions_stream(self, stream: TextIO, filename: str, rejected: Optional[List[Dict[str, Any]]] = None) -> List[Dict[str, Any]]:
+        """
+        Extract transactions from a seekable text stream.
+        Known bank CSV and OFX/QFX layouts are parsed locally; everything else goes to the LLM.
+        Transactions come back normalized (datetime dates, float amounts); rows
+        that couldn't be normalized are left out and described in `rejected`.
+        """
+        if rejected is None:
+            rejected = []
+        sample = stream.read(8192)
+        stream.seek(0)
+        file_format = self.detect_file_format(sample, filename)
+        
+        transactions = await asyncio.to_thread(self.statement_parser.parse_stream, stream, file_format, rejected)
+        if transactions is not None:
+            return transactions
+        
+        stream.seek(0)
+        return await self._extract_with_llm(stream, filename, rejected)
+    
+    async def _extract_with_llm(self, stream: TextIO, filename: str, rejected: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Extract transactions with the LLM, one chunk of lines at a time.
+        Only a bounded number of chunks are read ahead of the running requests.
+        The merged rows are normalized together, so one date format is inferred for the file.
+        A statement extracted before (same content, prompt and model) is served from the cache.
+        The cache holds the rows as the LLM returned them, so a hit rejects the same rows again.
+        """
+        cache_key = await asyncio.to_thread(
+            self.extraction_cache.key, stream, self.model, SYSTEM_PROMPT + EXTRACTION_PROMPT
+        )
+        stream.seek(0)
+        cached = await asyncio.to_thread(self.extraction_cache.get, cache_key)
+        if cached is not None:
+            return normalize_rows(cached, rejected)
+        
+        semaphore = asyncio.Semaphore(self.concurrency)
+        results: Dict[int, List[Dict[str, Any]]] = {}
+        failures: List[Dict[str, Any]] = []
+        pending = set()
+        
+        async def run_chunk(index: int, header: str, lines: List[str], line_numbers: List[int]):
+            async with semaphore:
+                results[index] = await self._extract_chunk(header, lines, line_numbers, filename, failures)
+        
+        for index, (header, lines, line_numbers) in enumerate(self._chunk_lines(stream)):
+            pending.add(asyncio.create_task(run_chunk(index, header, lines, line_numbers)))
+            if len(pending) >= self.concurrency * 2:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    task.result()
+        
+        if pending:
+            await asyncio.gather(*pending)
+        
+        # Lines whose chunk failed are reported first, so they're never cut from the summary
+        failures.sort(key=lambda failure: failure["row"])
+        rejected.extend(failures)
+        rows = self._merge_chunks([results[index] for index in range(len(results))])
+        # A chunk that failed would leave the cached answer incomplete for good
+        if rows and not failures:
+            await asyncio.to_thread(self.extraction_cache.put, cache_key, self.model, rows)
+        return normalize_rows(rows, rejected)
+    
+    def _chunk_lines(self, stream: TextIO) -> Iterator[Tuple[str, List[str], List[int]]]:
+        """
+        Split the file on line boundaries into chunks that fit the token budget,
+        each with the file line numbers of its lines.
+        A leading header line (one without digits) is repeated in every chunk, and
+        each chunk starts with the last few lines of the previous one so records
+        cut at a seam are seen whole at least once.
         """
+        header = ""
+        chunk: List[str] = []
+        line_numbers: List[int] = []
+        chunk_chars = 0
+        first_line = True
+        
+        for line_number, line in enumerate(stream, start=1):
+            if not line.strip():
+                continue
+            if first_line:
+                first_line = False
+                if not any(ch.isdigit() for ch in line):
+                    header = line
+                    continue
+            
+            if chunk and (chunk_chars + len(line) > self.chunk_chars or len(chunk) >= self.chunk_rows):
+                yield header, chunk, line_numbers
+                chunk = chunk[-self.overlap_lines:] if self.overlap_lines else []
+                line_numbers = line_numbers[-self.overlap_lines:] if self.overlap_lines else []
+                chunk_chars = sum(len(l) for l in chunk)
+            
+            chunk.append(line)
+            line_numbers.append(line_number)
+            chunk_chars += len(line)
+        
+        if chunk:
+            yield header, chunk, line_numbers
+    
+    async def _extract_chunk(self, header: str, lines: List[str], line_numbers: List[int], filename: str, failures: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Extract one chunk, splitting it in half whenever the answer is cut off.
+        A chunk whose request fails is added to `failures` as a rejection of its lines.
+        """
+        transactions, truncated, error = await self._request_extraction(header + "".join(lines), filename)
+        if error is not None:
+            failures.append({
+                "row": line_numbers[0],
+                "field": "chunk",
+                "value": f"lines {line_numbers[0]}-{line_numbers[-1]}",
+                "reason": f"extraction failed: {error}"[:200]
+            })
+            return []
+        if not truncated:
+            return transactions
+        
+        if len(lines) == 1:
+            print(f"Extraction truncated for a single line in {filename}")
+            return transactions
+        
+        middle = len(lines) // 2
+        first, second = await asyncio.gather(
+            self._extract_chunk(header, lines[:middle], line_numbers[:middle], filename, failures),
+            self._extract_chunk(header, lines[middle:], line_numbers[middle:], filename, failures)
+        )
+        return first + second
+    
+    def _merge_chunks(self, chunk_results: List[List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+        """Concatenate chunk results, dropping rows repeated from the overlap at each seam"""
+        merged = []
+        previous: List[Dict[str, Any]] = []
+        
+        for rows in chunk_results:
+            tail = [self._row_key(row) for row in previous[-(self.overlap_lines + 1):]]
+            start = 0
+            while start < min(len(rows), self.overlap_lines) and self._row_key(rows[start]) in tail:
+                tail.remove(self._row_key(rows[start]))
+                start += 1
+            
+            merged.extend(rows[start:])
+            previous = rows
+        
+        return merged
+    
+    def _row_key(self, transaction: Dict[str, Any]) -> Tuple[str, str, str]:
+        # Rows are still as the LLM wrote them here
+        return (
+            str(transaction.get("date")),
+            str(transaction.get("amount")),
+            str(transaction.get("description", "")).casefold()
+        )
+    
+    async def _request_extraction(self, file_content: str, filename: str) -> Tuple[List[Dict[str, Any]], bool, Optional[str]]:
+        """
+        Extract transactions from any file format using LLM.
+        Returns the transactions, whether the answer hit the output token limit,
+        and the error when the call failed outright.
+        """
+        prompt = EXTRACTION_PROMPT.format(filename=filename, file_content=file_content)
         
         try:
-            response = self.client.chat.completions.create(
-                model="gpt-4.1",
-                messages=[
-                    {"role": "system", "content": "You are a financial data extraction expert. Return only valid JSON."},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.1,
-                max_tokens=4000
-            )
+            response = await self._complete([
+                {"role": "system", "content": SYSTEM_PROMPT},
+                {"role": "user", "content": prompt}
+            ])
             
             result = response.choices[0].message.content.strip()
+            truncated = response.choices[0].finish_reason == "length"
             
             # Try to parse the JSON response
             try:
                 transactions = json.loads(result)
                 if not isinstance(transactions, list):
-                    return []
-                
-                # Validate and clean each transaction
-                cleaned_transactions = []
-                for trans in transactions:
-                    if self._validate_transaction(trans):
-                        cleaned_transactions.append(self._clean_transaction(trans))
-                
-                return cleaned_transactions
+                    return [], truncated, None
                 
+                # Normalized once the chunks are merged
+                return [trans for trans in transactions if isinstance(trans, dict)], truncated, None
+            
             except json.JSONDecodeError:
+                if truncated:
+                    return [], True, None
                 print(f"Failed to parse LLM response as JSON: {result}")
-                return []
-                
+                return [], False, "invalid JSON"
+        
         except Exception as e:
             print(f"Error extracting transactions: {str(e)}")
-            return []
-    
-    def _validate_transaction(self, transaction: Dict[str, Any]) -> bool:
-        """Validate that transaction has required fields"""
-        required_fields = ["date", "amount", "description"]
-        return all(field in transaction for field in required_fields)
-    
-    def _clean_transaction(self, transaction: Dict[str, Any]) -> Dict[str, Any]:
-        """Clean and standardize transaction data"""
-        try:
-            # Parse date
-            date_str = transaction["date"]
-            if isinstance(date_str, str):
-                # Try different date formats
-                for fmt in ["%Y-%m-%d", "%m/%d/%Y", "%m-%d-%Y", "%Y/%m/%d"]:
-                    try:
-                        parsed_date = datetime.strptime(date_str, fmt)
-                        break
-                    except ValueError:
-                        continue
-                else:
-                    # If no format works, use current date
-                    parsed_date = datetime.now()
-            else:
-                parsed_date = datetime.now()
-            
-            return {
-                "date": parsed_date.isoformat(),
-                "amount": float(transaction["amount"]),
-                "description": str(transaction["description"]).strip(),
-                "account_info": transaction.get("account_info", "")
-            }
-        except Exception as e:
-            print(f"Error cleaning transaction: {str(e)}")
-            return None
+            return [], False, str(e)
     
     def detect_file_format(self, content: str, filename: str) -> str:
         """Detect the file format for better processing"""
-        if filename.lower().endswith('.csv'):
+        if filename.lower().endswith(('.ofx', '.qfx')) or '<OFX>' in content[:4096].upper():
+            return "OFX"
+        elif filename.lower().endswith('.csv'):
             return "CSV"
         elif filename.lower().endswith('.txt'):
             return "TXT"
@@ -0,0 +1,478 @@
+import asyncio
+import hashlib
+import json
+import multiprocessing
+import os
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from typing import Dict, List, Any, BinaryIO, Optional, TextIO
+from sqlalchemy import or_, select, update
+from sqlalchemy.orm import Session
+
+from ..database import SessionLocal, Category, IngestJob
+from .file_processor import FileProcessor
+from .categorizer import TransactionCategorizer
+from .category_cache import CategoryCache
+from .local_classifier import LocalClassifier
+from .rule_engine import RuleEngine
+from .transaction_store import assign_content_hashes, existing_hashes, insert_transactions
+from . import recurring, rollups, upload_lock
+from .. import metrics
+
+# Jobs in any of these states still have work left and are resumed on startup
+ACTIVE_STATUSES = ("queued", "extracting", "categorizing", "saving")
+# An active job whose queue hasn't refreshed it for this long (e.g. a killed worker) is taken over
+INGEST_JOB_TTL_SECONDS = float(os.getenv("INGEST_JOB_TTL_SECONDS", "60"))
+# Rejected rows described in an upload summary; the rest are only counted
+MAX_REPORTED_REJECTIONS = 50
+
+class IngestionPipeline:
+    """
+    Upload pipeline: extract -> categorize -> save.
+    Used directly by /api/upload and by the background job workers.
+    """
+    
+    def __init__(self, file_processor: FileProcessor, categorizer: TransactionCategorizer, category_cache: CategoryCache, classifier: LocalClassifier, rule_engine: RuleEngine):
+        self.file_processor = file_processor
+        self.categorizer = categorizer
+        self.category_cache = category_cache
+        self.classifier = classifier
+        self.rule_engine = rule_engine
+    
+    async def run(self, db: Session, user_id: str, stream: TextIO, filename: str, job: Optional[IngestJob] = None) -> Dict[str, Any]:
+        """
+        Process one statement and return the upload summary.
+        When a job is given its stage and row counts are kept up to date as the pipeline runs.
+        """
+        await self._set_stage(db, job, "extracting")
+        # Rows whose date or amount couldn't be read are reported, never guessed
+        rejected: List[Dict[str, Any]] = []
+        with metrics.span(metrics.STAGE_SECONDS, "extract", stage="extract") as extract_span:
+            extracted_transactions = await self.file_processor.extract_transactions_stream(stream, filename, rejected)
+        # Sections of the file the LLM couldn't extract; their rows are missing from the upload
+        failed_chunks = sum(1 for rejection in rejected if rejection["field"] == "chunk")
+        metrics.REJECTED_ROWS.inc(len(rejected) - failed_chunks)
+        
+        if not extracted_transactions:
+            return {
+                "success": False,
+                "message": "Could not extract transactions from the file" if failed_chunks else "No transactions found in the file",
+                "failed_chunks": failed_chunks,
+                "transactions_processed": 0,
+                "rejected": len(rejected),
+                "rejected_rows": rejected[:MAX_REPORTED_REJECTIONS]
+            }
+        
+        await self._set_stage(db, job, "categorizing", rows_extracted=len(extracted_transactions))
+        
+        with metrics.span(metrics.STAGE_SECONDS, "dedupe", stage="dedupe") as dedupe_span:
+            # Rows already stored by an earlier upload are skipped before any LLM call
+            assign_content_hashes(user_id, extracted_transactions)
+            stored = await asyncio.to_thread(
+                existing_hashes, db, user_id, [t["content_hash"] for t in extracted_transactions]
+            )
+            new_transactions = [t for t in extracted_transactions if t["content_hash"] not in stored]
+        
+        # Get available categories
+        category_data = await asyncio.to_thread(self._category_data, db, user_id)
+        
+        with metrics.span(metrics.STAGE_SECONDS, "categorize", stage="categorize") as categorize_span:
+            uncached_transactions, stats = await self._categorize(db, user_id, new_transactions, category_data)
+        
+        await self._set_stage(db, job, "saving", rows_categorized=len(new_transactions))
+        stats["rejected"] = len(rejected)
+        stats["failed_chunks"] = failed_chunks
+        stats["rejected_rows"] = rejected[:MAX_REPORTED_REJECTIONS]
+        # Seconds per stage, for the benchmarks
+        stats["timings"] = {
+            "extract_s": extract_span.seconds,
+            "dedupe_s": dedupe_span.seconds,
+            "categorize_s": categorize_span.seconds
+        }
+        
+        # All writes run in one transaction off the event loop: a SQLite write lock
+        # held across an await would stall every other upload's writes
+        with metrics.span(metrics.STAGE_SECONDS, "persist", stage="persist") as persist_span:
+            result = await asyncio.to_thread(
+                self._save, db, user_id, filename, job,
+                len(extracted_transactions), new_transactions, uncached_transactions, category_data, stats
+            )
+        result["timings"]["persist_s"] = persist_span.seconds
+        return result
+    
+    async def _categorize(self, db: Session, user_id: str, transactions: List[Dict[str, Any]], category_data: List[Dict[str, Any]]):
+        """
+        Categorize new rows in place: user rules win; then cached merchant categories,
+        the local model, and the LLM for the rest. Nothing is written here (see _save).
+        Returns the rows the merchant cache missed, and per-tier counts.
+        """
+        unruled_transactions = await asyncio.to_thread(
+            self.rule_engine.apply, db, user_id, transactions, category_data
+        )
+        uncached_transactions = await asyncio.to_thread(
+            self.category_cache.categorize_cached, db, user_id, unruled_transactions, category_data
+        )
+        llm_transactions = await asyncio.to_thread(
+            self.classifier.categorize, db, user_id, uncached_transactions, category_data
+        )
+        if llm_transactions:
+            # Nothing is pending; end the read transaction so the session's pooled
+            # connection goes back to other uploads while the LLM answers
+            await asyncio.to_thread(db.rollback)
+        await self.categorizer.categorize_batch(llm_transactions, category_data, user_id)
+        for trans_data in llm_transactions:
+            trans_data["category_source"] = "llm"
+        await asyncio.to_thread(self.classifier.learn_from_transactions, user_id, llm_transactions)
+        
+        stats = {
+            "rules": len(transactions) - len(unruled_transactions),
+            "cache": {
+                "hits": len(unruled_transactions) - len(uncached_transactions),
+                "misses": len(uncached_transactions)
+            },
+            "local_model": len(uncached_transactions) - len(llm_transactions),
+            "llm": len(llm_transactions)
+        }
+        metrics.CATEGORIZED_ROWS.inc(stats["rules"], source="rule")
+        metrics.CATEGORIZED_ROWS.inc(stats["cache"]["hits"], source="cache")
+        metrics.CATEGORIZED_ROWS.inc(stats["local_model"], source="classifier")
+        metrics.CATEGORIZED_ROWS.inc(stats["llm"], source="llm")
+        return uncached_transactions, stats
+    
+    def _category_data(self, db: Session, user_id: str) -> List[Dict[str, Any]]:
+        categories = db.query(Category).filter(Category.user_id == user_id).all()
+        return [{"id": cat.id, "name": cat.name} for cat in categories]
+    
+    def _save(
+        self,
+        db: Session,
+        user_id: str,
+        filename: str,
+        job: Optional[IngestJob],
+        extracted_count: int,
+        categorized_transactions: List[Dict[str, Any]],
+        uncached_transactions: List[Dict[str, Any]],
+        category_data: List[Dict[str, Any]],
+        stats: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        """Store the categorized rows and cache updates, and complete the job, in a single commit"""
+        self.category_cache.record_hits(db, user_id, categorized_transactions)
+        self.category_cache.store_batch(db, user_id, uncached_transactions, category_data)
+        
+        # Save transactions to database in batched inserts
+        rows = []
+        saved_transactions = []
+        for trans_data in categorized_transactions:
+            # Get category ID
+            category_id = self.categorizer.get_category_id_by_name(
+                trans_data["category_name"], category_data
+            )
+            
+            rows.append({
+                "user_id": user_id,
+                "date": trans_data["date"],
+                "amount": trans_data["amount"],
+                "description": trans_data["description"],
+                "category_id": category_id,
+                "confidence_score": trans_data["confidence_score"],
+                "file_source": filename,
+                "needs_review": trans_data["needs_review"],
+                "content_hash": trans_data["content_hash"],
+                "category_source": trans_data.get("category_source")
+            })
+            saved_transactions.append({
+                "description": trans_data["description"],
+                "amount": trans_data["amount"],
+                "category": trans_data["category_name"],
+                "confidence": trans_data["confidence_score"],
+                "needs_review": trans_data["needs_review"]
+            })
+        
+        inserted = insert_transactions(db, rows)
+        duplicates = extracted_count - inserted
+        
+        # Rollups and recurring series change in the same transaction as the rows they summarize
+        if inserted == len(rows):
+            rollups.add_rows(db, user_id, rows)
+            recurring.add_rows(db, user_id, rows)
+        else:
+            # A concurrent upload stored some of these rows first; recount the affected cells
+            rollups.refresh_cells(db, user_id, [(row["date"], row["category_id"]) for row in rows])
+            recurring.rebuild(db, user_id)
+        
+        # Count transactions needing review
+        review_count = sum(1 for t in saved_transactions if t["needs_review"])
+        
+        message = f"Successfully processed {extracted_count} transactions ({inserted} new, {duplicates} already imported)"
+        if stats["failed_chunks"]:
+            message += f"; {stats['failed_chunks']} sections of the file could not be extracted and were skipped"
+        if stats["rejected"] > stats["failed_chunks"]:
+            message += f"; {stats['rejected'] - stats['failed_chunks']} rows could not be read"
+        result = {
+            "success": True,
+            "message": message,
+            "transactions_processed": extracted_count,
+            "inserted": inserted,
+            "duplicates": duplicates,
+            "needs_review": review_count,
+            "pack_size": self.categorizer.pack_size,
+            **stats,
+            "transactions": saved_transactions[:10]  # Return first 10 for preview
+        }
+        
+        # The job is marked complete in the same commit as its rows
+        if job is not None:
+            job.status = "completed"
+            job.rows_saved = inserted
+            job.result = json.dumps(result)
+        db.commit()
+        
+        return result
+    
+    async def _set_stage(self, db: Session, job: Optional[IngestJob], stage: str, **counts):
+        if job is None:
+            return
+        job.status = stage
+        for name, value in counts.items():
+            setattr(job, name, value)
+        await asyncio.to_thread(db.commit)
+
+def build_pipeline() -> IngestionPipeline:
+    return IngestionPipeline(FileProcessor(), TransactionCategorizer(), CategoryCache(), LocalClassifier(), RuleEngine())
+
+async def run_job(pipeline: IngestionPipeline, job_id: str):
+    """Run (or re-run) one stored job to completion"""
+    db = SessionLocal()
+    try:
+        job = db.query(IngestJob).filter(IngestJob.id == job_id).first()
+        if job is None or job.status not in ACTIVE_STATUSES:
+            return
+        user_id, filename = job.user_id, job.filename
+        # Jobs from before file hashes were recorded only guard against themselves
+        digest = job.file_hash or job.id
+        # End the read so the status is re-read fresh once the lock is ours
+        db.commit()
+        
+        # Another worker may be running this job (re-queued by a restart) or the
+        # same file under another job; wait for it, then see what is left to do
+        async with upload_lock.hold(user_id, digest, filename, wait=True):
+            db.refresh(job)
+            if job.status not in ACTIVE_STATUSES:
+                return
+            
+            try:
+                with open(job.file_path, encoding="utf-8-sig", newline="") as stream:
+                    result = await pipeline.run(db, job.user_id, stream, job.filename, job)
+                if not result["success"]:
+                    job.status = "completed"
+                    job.result = json.dumps(result)
+                    db.commit()
+            except Exception as e:
+                db.rollback()
+                job.status = "failed"
+                job.error = str(e)
+                db.commit()
+                print(f"Ingestion job {job_id} failed: {str(e)}")
+        
+        # Failed jobs aren't retried, so their spooled file goes too
+        try:
+            os.remove(job.file_path)
+        except OSError:
+            pass
+    finally:
+        db.close()
+
+# Pipeline owned by a process-pool child, built on its first job
+_process_pipeline: Optional[IngestionPipeline] = None
+
+def _run_job_in_process(job_id: str):
+    """Process-pool entry point: each child builds its own services and event loop"""
+    global _process_pipeline
+    if _process_pipeline is None:
+        _process_pipeline = build_pipeline()
+    asyncio.run(run_job(_process_pipeline, job_id))
+
+class JobQueue:
+    """
+    In-process queue of ingestion jobs.
+    
+    Job state lives in the ingest_jobs table, so unfinished jobs are picked up
+    again after a restart. With INGEST_BACKEND=process the jobs run in a
+    process pool instead of on the API's event loop. With several API worker
+    processes each has its own queue and heartbeats the jobs it owns; only
+    jobs whose owner stopped refreshing them are taken over. The upload lock
+    keeps workers from running the same file at once.
+    """
+    
+    def __init__(self, pipeline: IngestionPipeline):
+        self.pipeline = pipeline
+        self.workers = int(os.getenv("INGEST_WORKERS", "2"))
+        self.backend = os.getenv("INGEST_BACKEND", "asyncio")
+        self.spool_dir = os.getenv("INGEST_SPOOL_DIR", "./uploads")
+        self.worker_id = uuid.uuid4().hex
+        self._queue: "asyncio.Queue[str]" = None
+        self._tasks: List[asyncio.Task] = []
+        self._process_pool: Optional[ProcessPoolExecutor] = None
+    
+    async def start(self):
+        """Start the workers and take over jobs left behind by a stopped or killed worker"""
+        os.makedirs(self.spool_dir, exist_ok=True)
+        self._queue = asyncio.Queue()
+        if self.backend == "process":
+            # Spawned rather than forked so children don't share the parent's DB connections
+            self._process_pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        
+        for job_id in await asyncio.to_thread(self._claim_stale):
+            self._queue.put_nowait(job_id)
+        self._tasks.append(asyncio.create_task(self._heartbeat()))
+    
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self._process_pool is not None:
+            self._process_pool.shutdown(wait=False, cancel_futures=True)
+            self._process_pool = None
+        # Hand unfinished jobs over right away instead of after the TTL
+        try:
+            await asyncio.to_thread(self._release)
+        except Exception as e:
+            print(f"Failed to release ingestion jobs: {str(e)}")
+    
+    def _claim_stale(self) -> List[str]:
+        """
+        Take over active jobs that no live queue is refreshing and return their ids, oldest first.
+        The claim is one conditional update, so two queues never claim the same job.
+        """
+        now = datetime.utcnow()
+        db = SessionLocal()
+        try:
+            db.execute(
+                update(IngestJob)
+                .where(
+                    IngestJob.status.in_(ACTIVE_STATUSES),
+                    or_(
+                        IngestJob.heartbeat_at.is_(None),
+                        IngestJob.heartbeat_at < now - timedelta(seconds=INGEST_JOB_TTL_SECONDS)
+                    )
+                )
+                .values(worker_id=self.worker_id, heartbeat_at=now, status="queued")
+                .execution_options(synchronize_session=False)
+            )
+            db.commit()
+            return list(db.scalars(
+                select(IngestJob.id)
+                .where(IngestJob.worker_id == self.worker_id, IngestJob.heartbeat_at == now)
+                .order_by(IngestJob.created_at)
+            ))
+        finally:
+            db.close()
+    
+    def _refresh(self):
+        db = SessionLocal()
+        try:
+            db.execute(
+                update(IngestJob)
+                .where(IngestJob.worker_id == self.worker_id, IngestJob.status.in_(ACTIVE_STATUSES))
+                .values(heartbeat_at=datetime.utcnow())
+                .execution_options(synchronize_session=False)
+            )
+            db.commit()
+        finally:
+            db.close()
+    
+    def _release(self):
+        db = SessionLocal()
+        try:
+            db.execute(
+                update(IngestJob)
+                .where(IngestJob.worker_id == self.worker_id, IngestJob.status.in_(ACTIVE_STATUSES))
+                .values(heartbeat_at=None)
+                .execution_options(synchronize_session=False)
+            )
+            db.commit()
+        finally:
+            db.close()
+    
+    async def _heartbeat(self):
+        """Keep this queue's jobs fresh, and pick up jobs of queues that have died"""
+        while True:
+            await asyncio.sleep(INGEST_JOB_TTL_SECONDS / 3)
+            try:
+                await asyncio.to_thread(self._refresh)
+                for job_id in await asyncio.to_thread(self._claim_stale):
+                    self._queue.put_nowait(job_id)
+            except Exception as e:
+                print(f"Failed to refresh ingestion jobs: {str(e)}")
+    
+    async def submit(self, db: Session, user_id: str, upload: BinaryIO, filename: str) -> Dict[str, str]:
+        """
+        Spool an upload to disk, record it as a queued job and hand it to the workers.
+        A file identical to one of the user's still active jobs returns that job instead.
+        Returns the job's id and status.
+        """
+        # Spooling, hashing and the commit are blocking; keep them off the event loop
+        job_id, status, queued = await asyncio.to_thread(self._record, db, user_id, upload, filename)
+        if queued:
+            self._queue.put_nowait(job_id)
+        return {"job_id": job_id, "status": status}
+    
+    def _record(self, db: Session, user_id: str, upload: BinaryIO, filename: str):
+        job_id = uuid.uuid4().hex
+        file_path = os.path.join(self.spool_dir, job_id)
+        digest = hashlib.sha256()
+        with open(file_path, "wb") as spooled:
+            for chunk in iter(lambda: upload.read(1 << 20), b""):
+                digest.update(chunk)
+                spooled.write(chunk)
+        file_hash = digest.hexdigest()
+        
+        active = db.query(IngestJob).filter(
+            IngestJob.user_id == user_id,
+            IngestJob.file_hash == file_hash,
+            IngestJob.status.in_(ACTIVE_STATUSES)
+        ).first()
+        if active is not None:
+            os.remove(file_path)
+            return active.id, active.status, False
+        
+        db.add(IngestJob(
+            id=job_id, user_id=user_id, filename=filename, file_path=file_path, file_hash=file_hash,
+            status="queued", worker_id=self.worker_id, heartbeat_at=datetime.utcnow()
+        ))
+        db.commit()
+        return job_id, "queued", True
+    
+    async def _worker(self):
+        while True:
+            job_id = await self._queue.get()
+            try:
+                if self._process_pool is not None:
+                    loop = asyncio.get_running_loop()
+                    await loop.run_in_executor(self._process_pool, _run_job_in_process, job_id)
+                else:
+                    await run_job(self.pipeline, job_id)
+            except Exception as e:
+                print(f"Ingestion worker error for job {job_id}: {str(e)}")
+            finally:
+                self._queue.task_done()
+
+def job_to_dict(job: IngestJob) -> Dict[str, Any]:
+    return {
+        "job_id": job.id,
+        "filename": job.filename,
+        "status": job.status,
+        "rows_extracted": job.rows_extracted,
+        "rows_categorized": job.rows_categorized,
+        "rows_saved": job.rows_saved,
+        "error": job.error,
+        "result": json.loads(job.result) if job.result else None,
+        "created_at": job.created_at.isoformat(),
+        "updated_at": job.updated_at.isoformat() if job.updated_at else None
+    }
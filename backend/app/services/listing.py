@@ -0,0 +1,110 @@
+import base64
+from datetime import datetime
+from typing import Any, Dict, Optional, Tuple
+from sqlalchemy import and_, or_, select
+
+from ..database import Category, Transaction
+from . import search
+
+MAX_PAGE_SIZE = 1000
+
+def encode_cursor(date: datetime, transaction_id: int) -> str:
+    """Opaque cursor pointing just past the (date, id) of the last row on a page"""
+    raw = f"{date.isoformat()}|{transaction_id}"
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """Inverse of encode_cursor; raises ValueError for anything malformed"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8")
+        date_part, id_part = raw.rsplit("|", 1)
+        return datetime.fromisoformat(date_part), int(id_part)
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+def transaction_rows():
+    """
+    Listing query returning plain row tuples with the category name joined in,
+    so a page costs one SELECT instead of one lazy Category load per row.
+    A Core select, so it runs on both sync and async sessions.
+    """
+    return select(
+        Transaction.id,
+        Transaction.date,
+        Transaction.amount,
+        Transaction.description,
+        Transaction.category_id,
+        Transaction.confidence_score,
+        Transaction.needs_review,
+        Transaction.file_source,
+        Category.name.label("category_name")
+    ).outerjoin(Category, Transaction.category_id == Category.id)
+
+def row_to_dict(row) -> Dict[str, Any]:
+    """API representation of a transaction_rows() row"""
+    return {
+        "id": row.id,
+        "date": row.date.isoformat(),
+        "amount": row.amount,
+        "description": row.description,
+        "category": row.category_name or "Uncategorized",
+        "category_id": row.category_id,
+        "confidence_score": row.confidence_score,
+        "needs_review": row.needs_review,
+        "file_source": row.file_source
+    }
+
+def apply_filters(
+    query,
+    user_id: str,
+    needs_review: Optional[bool] = None,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    category_id: Optional[int] = None,
+    min_amount: Optional[float] = None,
+    max_amount: Optional[float] = None,
+    q: Optional[str] = None
+):
+    """Filters shared by the transaction listing endpoints"""
+    query = query.filter(Transaction.user_id == user_id)
+    if needs_review is not None:
+        query = query.filter(Transaction.needs_review == needs_review)
+    if start_date is not None:
+        query = query.filter(Transaction.date >= start_date)
+    if end_date is not None:
+        query = query.filter(Transaction.date < end_date)
+    if category_id is not None:
+        query = query.filter(Transaction.category_id == category_id)
+    if min_amount is not None:
+        query = query.filter(Transaction.amount >= min_amount)
+    if max_amount is not None:
+        query = query.filter(Transaction.amount <= max_amount)
+    if q:
+        # Every term of q, looked up in the search index rather than a LIKE scan
+        query = query.filter(search.description_filter(q))
+    return query
+
+def keyset_page(query, cursor: Optional[str], limit: int):
+    """
+    Newest-first page after `cursor`, ordered on (date, id) so the
+    (user_id, [needs_review,] date, id) indexes serve it without an OFFSET scan
+    """
+    if cursor:
+        cursor_date, cursor_id = decode_cursor(cursor)
+        query = query.filter(or_(
+            Transaction.date < cursor_date,
+            and_(Transaction.date == cursor_date, Transaction.id < cursor_id)
+        ))
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    # One extra row tells us whether there is a next page
+    return newest_first(query).limit(limit + 1), limit
+
+def newest_first(query):
+    return query.order_by(Transaction.date.desc(), Transaction.id.desc())
+
+def next_cursor(rows, limit: int) -> Optional[str]:
+    """Cursor for the page after `rows` (fetched with limit + 1), or None on the last page"""
+    if len(rows) <= limit:
+        return None
+    last = rows[limit - 1]
+    return encode_cursor(last.date, last.id)
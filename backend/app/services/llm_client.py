@@ -0,0 +1,55 @@
+import os
+import random
+
+# One connection pool for every LLM call in the process (extraction and categorization)
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "100"))
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "600"))
+
+# The openai package is heavy to import, so it and the client are loaded on
+# first use; workers and processes that never call the LLM don't pay for it
+_client = None
+
+def get_client():
+    """
+    The process-wide AsyncOpenAI client. It doesn't retry on its own; callers
+    retry themselves (see retry_delay) so every retry is counted and paced.
+    """
+    global _client
+    if _client is None:
+        import httpx
+        import openai
+        _client = openai.AsyncOpenAI(
+            api_key=os.getenv("OPENAI_API_KEY"),
+            base_url=os.getenv("OPENAI_BASE_URL") or None,
+            max_retries=0,
+            timeout=LLM_TIMEOUT_SECONDS,
+            http_client=openai.DefaultAsyncHttpxClient(
+                limits=httpx.Limits(max_connections=LLM_MAX_CONNECTIONS, max_keepalive_connections=LLM_MAX_CONNECTIONS),
+                timeout=LLM_TIMEOUT_SECONDS
+            )
+        )
+    return _client
+
+def retryable_errors():
+    """Errors worth retrying: rate limits, 5xx responses and network failures"""
+    import openai
+    return (openai.RateLimitError, openai.InternalServerError, openai.APIConnectionError)
+
+def retry_delay(error: Exception, attempt: int, base: float, maximum: float) -> float:
+    """Exponential backoff with jitter, honouring Retry-After when the server sends it"""
+    response = getattr(error, "response", None)
+    if response is not None:
+        retry_after = response.headers.get("retry-after")
+        try:
+            if retry_after is not None:
+                return min(maximum, float(retry_after))
+        except ValueError:
+            pass
+    delay = min(maximum, base * (2 ** attempt))
+    return delay * random.uniform(0.5, 1.0)
+
+async def close_client():
+    global _client
+    if _client is not None:
+        await _client.close()
+        _client = None
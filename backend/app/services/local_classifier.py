@@ -0,0 +1,267 @@
+import os
+import random
+import re
+import threading
+import zlib
+from collections import OrderedDict
+from functools import lru_cache
+from itertools import chain
+from typing import Dict, List, Any, Optional, Tuple
+import numpy as np
+from sqlalchemy import or_
+from sqlalchemy.orm import Session
+
+from ..database import Category, Transaction
+from .shared_state import generations, on_local_bump
+
+# Size of the hashed feature space; each user's model holds classes x 2**bits float32 weights
+FEATURE_BITS = int(os.getenv("LOCAL_CLASSIFIER_FEATURE_BITS", "14"))
+FEATURE_DIMS = 1 << FEATURE_BITS
+NGRAM_SIZES = (3, 4, 5)
+DIGITS = re.compile(r"\d+")
+
+# Descriptions featurized and scored per pass, bounding the classes x features temporary
+PREDICT_CHUNK = 4096
+# Odd 64-bit multipliers for the vectorized n-gram hash
+NGRAM_BASE = np.uint64(0x100000001B3)
+NGRAM_MIX = np.uint64(0x9E3779B97F4A7C15)
+HASH_SHIFT = np.uint64(64 - FEATURE_BITS)
+
+# Rows the model may learn from: confident LLM answers and human corrections.
+# Its own predictions are excluded so it never trains on itself.
+TRAINING_SOURCES = ("llm", "user")
+MIN_TRAINING_CONFIDENCE = 0.9
+
+def normalize(description: str) -> str:
+    """Casefolded description without digits (store numbers, dates, references)"""
+    return " ".join(DIGITS.sub(" ", str(description).casefold()).split())
+
+@lru_cache(maxsize=65536)
+def _word_index(word: str) -> int:
+    return zlib.crc32(b"w:" + word.encode("utf-8")) & (FEATURE_DIMS - 1)
+
+def featurize_texts(texts: List[str]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Hashed character n-gram and word features of normalized texts, L2-normalized
+    per text. The n-grams of the whole batch are hashed in a few array passes.
+    Returns the columns and values of all texts back to back and each one's length.
+    """
+    encoded = [f" {text} ".encode("utf-8") for text in texts]
+    sizes = np.fromiter((len(padded) for padded in encoded), dtype=np.int64, count=len(encoded))
+    data = np.frombuffer(b"".join(encoded), dtype=np.uint8).astype(np.uint64)
+    owner = np.repeat(np.arange(len(texts)), sizes)
+    ends = np.repeat(np.cumsum(sizes), sizes)
+    
+    text_ids, indexes = [], []
+    positions = np.arange(len(data))
+    # Polynomial hash of every window, each size extending the previous one by a byte
+    hashed = np.zeros(len(data), dtype=np.uint64)
+    with np.errstate(over="ignore"):
+        for n in range(1, max(NGRAM_SIZES) + 1):
+            count = len(data) - n + 1
+            if count <= 0:
+                break
+            hashed = hashed[:count] * NGRAM_BASE + data[n - 1:]
+            if n not in NGRAM_SIZES:
+                continue
+            # Windows running into the next text are dropped
+            inside = positions[:count] + n <= ends[:count]
+            text_ids.append(owner[:count][inside])
+            indexes.append((((hashed[inside] ^ np.uint64(n)) * NGRAM_MIX) >> HASH_SHIFT).astype(np.int64))
+    
+    words = list(map(str.split, texts))
+    word_counts = np.fromiter(map(len, words), dtype=np.int64, count=len(words))
+    text_ids.append(np.repeat(np.arange(len(texts)), word_counts))
+    indexes.append(np.fromiter(map(_word_index, chain.from_iterable(words)), dtype=np.int64, count=int(word_counts.sum())))
+    
+    # Count each (text, feature) pair; sorted keys keep each text's features together
+    keys, counts = np.unique((np.concatenate(text_ids) << FEATURE_BITS) | np.concatenate(indexes), return_counts=True)
+    rows = keys >> FEATURE_BITS
+    columns = keys & (FEATURE_DIMS - 1)
+    values = counts.astype(np.float32)
+    norms = np.sqrt(np.bincount(rows, weights=values * values, minlength=len(texts)))
+    values /= norms[rows].astype(np.float32)
+    return columns, values, np.bincount(rows, minlength=len(texts))
+
+class SoftmaxModel:
+    """
+    Multinomial logistic regression over hashed features, trained with SGD.
+    Updates and prediction snapshots hold the model's lock, so corrections
+    can be learned while an upload's rows are scored on another thread.
+    """
+    
+    def __init__(self):
+        self.classes: List[str] = []
+        self.weights = np.zeros((0, FEATURE_DIMS), dtype=np.float32)
+        self.bias = np.zeros(0, dtype=np.float32)
+        self.examples = 0
+        self.lock = threading.Lock()
+    
+    def _class_index(self, name: str) -> int:
+        if name not in self.classes:
+            # Grow the weights before the class is visible
+            self.weights = np.vstack([self.weights, np.zeros((1, FEATURE_DIMS), dtype=np.float32)])
+            self.bias = np.append(self.bias, np.float32(0.0))
+            self.classes.append(name)
+        return self.classes.index(name)
+    
+    def partial_fit(self, examples: List[Tuple[str, str]], epochs: int = 1, learning_rate: float = 0.5):
+        """One or more SGD passes over (description, category name) pairs"""
+        columns, values, lengths = featurize_texts([normalize(description) for description, _ in examples])
+        bounds = np.cumsum(lengths)[:-1]
+        features = zip(np.split(columns, bounds), np.split(values, bounds))
+        with self.lock:
+            prepared = [(feature, self._class_index(name)) for feature, (_, name) in zip(features, examples)]
+            for _ in range(epochs):
+                random.shuffle(prepared)
+                for (columns, values), label in prepared:
+                    if len(columns) == 0:
+                        continue
+                    scores = self.weights[:, columns] @ values + self.bias
+                    probabilities = np.exp(scores - scores.max())
+                    probabilities /= probabilities.sum()
+                    probabilities[label] -= 1.0
+                    self.weights[:, columns] -= learning_rate * np.outer(probabilities, values)
+                    self.bias -= learning_rate * probabilities
+            self.examples += len(prepared)
+    
+    def predict(self, descriptions: List[str], allowed: List[str]) -> List[Optional[Tuple[str, float]]]:
+        """Best allowed category and its probability for each description (None if featureless)"""
+        with self.lock:
+            allowed_index = [i for i, name in enumerate(self.classes) if name in allowed]
+            names = [self.classes[i] for i in allowed_index]
+            # Feature-major copy of the allowed rows: scoring gathers whole rows, and runs without the lock
+            weights = np.ascontiguousarray(self.weights[allowed_index].T)
+            bias = self.bias[allowed_index]
+        if not names or not descriptions:
+            return [None] * len(descriptions)
+        
+        # Statements repeat merchants; score each normalized description once
+        texts = [normalize(description) for description in descriptions]
+        unique = [text for text in dict.fromkeys(texts) if text]
+        scored: Dict[str, Tuple[str, float]] = {}
+        for start in range(0, len(unique), PREDICT_CHUNK):
+            chunk = unique[start:start + PREDICT_CHUNK]
+            columns, values, lengths = featurize_texts(chunk)
+            offsets = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+            
+            # Sparse rows x dense weights, summed per row in one vectorized pass
+            scores = np.add.reduceat(weights[columns] * values[:, None], offsets, axis=0) + bias
+            scores -= scores.max(axis=1, keepdims=True)
+            probabilities = np.exp(scores)
+            probabilities /= probabilities.sum(axis=1, keepdims=True)
+            best = probabilities.argmax(axis=1)
+            for row, text in enumerate(chunk):
+                scored[text] = (names[best[row]], float(probabilities[row, best[row]]))
+        
+        return [scored.get(text) for text in texts]
+
+class LocalClassifier:
+    """
+    CPU-only categorizer tier trained from the user's own labeled transactions.
+    Rows it scores at or above the threshold are categorized locally; the rest
+    go on to the LLM.
+    """
+    
+    def __init__(self):
+        self.threshold = float(os.getenv("LOCAL_CLASSIFIER_THRESHOLD", "0.9"))
+        self.min_examples = int(os.getenv("LOCAL_CLASSIFIER_MIN_EXAMPLES", "50"))
+        self.max_training_rows = int(os.getenv("LOCAL_CLASSIFIER_MAX_ROWS", "20000"))
+        # Models of the most recently active users; an evicted one is retrained on next use
+        self.max_users = int(os.getenv("LOCAL_CLASSIFIER_MAX_USERS", "100"))
+        # user -> (shared generation the model was trained at, model)
+        self._models: "OrderedDict[str, Tuple[int, SoftmaxModel]]" = OrderedDict()
+        # Models are looked up from to_thread workers and updated from the event loop
+        self._lock = threading.Lock()
+        on_local_bump(self._adopt_generation)
+    
+    def _adopt_generation(self, user_id: str, generation: int):
+        """
+        Corrections made in this worker reach the model through learn(), so it
+        only needs retraining when another worker moved the generation too
+        """
+        with self._lock:
+            cached = self._models.get(user_id)
+            if cached is not None and cached[0] == generation - 1:
+                self._models[user_id] = (generation, cached[1])
+    
+    def _model(self, db: Session, user_id: str) -> SoftmaxModel:
+        """
+        The user's model, trained from stored transactions on first use and
+        again after another worker records corrections for the user
+        """
+        generation = generations().get(user_id)
+        with self._lock:
+            cached = self._models.get(user_id)
+            if cached is not None and cached[0] == generation:
+                self._models.move_to_end(user_id)
+                return cached[1]
+        
+        # Trained outside the lock so other users' uploads aren't held up
+        rows = db.query(Transaction.description, Category.name).join(
+            Category, Transaction.category_id == Category.id
+        ).filter(
+            Transaction.user_id == user_id,
+            Transaction.needs_review == False,
+            Transaction.confidence_score >= MIN_TRAINING_CONFIDENCE,
+            or_(Transaction.category_source.in_(TRAINING_SOURCES), Transaction.category_source == None)
+        ).order_by(Transaction.id.desc()).limit(self.max_training_rows).all()
+        
+        model = SoftmaxModel()
+        if rows:
+            model.partial_fit([(description, name) for description, name in rows], epochs=3)
+        with self._lock:
+            self._models[user_id] = (generation, model)
+            self._models.move_to_end(user_id)
+            while len(self._models) > self.max_users:
+                self._models.popitem(last=False)
+        return model
+    
+    def categorize(self, db: Session, user_id: str, transactions: List[Dict[str, Any]], categories: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Categorize what the model is confident about.
+        Returns the transactions that still need the LLM.
+        """
+        model = self._model(db, user_id)
+        # A model that has only ever seen one category would be "certain" of everything
+        if model.examples < self.min_examples or len(model.classes) < 2 or not transactions:
+            return transactions
+        
+        allowed = [cat["name"] for cat in categories]
+        predictions = model.predict([t["description"] for t in transactions], allowed)
+        
+        remaining = []
+        for transaction, prediction in zip(transactions, predictions):
+            if prediction is None or prediction[1] < self.threshold:
+                remaining.append(transaction)
+                continue
+            
+            category_name, confidence = prediction
+            transaction.update({
+                "category_name": category_name,
+                "confidence_score": confidence,
+                "needs_review": confidence < 0.7,
+                "reasoning": "Matched by the local model trained on your transactions",
+                "category_source": "classifier"
+            })
+        return remaining
+    
+    def learn(self, user_id: str, examples: List[Tuple[str, str]]):
+        """
+        Update the user's model with new (description, category name) labels.
+        A model that isn't loaded yet picks them up from the database on first use.
+        """
+        with self._lock:
+            cached = self._models.get(user_id)
+        if cached is not None and examples:
+            cached[1].partial_fit(examples)
+    
+    def learn_from_transactions(self, user_id: str, transactions: List[Dict[str, Any]]):
+        """Learn from freshly categorized transactions that meet the training bar"""
+        self.learn(user_id, [
+            (t["description"], t["category_name"])
+            for t in transactions
+            if t.get("category_source") in TRAINING_SOURCES
+            and not t["needs_review"]
+            and t["confidence_score"] >= MIN_TRAINING_CONFIDENCE
+        ])
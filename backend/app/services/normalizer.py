@@ -0,0 +1,182 @@
+import math
+import re
+from datetime import datetime
+from typing import List, Dict, Any, Callable, Optional, Sequence
+
+# Date formats tried, in order, when inferring a column's format
+DATE_FORMATS = [
+    (re.compile(r"^(\d{4})-(\d{1,2})-(\d{1,2})"), ("y", "m", "d")),
+    (re.compile(r"^(\d{4})/(\d{1,2})/(\d{1,2})"), ("y", "m", "d")),
+    (re.compile(r"^(\d{1,2})/(\d{1,2})/(\d{4})"), ("m", "d", "y")),
+    (re.compile(r"^(\d{1,2})-(\d{1,2})-(\d{4})"), ("m", "d", "y")),
+    (re.compile(r"^(\d{1,2})/(\d{1,2})/(\d{2})$"), ("m", "d", "yy")),
+    (re.compile(r"^(\d{1,2})/(\d{1,2})/(\d{4})"), ("d", "m", "y")),
+    (re.compile(r"^(\d{1,2})\.(\d{1,2})\.(\d{4})"), ("d", "m", "y")),
+    (re.compile(r"^(\d{4})(\d{2})(\d{2})"), ("y", "m", "d")),
+]
+
+# Distinct values of a column each candidate format is scored on
+DATE_SAMPLE_SIZE = 200
+
+AMOUNT_JUNK = re.compile(r"[^\d.,\-]")
+# A comma followed only by one or two digits is a decimal comma (1.234,56)
+DECIMAL_COMMA = re.compile(r",\d{1,2}$")
+MINUS_SIGNS = str.maketrans({"\u2212": "-", "\u2013": "-"})
+
+def _date_parser(date_format) -> Callable[[str], Optional[datetime]]:
+    """Compile one date format into a parser for single values"""
+    pattern, order = date_format
+    match = pattern.match
+    two_digit_year = "yy" in order
+    year_index = order.index("yy" if two_digit_year else "y")
+    month_index, day_index = order.index("m"), order.index("d")
+    
+    def parse(value: str) -> Optional[datetime]:
+        found = match(value)
+        if not found:
+            return None
+        groups = found.groups()
+        year = int(groups[year_index])
+        if two_digit_year:
+            year += 2000 if year < 70 else 1900
+        try:
+            return datetime(year, int(groups[month_index]), int(groups[day_index]))
+        except ValueError:
+            return None
+    
+    return parse
+
+DATE_PARSERS = [_date_parser(date_format) for date_format in DATE_FORMATS]
+
+def infer_date_parser(values: Sequence[str]) -> Optional[Callable[[str], Optional[datetime]]]:
+    """
+    The parser of the format that reads the most of a sample of the values,
+    the earliest listed winning ties; None if no format reads any of them
+    """
+    sample = values[:DATE_SAMPLE_SIZE]
+    best, best_count = None, 0
+    for parser in DATE_PARSERS:
+        count = sum(parser(value) is not None for value in sample)
+        if count > best_count:
+            best, best_count = parser, count
+            if count == len(sample):
+                break
+    return best
+
+def parse_dates(values: Sequence[Any]) -> List[Optional[datetime]]:
+    """
+    Infer one date format for the whole column and apply it to every value.
+    Statements repeat the same few hundred dates, so each distinct value is
+    parsed once. Values the format can't read (and non-strings) become None.
+    """
+    distinct = list(dict.fromkeys(value for value in values if isinstance(value, str)))
+    parser = infer_date_parser([value.strip() for value in distinct])
+    if parser is None:
+        return [None] * len(values)
+    parsed = {value: parser(value.strip()) for value in distinct}
+    return [parsed.get(value) if isinstance(value, str) else None for value in values]
+
+def parse_amount(value: Any) -> Optional[float]:
+    """
+    Read an amount as banks and LLMs write it: plain numbers, "$1,234.56",
+    "(12.00)", "12.00-", "1.234,56", "12.00 DR". None if it isn't an amount.
+    """
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value) if math.isfinite(value) else None
+    if not isinstance(value, str):
+        return None
+    
+    # Most values are plain numbers
+    try:
+        amount = float(value)
+        return amount if math.isfinite(amount) else None
+    except ValueError:
+        pass
+    
+    text = value.strip().translate(MINUS_SIGNS)
+    negative = (text.startswith("(") and text.endswith(")")) or text.upper().endswith("DR")
+    cleaned = AMOUNT_JUNK.sub("", text)
+    if cleaned.endswith("-"):
+        negative = True
+        cleaned = cleaned[:-1]
+    if cleaned.startswith("-"):
+        negative = True
+        cleaned = cleaned[1:]
+    if DECIMAL_COMMA.search(cleaned):
+        cleaned = cleaned.replace(".", "").replace(",", ".")
+    else:
+        cleaned = cleaned.replace(",", "")
+    
+    try:
+        amount = float(cleaned)
+    except ValueError:
+        return None
+    if not math.isfinite(amount):
+        return None
+    return -abs(amount) if negative else amount
+
+def debit_credit_amount(debit: Any, credit: Any) -> Optional[float]:
+    """Signed amount from separate debit (money out) and credit (money in) columns"""
+    debit, credit = parse_amount(debit), parse_amount(credit)
+    if debit is None and credit is None:
+        return None
+    return (credit or 0.0) - abs(debit or 0.0)
+
+def _rejection(row_number: int, field: str, value: Any, reason: str) -> Dict[str, Any]:
+    return {
+        "row": row_number,
+        "field": field,
+        "value": None if value is None else str(value)[:100],
+        "reason": reason
+    }
+
+def normalize_rows(rows: List[Any], rejected: List[Dict[str, Any]], sign: int = 1, row_numbers: Optional[List[int]] = None) -> List[Dict[str, Any]]:
+    """
+    Normalize extracted rows (date, amount or debit/credit, description,
+    account_info) column by column, with one date format for all of them.
+    Dates become datetimes and amounts signed floats (times `sign`, for
+    exports that list charges as positive). Rows that can't be normalized
+    are left out and described in `rejected`, numbered by `row_numbers`
+    (1-based positions by default).
+    """
+    if row_numbers is None:
+        row_numbers = list(range(1, len(rows) + 1))
+    records = []
+    for row, row_number in zip(rows, row_numbers):
+        if isinstance(row, dict):
+            records.append((row, row_number))
+        else:
+            rejected.append(_rejection(row_number, "row", row, "not a transaction"))
+    
+    dates = parse_dates([row.get("date") for row, _ in records])
+    
+    transactions = []
+    for (row, row_number), date in zip(records, dates):
+        if "amount" in row or not ("debit" in row or "credit" in row):
+            amount = parse_amount(row.get("amount"))
+            if amount is not None:
+                amount *= sign
+        else:
+            amount = debit_credit_amount(row.get("debit"), row.get("credit"))
+        description = str(row.get("description") or "").strip()
+        
+        if date is None:
+            reason = "missing date" if not row.get("date") else "unrecognized date"
+            rejected.append(_rejection(row_number, "date", row.get("date"), reason))
+        elif amount is None:
+            value = row.get("amount", row.get("debit", row.get("credit")))
+            reason = "missing amount" if value in (None, "") else "unrecognized amount"
+            rejected.append(_rejection(row_number, "amount", value, reason))
+        elif not description:
+            rejected.append(_rejection(row_number, "description", None, "missing description"))
+        else:
+            transactions.append({
+                "date": date,
+                "amount": amount,
+                "description": description,
+                "account_info": row.get("account_info") or ""
+            })
+    
+    return transactions
@@ -0,0 +1,85 @@
+import asyncio
+import time
+from collections import OrderedDict, deque
+from typing import Deque, Hashable, Optional, Tuple
+
+class RateLimiter:
+    """
+    Token-bucket limiter for LLM calls.
+    
+    Keeps two buckets - requests per minute and tokens per minute - and makes
+    callers wait until both have enough capacity. Waiters are served in FIFO
+    order so one large request can't be starved by many small ones. Callers
+    may pass a key (e.g. the user id): waiters are then served round-robin
+    across keys, so one user's bulk import can't hold up everyone else, while
+    a user alone still gets the whole budget.
+    """
+    
+    def __init__(self, requests_per_minute: int, tokens_per_minute: int):
+        self.requests_per_minute = max(1, requests_per_minute)
+        self.tokens_per_minute = max(1, tokens_per_minute)
+        self._requests = float(self.requests_per_minute)
+        self._tokens = float(self.tokens_per_minute)
+        self._updated = time.monotonic()
+        self._waiters: "OrderedDict[Hashable, Deque[Tuple[int, asyncio.Future]]]" = OrderedDict()
+        self._dispatcher: Optional[asyncio.Task] = None
+    
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self._updated
+        self._updated = now
+        self._requests = min(
+            self.requests_per_minute,
+            self._requests + elapsed * self.requests_per_minute / 60.0
+        )
+        self._tokens = min(
+            self.tokens_per_minute,
+            self._tokens + elapsed * self.tokens_per_minute / 60.0
+        )
+    
+    async def acquire(self, tokens: int = 0, key: Hashable = None):
+        """Wait until one request and `tokens` tokens are available, then take them"""
+        # A single call can never need more than a full bucket
+        tokens = min(max(0, tokens), self.tokens_per_minute)
+        
+        loop = asyncio.get_running_loop()
+        waiter = loop.create_future()
+        self._waiters.setdefault(key, deque()).append((tokens, waiter))
+        if self._dispatcher is None or self._dispatcher.done() or self._dispatcher.get_loop() is not loop:
+            self._dispatcher = asyncio.ensure_future(self._dispatch())
+        await waiter
+    
+    async def _dispatch(self):
+        """Grant capacity to one waiter per key in turn until nobody is waiting"""
+        while self._waiters:
+            key, queue = next(iter(self._waiters.items()))
+            tokens, waiter = queue.popleft()
+            # Move this key to the back of the rotation (or drop it once drained)
+            del self._waiters[key]
+            if queue:
+                self._waiters[key] = queue
+            # Skip cancelled callers and any left behind by a closed event loop
+            if waiter.done() or waiter.get_loop() is not asyncio.get_running_loop():
+                continue
+            
+            while True:
+                self._refill()
+                if self._requests >= 1 and self._tokens >= tokens:
+                    break
+                wait_requests = (1 - self._requests) * 60.0 / self.requests_per_minute
+                wait_tokens = (tokens - self._tokens) * 60.0 / self.tokens_per_minute
+                await asyncio.sleep(max(wait_requests, wait_tokens, 0.001))
+            
+            # The caller may have been cancelled while we waited for capacity
+            if not waiter.done():
+                self._requests -= 1
+                self._tokens -= tokens
+                waiter.set_result(None)
+    
+    def record_usage(self, estimated_tokens: int, actual_tokens: int):
+        """Correct the token bucket once the real usage of a call is known"""
+        self._refill()
+        self._tokens = min(
+            self.tokens_per_minute,
+            self._tokens + estimated_tokens - actual_tokens
+        )
@@ -0,0 +1,307 @@
+import argparse
+import bisect
+import json
+import math
+import os
+import statistics
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, List, Any, Iterable, Optional, Tuple
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.orm import Session
+
+from ..database import Category, RecurringSeries, Transaction
+from .category_cache import normalize_description
+
+# Most recent dates kept per merchant; the interval comes from the gaps between them
+RECURRING_WINDOW = int(os.getenv("RECURRING_WINDOW", "13"))
+RECURRING_MIN_OCCURRENCES = int(os.getenv("RECURRING_MIN_OCCURRENCES", "3"))
+
+# (cadence, shortest and longest median gap in days)
+CADENCES = (
+    ("weekly", 6, 8),
+    ("biweekly", 13, 16),
+    ("monthly", 27, 33),
+    ("quarterly", 85, 95),
+    ("yearly", 355, 375),
+)
+# Share of gaps that must sit near the median gap
+INTERVAL_REGULARITY = 0.75
+# Largest amount spread (standard deviation / |mean|) for a recurring series,
+# and for a fixed-price subscription rather than a varying bill
+AMOUNT_VARIATION = 0.25
+SUBSCRIPTION_VARIATION = 0.02
+
+def amount_stddev(series: RecurringSeries) -> float:
+    if series.count < 2:
+        return 0.0
+    return math.sqrt(max(series.amount_m2, 0.0) / (series.count - 1))
+
+def _classify(series: RecurringSeries):
+    """Derive the interval, cadence, recurring flag and next expected date from the running state"""
+    series.interval_days = series.cadence = series.next_expected = None
+    series.is_recurring = False
+    
+    dates = [datetime.fromisoformat(day) for day in json.loads(series.recent_dates)]
+    gaps = [(later - earlier).days for earlier, later in zip(dates, dates[1:])]
+    if series.count < RECURRING_MIN_OCCURRENCES or len(gaps) < RECURRING_MIN_OCCURRENCES - 1:
+        return
+    
+    interval = statistics.median(gaps)
+    series.interval_days = float(interval)
+    series.cadence = next((name for name, shortest, longest in CADENCES if shortest <= interval <= longest), None)
+    if series.cadence is None:
+        return
+    
+    tolerance = max(2.0, interval * 0.25)
+    regular = sum(abs(gap - interval) <= tolerance for gap in gaps) >= INTERVAL_REGULARITY * len(gaps)
+    steady = amount_stddev(series) <= AMOUNT_VARIATION * abs(series.amount_mean)
+    series.is_recurring = regular and steady
+    if series.is_recurring:
+        series.next_expected = series.last_date + timedelta(days=interval)
+
+def _fold(series: RecurringSeries, rows: List[Dict[str, Any]]):
+    """Add rows of one merchant to its running state"""
+    dates = json.loads(series.recent_dates or "[]")
+    for row in rows:
+        amount = row["amount"]
+        series.count = (series.count or 0) + 1
+        delta = amount - (series.amount_mean or 0.0)
+        series.amount_mean = (series.amount_mean or 0.0) + delta / series.count
+        series.amount_m2 = (series.amount_m2 or 0.0) + delta * (amount - series.amount_mean)
+        
+        bisect.insort(dates, row["date"].date().isoformat())
+        if len(dates) > RECURRING_WINDOW:
+            del dates[0]
+        if series.last_date is None or row["date"] >= series.last_date:
+            series.last_date = row["date"]
+            series.last_amount = amount
+            series.description = row["description"]
+            series.category_id = row["category_id"]
+    series.recent_dates = json.dumps(dates)
+    _classify(series)
+
+def _unfold(series: RecurringSeries, rows: List[Dict[str, Any]]):
+    """Take deleted rows of one merchant back out of its running state"""
+    dates = json.loads(series.recent_dates or "[]")
+    for row in rows:
+        amount = row["amount"]
+        if series.count <= 1:
+            series.count = 0
+            break
+        # Welford's update run backwards
+        previous_mean = (series.count * series.amount_mean - amount) / (series.count - 1)
+        series.amount_m2 = max(0.0, series.amount_m2 - (amount - previous_mean) * (amount - series.amount_mean))
+        series.amount_mean = previous_mean
+        series.count -= 1
+        
+        day = row["date"].date().isoformat()
+        if day in dates:
+            dates.remove(day)
+        if row["date"] == series.last_date and dates:
+            series.last_date = datetime.fromisoformat(dates[-1])
+    series.recent_dates = json.dumps(dates)
+    _classify(series)
+
+def _by_merchant(rows: Iterable[Dict[str, Any]]) -> Dict[str, List[Dict[str, Any]]]:
+    grouped = defaultdict(list)
+    for row in rows:
+        key = normalize_description(row["description"])
+        if key:
+            grouped[key].append(row)
+    return grouped
+
+def _locked_series(db: Session, user_id: str, keys: List[str]) -> Dict[str, RecurringSeries]:
+    series = {}
+    for start in range(0, len(keys), 500):
+        for row in db.scalars(
+            select(RecurringSeries)
+            .where(RecurringSeries.user_id == user_id, RecurringSeries.merchant_key.in_(keys[start:start + 500]))
+            .with_for_update()
+        ):
+            series[row.merchant_key] = row
+    return series
+
+def _create_missing(db: Session, user_id: str, keys: List[str]):
+    """Insert empty series for new merchants, tolerating ones a concurrent upload just created"""
+    dialect = db.get_bind().dialect.name
+    if dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    elif dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    else:
+        dialect_insert = None
+    
+    if dialect_insert is not None:
+        statement = dialect_insert(RecurringSeries.__table__).on_conflict_do_nothing(index_elements=["user_id", "merchant_key"])
+    else:
+        existing = set(_locked_series(db, user_id, keys))
+        keys = [key for key in keys if key not in existing]
+        statement = insert(RecurringSeries.__table__)
+    if keys:
+        db.execute(statement, [
+            {"user_id": user_id, "merchant_key": key, "count": 0, "amount_mean": 0.0, "amount_m2": 0.0, "recent_dates": "[]"}
+            for key in keys
+        ])
+
+def add_rows(db: Session, user_id: str, rows: List[Dict[str, Any]]):
+    """
+    Fold newly inserted transaction rows into their merchants' series. Only the
+    merchants in `rows` are read and written, so the cost follows the upload,
+    not the history. The caller commits, together with the rows.
+    """
+    grouped = _by_merchant(rows)
+    if not grouped:
+        return
+    keys = sorted(grouped)
+    _create_missing(db, user_id, keys)
+    series = _locked_series(db, user_id, keys)
+    for key, merchant_rows in grouped.items():
+        _fold(series[key], merchant_rows)
+    db.flush()
+
+def remove_rows(db: Session, user_id: str, rows: List[Dict[str, Any]]):
+    """Take deleted transaction rows out of their merchants' series; the caller commits"""
+    grouped = _by_merchant(rows)
+    series = _locked_series(db, user_id, sorted(grouped))
+    for key, merchant_rows in grouped.items():
+        merchant_series = series.get(key)
+        if merchant_series is None:
+            continue
+        _unfold(merchant_series, merchant_rows)
+        if merchant_series.count <= 0:
+            db.delete(merchant_series)
+    db.flush()
+
+def set_category(db: Session, user_id: str, changes: Iterable[Tuple[str, Optional[int]]]):
+    """Show recategorized merchants, given as (description, category_id), under their new category"""
+    keys_by_category = defaultdict(set)
+    for description, category_id in changes:
+        key = normalize_description(description)
+        if key:
+            keys_by_category[category_id].add(key)
+    for category_id, keys in keys_by_category.items():
+        db.execute(
+            update(RecurringSeries)
+            .where(RecurringSeries.user_id == user_id, RecurringSeries.merchant_key.in_(keys))
+            .values(category_id=category_id)
+            .execution_options(synchronize_session=False)
+        )
+
+def rebuild(db: Session, user_id: Optional[str] = None) -> int:
+    """
+    Recompute the series from the transactions table, for everyone or one user.
+    Returns the number of series written. The caller commits.
+    """
+    stale = delete(RecurringSeries)
+    users = select(Transaction.user_id).distinct()
+    if user_id is not None:
+        stale = stale.where(RecurringSeries.user_id == user_id)
+        users = users.where(Transaction.user_id == user_id)
+    db.execute(stale)
+    
+    written = 0
+    # One user at a time keeps memory bounded by the largest history
+    for (owner,) in db.execute(users).all():
+        rows = db.execute(
+            select(Transaction.date, Transaction.amount, Transaction.description, Transaction.category_id)
+            .where(Transaction.user_id == owner)
+            .order_by(Transaction.date, Transaction.id)
+        )
+        grouped = _by_merchant(row._asdict() for row in rows)
+        for key, merchant_rows in grouped.items():
+            series = RecurringSeries(user_id=owner, merchant_key=key, count=0, amount_mean=0.0, amount_m2=0.0, recent_dates="[]")
+            _fold(series, merchant_rows)
+            db.add(series)
+        db.flush()
+        written += len(grouped)
+    return written
+
+def ensure_recurring(db: Session):
+    """Backfill the series of a database whose transactions predate the recurring_series table"""
+    has_series = db.query(RecurringSeries.id).first() is not None
+    if not has_series and db.query(Transaction.id).first() is not None:
+        rebuild(db)
+        db.commit()
+
+def list_recurring(db: Session, user_id: str, days: int = 30, include_inactive: bool = False, now: Optional[datetime] = None) -> Dict[str, Any]:
+    """
+    The user's recurring series and the charges expected in the next `days`
+    days, read from the precomputed table. A series whose charge is overdue
+    by more than half an interval has lapsed (e.g. a cancelled subscription).
+    """
+    now = now or datetime.now()
+    horizon = now + timedelta(days=days)
+    rows = db.execute(
+        select(RecurringSeries, Category.name)
+        .outerjoin(Category, RecurringSeries.category_id == Category.id)
+        .where(RecurringSeries.user_id == user_id, RecurringSeries.is_recurring == True)
+        .order_by(RecurringSeries.next_expected)
+    ).all()
+    
+    result = []
+    upcoming = []
+    for series, category_name in rows:
+        interval = timedelta(days=series.interval_days)
+        active = series.next_expected + max(timedelta(days=3), interval / 2) >= now
+        if not active and not include_inactive:
+            continue
+        
+        spread = amount_stddev(series) / abs(series.amount_mean) if series.amount_mean else 0.0
+        if series.amount_mean > 0:
+            kind = "income"
+        else:
+            kind = "subscription" if spread <= SUBSCRIPTION_VARIATION else "bill"
+        result.append({
+            "id": series.id,
+            "description": series.description,
+            "merchant": series.merchant_key,
+            "category": category_name or "Uncategorized",
+            "category_id": series.category_id,
+            "kind": kind,
+            "cadence": series.cadence,
+            "interval_days": series.interval_days,
+            "occurrences": series.count,
+            "average_amount": round(series.amount_mean, 2),
+            "amount_stddev": round(amount_stddev(series), 2),
+            "last_amount": series.last_amount,
+            "last_date": series.last_date.isoformat(),
+            "next_expected": series.next_expected.isoformat(),
+            "active": active
+        })
+        
+        if active:
+            expected = series.next_expected
+            while expected <= horizon:
+                upcoming.append({
+                    "series_id": series.id,
+                    "description": series.description,
+                    "date": expected.isoformat(),
+                    "amount": series.last_amount,
+                    "overdue": expected < now
+                })
+                expected += interval
+    
+    upcoming.sort(key=lambda charge: charge["date"])
+    return {
+        "series": result,
+        "upcoming": upcoming,
+        "upcoming_total": round(sum(charge["amount"] for charge in upcoming), 2),
+        "days": days
+    }
+
+if __name__ == "__main__":
+    from ..database import SessionLocal, ensure_schema
+    
+    parser = argparse.ArgumentParser(description="Rebuild the recurring series from the transactions table")
+    parser.add_argument("--user", help="Only rebuild this user's series")
+    args = parser.parse_args()
+    
+    ensure_schema()
+    db = SessionLocal()
+    try:
+        series = rebuild(db, args.user)
+        db.commit()
+        print(f"Rebuilt {series} recurring series")
+    finally:
+        db.close()
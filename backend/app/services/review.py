@@ -0,0 +1,91 @@
+from typing import Dict, List, Any, Tuple
+from sqlalchemy import select, update
+from sqlalchemy.orm import Session
+
+from ..database import Category, Transaction
+from .category_cache import CategoryCache, normalize_description
+from . import recurring, rollups
+
+def resolve(
+    db: Session,
+    user_id: str,
+    corrections: List[Tuple[int, int]],
+    apply_to_similar: bool,
+    category_cache: CategoryCache
+) -> Dict[str, Any]:
+    """
+    Apply (transaction id, category id) corrections in one batched UPDATE.
+    With apply_to_similar, each correction also settles every other row still
+    awaiting review with the same normalized merchant. Corrections are stored
+    in the merchant cache so later uploads of those merchants skip review.
+    Raises ValueError for categories the user doesn't have; the caller commits.
+    """
+    categories = {
+        category.id: category.name
+        for category in db.scalars(select(Category).where(Category.user_id == user_id))
+    }
+    unknown = sorted({category_id for _, category_id in corrections if category_id not in categories})
+    if unknown:
+        raise ValueError(f"Unknown categories: {', '.join(str(category_id) for category_id in unknown)}")
+    
+    # Later corrections of the same row win
+    wanted = dict(corrections)
+    rows = db.execute(
+        select(Transaction.id, Transaction.date, Transaction.description, Transaction.category_id)
+        .where(Transaction.user_id == user_id, Transaction.id.in_(wanted))
+    ).all()
+    changes = {row.id: (row, wanted[row.id]) for row in rows}
+    not_found = sorted(set(wanted) - set(changes))
+    
+    similar = 0
+    if apply_to_similar and changes:
+        # A merchant corrected to two different categories in one batch is ambiguous; leave its other rows alone
+        merchants: Dict[str, set] = {}
+        for row, category_id in changes.values():
+            merchants.setdefault(normalize_description(row.description), set()).add(category_id)
+        targets = {key: ids.pop() for key, ids in merchants.items() if key and len(ids) == 1}
+        
+        pending = db.execute(
+            select(Transaction.id, Transaction.date, Transaction.description, Transaction.category_id)
+            .where(Transaction.user_id == user_id, Transaction.needs_review == True)
+        )
+        for row in pending:
+            if row.id in changes:
+                continue
+            category_id = targets.get(normalize_description(row.description))
+            if category_id is not None:
+                changes[row.id] = (row, category_id)
+                similar += 1
+    
+    if changes:
+        db.execute(update(Transaction), [
+            {
+                "id": transaction_id,
+                "category_id": category_id,
+                "confidence_score": 1.0,
+                "needs_review": False,
+                "category_source": "user"
+            }
+            for transaction_id, (_, category_id) in changes.items()
+        ])
+        rollups.refresh_cells(db, user_id, [
+            (row.date, category_id)
+            for row, new_category_id in changes.values()
+            for category_id in (row.category_id, new_category_id)
+        ])
+        recurring.set_category(db, user_id, [
+            (row.description, category_id) for row, category_id in changes.values() if category_id != row.category_id
+        ])
+        category_data = [{"id": category_id, "name": name} for category_id, name in categories.items()]
+        category_cache.record_corrections(db, user_id, [
+            (row.description, categories[category_id]) for row, category_id in changes.values()
+        ], category_data)
+    
+    return {
+        "updated": len(changes),
+        "corrected": len(changes) - similar,
+        "applied_to_similar": similar,
+        "not_found": not_found,
+        # (description, category name) labels for the local classifier
+        "examples": [(row.description, categories[category_id]) for row, category_id in changes.values()]
+    }
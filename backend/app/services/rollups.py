@@ -0,0 +1,171 @@
+import argparse
+from datetime import datetime
+from typing import Dict, List, Any, Iterable, Optional, Tuple
+from sqlalchemy import case, delete, func, insert, or_, select
+from sqlalchemy.orm import Session
+
+from ..database import MonthlyRollup, Transaction
+from .analytics import month_bounds, period_expression
+
+# Rollup category_id for transactions without a category
+UNCATEGORIZED = 0
+
+ROLLUP_COLUMNS = [
+    "user_id", "month", "category_id", "total", "count",
+    "min_amount", "max_amount", "spent", "spent_count", "income"
+]
+
+def month_key(date: datetime) -> str:
+    return date.strftime("%Y-%m")
+
+def _aggregate(user_id: str, rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Collapse transaction rows into one rollup delta per (month, category)"""
+    cells: Dict[Tuple[str, int], Dict[str, Any]] = {}
+    for row in rows:
+        amount = row["amount"]
+        key = (month_key(row["date"]), row["category_id"] or UNCATEGORIZED)
+        cell = cells.get(key)
+        if cell is None:
+            cell = cells[key] = {
+                "user_id": user_id,
+                "month": key[0],
+                "category_id": key[1],
+                "total": 0.0,
+                "count": 0,
+                "min_amount": amount,
+                "max_amount": amount,
+                "spent": 0.0,
+                "spent_count": 0,
+                "income": 0.0
+            }
+        cell["total"] += amount
+        cell["count"] += 1
+        cell["min_amount"] = min(cell["min_amount"], amount)
+        cell["max_amount"] = max(cell["max_amount"], amount)
+        if amount < 0:
+            cell["spent"] -= amount
+            cell["spent_count"] += 1
+        elif amount > 0:
+            cell["income"] += amount
+    return list(cells.values())
+
+def add_rows(db: Session, user_id: str, rows: List[Dict[str, Any]]):
+    """
+    Fold newly inserted transaction rows into the rollup with one upsert per
+    affected (month, category). The caller commits, together with the rows.
+    """
+    deltas = _aggregate(user_id, rows)
+    if not deltas:
+        return
+    
+    dialect = db.get_bind().dialect.name
+    if dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        least, greatest = func.min, func.max
+    elif dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        least, greatest = func.least, func.greatest
+    else:
+        refresh_cells(db, user_id, [(row["date"], row["category_id"]) for row in rows])
+        return
+    
+    table = MonthlyRollup.__table__
+    statement = dialect_insert(table)
+    statement = statement.on_conflict_do_update(
+        index_elements=["user_id", "month", "category_id"],
+        set_={
+            "total": table.c.total + statement.excluded.total,
+            "count": table.c.count + statement.excluded.count,
+            "min_amount": least(table.c.min_amount, statement.excluded.min_amount),
+            "max_amount": greatest(table.c.max_amount, statement.excluded.max_amount),
+            "spent": table.c.spent + statement.excluded.spent,
+            "spent_count": table.c.spent_count + statement.excluded.spent_count,
+            "income": table.c.income + statement.excluded.income
+        }
+    )
+    db.execute(statement, deltas)
+
+def rebuild(db: Session, user_id: Optional[str] = None, months: Optional[Iterable[str]] = None, category_ids: Optional[Iterable[int]] = None) -> int:
+    """
+    Recompute rollup cells from the transactions table: everything by default,
+    or only the given user / months / categories. Returns the number of cells written.
+    The caller commits.
+    """
+    month_label = period_expression(db, "month")
+    category_label = func.coalesce(Transaction.category_id, UNCATEGORIZED)
+    
+    stale = delete(MonthlyRollup)
+    source = select(
+        Transaction.user_id,
+        month_label,
+        category_label,
+        func.sum(Transaction.amount),
+        func.count(Transaction.id),
+        func.min(Transaction.amount),
+        func.max(Transaction.amount),
+        func.coalesce(func.sum(case((Transaction.amount < 0, -Transaction.amount), else_=0.0)), 0.0),
+        func.coalesce(func.sum(case((Transaction.amount < 0, 1), else_=0)), 0),
+        func.coalesce(func.sum(case((Transaction.amount > 0, Transaction.amount), else_=0.0)), 0.0)
+    ).group_by(Transaction.user_id, month_label, category_label)
+    
+    if user_id is not None:
+        stale = stale.where(MonthlyRollup.user_id == user_id)
+        source = source.where(Transaction.user_id == user_id)
+    if months is not None:
+        months = sorted(set(months))
+        stale = stale.where(MonthlyRollup.month.in_(months))
+        # The date range lets the (user_id, date) index narrow the scan
+        source = source.where(
+            Transaction.date >= month_bounds(months[0])[0],
+            Transaction.date < month_bounds(months[-1])[1],
+            month_label.in_(months)
+        )
+    if category_ids is not None:
+        category_ids = set(category_ids)
+        stale = stale.where(MonthlyRollup.category_id.in_(category_ids))
+        categorized = [category_id for category_id in category_ids if category_id != UNCATEGORIZED]
+        conditions = [Transaction.category_id.in_(categorized)]
+        if UNCATEGORIZED in category_ids:
+            conditions.append(Transaction.category_id.is_(None))
+        source = source.where(or_(*conditions))
+    
+    db.execute(stale)
+    result = db.execute(insert(MonthlyRollup.__table__).from_select(ROLLUP_COLUMNS, source))
+    return max(result.rowcount, 0)
+
+def refresh_cells(db: Session, user_id: str, changes: Iterable[Tuple[datetime, Optional[int]]]):
+    """
+    Recompute the cells touched by changed rows, given as (date, category_id).
+    Used where a delta isn't enough: recategorized or deleted rows may have been
+    a cell's min or max. Call after the change is flushed.
+    """
+    changes = list(changes)
+    if changes:
+        rebuild(
+            db, user_id,
+            months={month_key(date) for date, _ in changes},
+            category_ids={category_id or UNCATEGORIZED for _, category_id in changes}
+        )
+
+def ensure_rollups(db: Session):
+    """Backfill the rollups of a database whose transactions predate the rollup table"""
+    has_rollups = db.query(MonthlyRollup.id).first() is not None
+    if not has_rollups and db.query(Transaction.id).first() is not None:
+        rebuild(db)
+        db.commit()
+
+if __name__ == "__main__":
+    from ..database import SessionLocal, ensure_schema
+    
+    parser = argparse.ArgumentParser(description="Rebuild the monthly rollups from the transactions table")
+    parser.add_argument("--user", help="Only rebuild this user's rollups")
+    args = parser.parse_args()
+    
+    ensure_schema()
+    db = SessionLocal()
+    try:
+        cells = rebuild(db, args.user)
+        db.commit()
+        print(f"Rebuilt {cells} rollup cells")
+    finally:
+        db.close()
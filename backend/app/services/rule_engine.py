@@ -0,0 +1,168 @@
+import bisect
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Any, Optional, Tuple
+from sqlalchemy.orm import Session
+
+from ..database import CategoryRule
+
+# Marks the end of a pattern in the trie; holds the indices of the rules using it
+END = None
+
+class RuleMatcher:
+    """
+    All of one user's rules compiled together.
+    
+    The patterns are merged into a trie, and the trie is rendered as a single
+    regex inside a lookahead, so one scan over the whole batch finds every
+    position where some pattern starts. Walking the trie from those positions
+    then yields each rule that matched, including overlapping ones.
+    """
+    
+    def __init__(self, rules: List[Dict[str, Any]]):
+        # Best rule first: highest priority, then most specific pattern, then oldest
+        self.rules = sorted(rules, key=lambda r: (-r["priority"], -len(r["pattern"]), r["id"]))
+        self.trie: Dict = {}
+        for index, rule in enumerate(self.rules):
+            node = self.trie
+            for char in rule["pattern"].casefold():
+                node = node.setdefault(char, {})
+            node.setdefault(END, []).append(index)
+        
+        body = self._trie_regex(self.trie)
+        self.regex = re.compile(f"(?=(?:{body}))") if body else None
+    
+    def _trie_regex(self, node: Dict) -> str:
+        branches = [
+            re.escape(char) + self._trie_regex(child)
+            for char, child in sorted(node.items(), key=lambda item: item[0] or "")
+            if char is not END
+        ]
+        if not branches:
+            return ""
+        pattern = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        if END in node:
+            pattern = f"(?:{pattern})?"
+        return pattern
+    
+    def match(self, descriptions: List[str], amounts: List[float]) -> List[Optional[Dict[str, Any]]]:
+        """Best matching rule for each row, or None"""
+        matches: List[Optional[Dict[str, Any]]] = [None] * len(descriptions)
+        if self.regex is None or not descriptions:
+            return matches
+        
+        # One scan over the whole batch; rows are separated by a character no pattern contains
+        folded = [str(description).casefold().replace("\n", " ") for description in descriptions]
+        text = "\n".join(folded)
+        row_starts = []
+        offset = 0
+        for description in folded:
+            row_starts.append(offset)
+            offset += len(description) + 1
+        
+        best: List[Optional[int]] = [None] * len(descriptions)
+        for found in self.regex.finditer(text):
+            position = found.start()
+            row = bisect.bisect_right(row_starts, position) - 1
+            amount = amounts[row]
+            
+            node = self.trie
+            for char in folded[row][position - row_starts[row]:]:
+                node = node.get(char)
+                if node is None:
+                    break
+                for index in node.get(END, ()):
+                    if best[row] is not None and best[row] <= index:
+                        continue
+                    rule = self.rules[index]
+                    if rule["min_amount"] is not None and amount < rule["min_amount"]:
+                        continue
+                    if rule["max_amount"] is not None and amount > rule["max_amount"]:
+                        continue
+                    best[row] = index
+        
+        for row, index in enumerate(best):
+            if index is not None:
+                matches[row] = self.rules[index]
+        return matches
+
+class RuleEngine:
+    """
+    Deterministic categorization from user rules, run before the cache, the
+    local model and the LLM. Compiled matchers are cached per user and rebuilt
+    only when the user's rules change.
+    """
+    
+    def __init__(self):
+        self.max_users = int(os.getenv("RULE_CACHE_USERS", "1000"))
+        self._matchers: "OrderedDict[str, Tuple[Tuple, RuleMatcher]]" = OrderedDict()
+        # Matchers are looked up from to_thread workers of concurrent uploads
+        self._lock = threading.Lock()
+    
+    def matcher(self, db: Session, user_id: str) -> RuleMatcher:
+        rows = db.query(
+            CategoryRule.id,
+            CategoryRule.pattern,
+            CategoryRule.category_id,
+            CategoryRule.min_amount,
+            CategoryRule.max_amount,
+            CategoryRule.priority
+        ).filter(CategoryRule.user_id == user_id).order_by(CategoryRule.id).all()
+        
+        # Fingerprint of the rules as stored; any edit, add or delete changes it
+        fingerprint = tuple(tuple(row) for row in rows)
+        with self._lock:
+            cached = self._matchers.get(user_id)
+            if cached is not None and cached[0] == fingerprint:
+                self._matchers.move_to_end(user_id)
+                return cached[1]
+        
+        matcher = RuleMatcher([
+            {
+                "id": row.id,
+                "pattern": row.pattern,
+                "category_id": row.category_id,
+                "min_amount": row.min_amount,
+                "max_amount": row.max_amount,
+                "priority": row.priority or 0
+            }
+            for row in rows if row.pattern
+        ])
+        with self._lock:
+            self._matchers[user_id] = (fingerprint, matcher)
+            self._matchers.move_to_end(user_id)
+            while len(self._matchers) > self.max_users:
+                self._matchers.popitem(last=False)
+        return matcher
+    
+    def apply(self, db: Session, user_id: str, transactions: List[Dict[str, Any]], categories: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Categorize transactions matched by a rule.
+        Returns the transactions no rule applied to.
+        """
+        if not transactions:
+            return transactions
+        
+        matches = self.matcher(db, user_id).match(
+            [t["description"] for t in transactions],
+            [t["amount"] for t in transactions]
+        )
+        category_names = {cat["id"]: cat["name"] for cat in categories}
+        
+        remaining = []
+        for transaction, rule in zip(transactions, matches):
+            category_name = category_names.get(rule["category_id"]) if rule else None
+            if category_name is None:
+                remaining.append(transaction)
+                continue
+            
+            transaction.update({
+                "category_name": category_name,
+                "confidence_score": 1.0,
+                "needs_review": False,
+                "reasoning": f"Matched rule: description contains '{rule['pattern']}'",
+                "category_source": "rule"
+            })
+        return remaining
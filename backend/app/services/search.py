@@ -0,0 +1,118 @@
+import re
+from datetime import datetime
+from typing import List, Optional
+from sqlalchemy import and_, column, func, inspect, literal, literal_column, select, table, true
+
+from ..database import SEARCH_TABLE, Transaction, engine
+from . import listing
+
+MAX_SEARCH_RESULTS = 100
+# Trigram indexes can't look up anything shorter; such terms are LIKE-filtered
+MIN_INDEXED_TERM = 3
+
+TERMS = re.compile(r'"([^"]*)"|(\S+)')
+
+search_table = table(SEARCH_TABLE, column("rowid"))
+
+_index_ready: Optional[bool] = None
+
+def search_terms(q: str) -> List[str]:
+    """Whitespace-separated terms, keeping "quoted phrases" together; every one must match"""
+    return [phrase or word for phrase, word in TERMS.findall(q or "") if (phrase or word).strip()]
+
+def index_ready() -> bool:
+    """Whether the database has the index search relies on (checked once per process)"""
+    global _index_ready
+    if _index_ready is None:
+        if engine.dialect.name == "sqlite":
+            with engine.connect() as conn:
+                _index_ready = inspect(conn).has_table(SEARCH_TABLE)
+        else:
+            # pg_trgm serves ILIKE; without it the same query just scans
+            _index_ready = engine.dialect.name == "postgresql"
+    return _index_ready
+
+def _like(term: str):
+    escaped = term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return Transaction.description.ilike(f"%{escaped}%", escape="\\")
+
+def _fts_match(terms: List[str]) -> str:
+    return " AND ".join('"' + term.replace('"', '""') + '"' for term in terms)
+
+def _use_fts(terms: List[str]) -> List[str]:
+    """The terms the SQLite trigram index can look up"""
+    if engine.dialect.name != "sqlite" or not index_ready():
+        return []
+    return [term for term in terms if len(term) >= MIN_INDEXED_TERM]
+
+def description_filter(q: str):
+    """
+    WHERE clause for descriptions containing every term of `q` (case-insensitive),
+    served by the search index; for listings that keep their own ordering
+    """
+    terms = search_terms(q)
+    if not terms:
+        return true()
+    indexed = _use_fts(terms)
+    clauses = [_like(term) for term in terms if term not in indexed]
+    if indexed:
+        clauses.append(Transaction.id.in_(
+            select(search_table.c.rowid).where(literal_column(SEARCH_TABLE).op("MATCH")(_fts_match(indexed)))
+        ))
+    return and_(*clauses)
+
+def search_query(
+    user_id: str,
+    q: str,
+    limit: int = 50,
+    offset: int = 0,
+    needs_review: Optional[bool] = None,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    category_id: Optional[int] = None,
+    min_amount: Optional[float] = None,
+    max_amount: Optional[float] = None
+):
+    """
+    Ranked search over every row matching all terms and the filters: best
+    match first (bm25 on SQLite, trigram word similarity on Postgres), then
+    newest first. Returns the query and the clamped limit; rows are
+    transaction_rows() plus a "score", higher is better.
+    """
+    terms = search_terms(q)
+    indexed = _use_fts(terms)
+    
+    query = listing.transaction_rows()
+    if indexed:
+        # Driven by the FTS table, which scores each match as it finds it
+        score = -func.bm25(literal_column(SEARCH_TABLE))
+        query = query.join(search_table, search_table.c.rowid == Transaction.id).where(
+            literal_column(SEARCH_TABLE).op("MATCH")(_fts_match(indexed))
+        )
+    elif engine.dialect.name == "postgresql":
+        score = func.word_similarity(" ".join(terms), Transaction.description)
+    else:
+        score = literal(0.0)
+    for term in terms:
+        if term not in indexed:
+            query = query.where(_like(term))
+    
+    score = score.label("score")
+    query = listing.apply_filters(
+        query.add_columns(score), user_id,
+        needs_review=needs_review,
+        start_date=start_date,
+        end_date=end_date,
+        category_id=category_id,
+        min_amount=min_amount,
+        max_amount=max_amount
+    )
+    
+    limit = max(1, min(limit, MAX_SEARCH_RESULTS))
+    query = (
+        query
+        .order_by(score.desc(), Transaction.date.desc(), Transaction.id.desc())
+        .offset(max(0, offset))
+        .limit(limit)
+    )
+    return query, limit
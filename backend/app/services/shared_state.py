@@ -0,0 +1,121 @@
+import hashlib
+import mmap
+import os
+import struct
+import tempfile
+import zlib
+from contextlib import contextmanager
+from typing import Callable, List
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from ..database import DATABASE_URL
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-process deployments only
+    fcntl = None
+
+# Per-host state shared by the worker processes serving one database
+SHARED_STATE_DIR = os.getenv("SHARED_STATE_DIR") or os.path.join(
+    tempfile.gettempdir(),
+    "smart-bud-" + hashlib.sha1(DATABASE_URL.encode("utf-8")).hexdigest()[:12]
+)
+GENERATION_SLOTS = int(os.getenv("SHARED_STATE_SLOTS", "65536"))
+
+SLOT = struct.Struct("<Q")
+
+@contextmanager
+def host_lock(name: str):
+    """Exclusive lock across the processes on this host, e.g. for startup migrations"""
+    os.makedirs(SHARED_STATE_DIR, exist_ok=True)
+    with open(os.path.join(SHARED_STATE_DIR, f"{name}.lock"), "a") as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+class Generations:
+    """
+    Change counters in a memory-mapped file shared by every worker process.
+    
+    Workers keep per-user state in memory (merchant LRU, local models). When a
+    worker changes what that state was built from, it bumps the user's counter
+    once its transaction commits; the other workers compare the counter with
+    the one they saw when they filled their copy, and rebuild it if it moved.
+    Keys hash into a fixed number of slots, so a collision only costs a reload.
+    """
+    
+    def __init__(self, path: str, slots: int = GENERATION_SLOTS):
+        self.slots = slots
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._file = open(path, "a+b")
+        size = slots * SLOT.size
+        with self._locked():
+            if os.fstat(self._file.fileno()).st_size < size:
+                self._file.truncate(size)
+        self._map = mmap.mmap(self._file.fileno(), size)
+    
+    @contextmanager
+    def _locked(self):
+        if fcntl is None:
+            yield
+            return
+        fcntl.flock(self._file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(self._file, fcntl.LOCK_UN)
+    
+    def _offset(self, key: str) -> int:
+        return zlib.crc32(key.encode("utf-8")) % self.slots * SLOT.size
+    
+    def get(self, key: str) -> int:
+        return SLOT.unpack_from(self._map, self._offset(key))[0]
+    
+    def bump(self, key: str) -> int:
+        """Increment a counter; returns its new value"""
+        offset = self._offset(key)
+        with self._locked():
+            generation = SLOT.unpack_from(self._map, offset)[0] + 1
+            SLOT.pack_into(self._map, offset, generation)
+        return generation
+
+_generations: Generations = None
+_bump_listeners: List[Callable[[str, int], None]] = []
+
+def generations() -> Generations:
+    """This process's handle on the shared counters, opened on first use"""
+    global _generations
+    if _generations is None:
+        _generations = Generations(os.path.join(SHARED_STATE_DIR, "generations"))
+    return _generations
+
+def bump_after_commit(db: Session, key: str):
+    """
+    Bump a counter once db's transaction commits. Bumping earlier would let
+    another worker reload the old rows and cache them under the new count.
+    """
+    db.info.setdefault("generation_bumps", set()).add(key)
+
+def on_local_bump(listener: Callable[[str, int], None]):
+    """
+    Call listener(key, generation) after this process bumps a counter. State
+    the process already updated itself can move to the new count instead of
+    being rebuilt as if another worker had changed it.
+    """
+    _bump_listeners.append(listener)
+
+@event.listens_for(Session, "after_commit")
+def _bump_committed(session: Session):
+    for key in session.info.pop("generation_bumps", ()):
+        generation = generations().bump(key)
+        for listener in _bump_listeners:
+            listener(key, generation)
+
+@event.listens_for(Session, "after_rollback")
+def _discard_rolled_back(session: Session):
+    session.info.pop("generation_bumps", None)
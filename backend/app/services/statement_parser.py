@@ -0,0 +1,180 @@
+import csv
+import io
+import re
+from itertools import chain, islice
+from typing import List, Dict, Any, Optional, TextIO
+
+from .normalizer import normalize_rows
+
+# Known bank export layouts, matched on their (lower-cased) header row.
+# "sign" is -1 for exports that list charges as positive numbers.
+BANK_LAYOUTS = [
+    {
+        "name": "Chase Checking",
+        "headers": {"details", "posting date", "description", "amount"},
+        "date": "posting date", "description": "description", "amount": "amount",
+    },
+    {
+        "name": "Chase Credit Card",
+        "headers": {"transaction date", "post date", "description", "amount"},
+        "date": "transaction date", "description": "description", "amount": "amount",
+    },
+    {
+        "name": "Bank of America",
+        "headers": {"date", "description", "amount", "running bal."},
+        "date": "date", "description": "description", "amount": "amount",
+    },
+    {
+        "name": "Capital One",
+        "headers": {"transaction date", "description", "debit", "credit"},
+        "date": "transaction date", "description": "description",
+        "debit": "debit", "credit": "credit", "account": "card no.",
+    },
+    {
+        "name": "Citi",
+        "headers": {"status", "date", "description", "debit", "credit"},
+        "date": "date", "description": "description", "debit": "debit", "credit": "credit",
+    },
+    {
+        "name": "American Express",
+        "headers": {"date", "description", "card member", "amount"},
+        "date": "date", "description": "description", "amount": "amount",
+        "account": "account #", "sign": -1,
+    },
+    {
+        "name": "Discover",
+        "headers": {"trans. date", "post date", "description", "amount", "category"},
+        "date": "trans. date", "description": "description", "amount": "amount", "sign": -1,
+    },
+    {
+        "name": "US Bank",
+        "headers": {"date", "transaction", "name", "memo", "amount"},
+        "date": "date", "description": "name", "amount": "amount",
+    },
+]
+
+# Fallback aliases for exports that don't match a known layout
+COLUMN_ALIASES = {
+    "date": ["date", "transaction date", "trans. date", "trans date", "posting date", "post date", "posted date", "value date", "booking date"],
+    "description": ["description", "merchant", "payee", "name", "details", "transaction description", "memo", "narrative"],
+    "amount": ["amount", "transaction amount", "amount (usd)", "value"],
+    "debit": ["debit", "withdrawal", "withdrawals", "debit amount", "money out", "paid out"],
+    "credit": ["credit", "deposit", "deposits", "credit amount", "money in", "paid in"],
+    "account": ["account", "account number", "account #", "card no.", "card number", "account name"],
+}
+
+OFX_TRANSACTION = re.compile(r"<STMTTRN>(.*?)(?:</STMTTRN>|(?=<STMTTRN>)|(?=</BANKTRANLIST>))", re.IGNORECASE | re.DOTALL)
+OFX_FIELD = re.compile(r"<(\w+)>([^<\r\n]*)")
+OFX_ACCOUNT = re.compile(r"<ACCTID>([^<\r\n]*)", re.IGNORECASE)
+
+# Rows searched for the header, past any preamble
+HEADER_SEARCH_ROWS = 20
+# Share of rows allowed to fail before the file is handed to the LLM instead
+MAX_FAILED_ROWS = 0.1
+
+class StatementParser:
+    """
+    Deterministic parser for bank CSV and OFX/QFX exports.
+    Returns None when it doesn't recognize a file so the caller can fall back to the LLM.
+    """
+    
+    def parse(self, content: str, file_format: str, rejected: Optional[List[Dict[str, Any]]] = None) -> Optional[List[Dict[str, Any]]]:
+        return self.parse_stream(io.StringIO(content), file_format, rejected)
+    
+    def parse_stream(self, stream: TextIO, file_format: str, rejected: Optional[List[Dict[str, Any]]] = None) -> Optional[List[Dict[str, Any]]]:
+        """
+        Parse from a seekable text stream; CSV rows are read line by line.
+        Rows that can't be normalized are described in `rejected`.
+        """
+        if rejected is None:
+            rejected = []
+        if file_format == "OFX":
+            return self.parse_ofx(stream.read(), rejected)
+        if file_format in ("CSV", "TXT"):
+            return self.parse_csv(stream, rejected)
+        return None
+    
+    def parse_csv(self, stream: TextIO, rejected: List[Dict[str, Any]]) -> Optional[List[Dict[str, Any]]]:
+        """Parse a delimited bank export using the layout registry"""
+        sample = stream.read(8192)
+        stream.seek(0)
+        try:
+            dialect = csv.Sniffer().sniff(sample, delimiters=",;\t|")
+        except csv.Error:
+            dialect = csv.excel
+        
+        # Only the rows searched for the header are buffered; the rest stream from the file
+        reader = csv.reader(stream, dialect)
+        preamble = list(islice(reader, HEADER_SEARCH_ROWS))
+        header_index, columns = self._find_header(preamble)
+        if columns is None:
+            return None
+        
+        fields = [field for field in ("date", "description", "amount", "debit", "credit", "account") if field in columns]
+        records = []
+        # File line numbers, for reporting rows that can't be normalized
+        row_numbers = []
+        for line, row in enumerate(chain(preamble[header_index + 1:], reader), header_index + 2):
+            if not "".join(row).strip():
+                continue
+            record = {field: row[columns[field]].strip() if columns[field] < len(row) else "" for field in fields}
+            record["account_info"] = record.pop("account", "")
+            records.append(record)
+            row_numbers.append(line)
+        if not records:
+            return None
+        
+        failed: List[Dict[str, Any]] = []
+        transactions = normalize_rows(records, failed, sign=columns.get("sign", 1), row_numbers=row_numbers)
+        if len(transactions) < len(records) * (1 - MAX_FAILED_ROWS):
+            return None
+        rejected.extend(failed)
+        return transactions
+    
+    def parse_ofx(self, content: str, rejected: List[Dict[str, Any]]) -> Optional[List[Dict[str, Any]]]:
+        """Parse OFX/QFX statements, both SGML (1.x) and XML (2.x)"""
+        account_match = OFX_ACCOUNT.search(content)
+        account = account_match.group(1).strip() if account_match else ""
+        
+        records = []
+        for block in OFX_TRANSACTION.findall(content):
+            fields = {name.upper(): value.strip() for name, value in OFX_FIELD.findall(block)}
+            records.append({
+                "date": fields.get("DTPOSTED", "")[:8],
+                "amount": fields.get("TRNAMT", ""),
+                "description": fields.get("NAME") or fields.get("MEMO") or "",
+                "account_info": account
+            })
+        
+        return normalize_rows(records, rejected) or None
+    
+    def _find_header(self, rows: List[List[str]]):
+        """Locate the header row (skipping any preamble) and map it to column indexes"""
+        for index, row in enumerate(rows[:HEADER_SEARCH_ROWS]):
+            headers = [cell.strip().lower() for cell in row]
+            present = set(headers)
+            
+            for layout in BANK_LAYOUTS:
+                if layout["headers"] <= present:
+                    columns = {
+                        field: headers.index(layout[field])
+                        for field in ("date", "description", "amount", "debit", "credit", "account")
+                        if field in layout and layout[field] in present
+                    }
+                    columns["sign"] = layout.get("sign", 1)
+                    return index, columns
+            
+            columns = {}
+            for field, aliases in COLUMN_ALIASES.items():
+                for alias in aliases:
+                    if alias in present and headers.index(alias) not in columns.values():
+                        columns[field] = headers.index(alias)
+                        break
+            has_amount = "amount" in columns or ("debit" in columns and "credit" in columns)
+            if "date" in columns and "description" in columns and has_amount:
+                if "amount" in columns:
+                    columns.pop("debit", None)
+                    columns.pop("credit", None)
+                return index, columns
+        
+        return 0, None
@@ -0,0 +1,86 @@
+import hashlib
+from datetime import datetime
+from typing import Dict, List, Any, Iterable, Set, Tuple
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+
+from ..database import Transaction
+
+# Rows per insert batch
+BATCH_SIZE = 5000
+
+def content_hash(user_id: str, date: datetime, amount: float, description: str, account: str, occurrence: int) -> str:
+    """
+    Identity of a statement row: the same row re-uploaded hashes the same.
+    `occurrence` tells apart identical rows within one file (two coffees on the same day).
+    """
+    description_key = " ".join(str(description).casefold().split())
+    key = f"{user_id}|{date.date().isoformat()}|{amount:.2f}|{description_key}|{account or ''}|{occurrence}"
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+def assign_content_hashes(user_id: str, transactions: List[Dict[str, Any]]):
+    """Set "content_hash" on each extracted transaction (expects a parsed "date" datetime)"""
+    occurrences: Dict[Tuple, int] = {}
+    for transaction in transactions:
+        identity = (
+            transaction["date"].date(),
+            round(transaction["amount"], 2),
+            " ".join(str(transaction["description"]).casefold().split()),
+            transaction.get("account_info") or ""
+        )
+        occurrence = occurrences.get(identity, 0)
+        occurrences[identity] = occurrence + 1
+        transaction["content_hash"] = content_hash(
+            user_id, transaction["date"], transaction["amount"],
+            transaction["description"], transaction.get("account_info"), occurrence
+        )
+
+def existing_hashes(db: Session, user_id: str, hashes: Iterable[str]) -> Set[str]:
+    """Which of these content hashes are already stored for the user"""
+    hashes = list(hashes)
+    found = set()
+    for start in range(0, len(hashes), 500):
+        found.update(
+            row.content_hash for row in db.query(Transaction.content_hash).filter(
+                Transaction.user_id == user_id,
+                Transaction.content_hash.in_(hashes[start:start + 500])
+            )
+        )
+    return found
+
+def insert_transactions(db: Session, rows: List[Dict[str, Any]]) -> int:
+    """
+    Insert transaction rows in batches, skipping rows whose (user_id, content_hash)
+    already exists. Returns how many rows were inserted. The caller commits, so
+    the whole upload lands in one transaction.
+    
+    With RETURNING, SQLAlchemy sends each batch as multi-row INSERT statements
+    instead of one statement per row; on SQLite that also lets the search-index
+    trigger add the rows in bulk rather than flushing the index for every row.
+    """
+    if not rows:
+        return 0
+    
+    dialect = db.get_bind().dialect.name
+    if dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        statement = dialect_insert(Transaction.__table__).on_conflict_do_nothing(index_elements=["user_id", "content_hash"])
+    elif dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        statement = dialect_insert(Transaction.__table__).on_conflict_do_nothing(index_elements=["user_id", "content_hash"])
+    else:
+        statement = insert(Transaction.__table__)
+    
+    if dialect in ("sqlite", "postgresql"):
+        # Rows skipped as duplicates return nothing
+        statement = statement.returning(Transaction.id)
+        inserted = 0
+        for start in range(0, len(rows), BATCH_SIZE):
+            inserted += len(db.execute(statement, rows[start:start + BATCH_SIZE]).all())
+        return inserted
+    
+    inserted = 0
+    for start in range(0, len(rows), BATCH_SIZE):
+        result = db.execute(statement, rows[start:start + BATCH_SIZE])
+        inserted += max(result.rowcount, 0)
+    return inserted
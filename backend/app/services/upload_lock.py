@@ -0,0 +1,106 @@
+import asyncio
+import hashlib
+import os
+import uuid
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+from typing import BinaryIO
+from sqlalchemy import delete, update
+from sqlalchemy.exc import IntegrityError
+
+from ..database import SessionLocal, UploadLock
+
+# A lock whose holder hasn't refreshed it for this long (e.g. a killed worker) is taken over
+UPLOAD_LOCK_TTL_SECONDS = float(os.getenv("UPLOAD_LOCK_TTL_SECONDS", "60"))
+UPLOAD_LOCK_POLL_SECONDS = float(os.getenv("UPLOAD_LOCK_POLL_SECONDS", "1"))
+
+class UploadInProgress(Exception):
+    """The same file is already being processed for this user"""
+
+def file_digest(upload: BinaryIO) -> str:
+    """sha256 of a seekable binary file, read in chunks; leaves it rewound"""
+    digest = hashlib.sha256()
+    upload.seek(0)
+    for chunk in iter(lambda: upload.read(1 << 20), b""):
+        digest.update(chunk)
+    upload.seek(0)
+    return digest.hexdigest()
+
+def _try_acquire(key: str, owner: str, filename: str) -> bool:
+    now = datetime.utcnow()
+    db = SessionLocal()
+    try:
+        db.add(UploadLock(key=key, owner=owner, filename=filename, heartbeat_at=now))
+        try:
+            db.commit()
+            return True
+        except IntegrityError:
+            db.rollback()
+        
+        # Held: take it over only if the holder has stopped refreshing it.
+        # Concurrent takeovers are serialized by the row update; one wins.
+        taken = db.execute(
+            update(UploadLock)
+            .where(UploadLock.key == key, UploadLock.heartbeat_at < now - timedelta(seconds=UPLOAD_LOCK_TTL_SECONDS))
+            .values(owner=owner, filename=filename, heartbeat_at=now)
+            .execution_options(synchronize_session=False)
+        )
+        db.commit()
+        return taken.rowcount == 1
+    finally:
+        db.close()
+
+def _refresh(key: str, owner: str):
+    db = SessionLocal()
+    try:
+        db.execute(
+            update(UploadLock)
+            .where(UploadLock.key == key, UploadLock.owner == owner)
+            .values(heartbeat_at=datetime.utcnow())
+            .execution_options(synchronize_session=False)
+        )
+        db.commit()
+    finally:
+        db.close()
+
+def _release(key: str, owner: str):
+    db = SessionLocal()
+    try:
+        db.execute(
+            delete(UploadLock)
+            .where(UploadLock.key == key, UploadLock.owner == owner)
+            .execution_options(synchronize_session=False)
+        )
+        db.commit()
+    finally:
+        db.close()
+
+async def _heartbeat(key: str, owner: str):
+    while True:
+        await asyncio.sleep(UPLOAD_LOCK_TTL_SECONDS / 3)
+        try:
+            await asyncio.to_thread(_refresh, key, owner)
+        except Exception as e:
+            print(f"Failed to refresh upload lock: {str(e)}")
+
+@asynccontextmanager
+async def hold(user_id: str, digest: str, filename: str, wait: bool = False):
+    """
+    Hold the lock on one of a user's files for the duration of the block,
+    across every worker process. Raises UploadInProgress if someone else
+    holds it, or with wait=True polls until it is free.
+    """
+    key = f"{user_id}:{digest}"
+    owner = uuid.uuid4().hex
+    while not await asyncio.to_thread(_try_acquire, key, owner, filename):
+        if not wait:
+            raise UploadInProgress(filename)
+        await asyncio.sleep(UPLOAD_LOCK_POLL_SECONDS)
+    
+    heartbeat = asyncio.create_task(_heartbeat(key, owner))
+    try:
+        yield
+    finally:
+        heartbeat.cancel()
+        await asyncio.gather(heartbeat, return_exceptions=True)
+        await asyncio.to_thread(_release, key, owner)
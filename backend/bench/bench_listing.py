@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Listing latency benchmark: keyset pages of /api/transactions and the review
+queue on tables of growing size. Page latency should stay flat as rows grow.
+
+    python -m bench.bench_listing --sizes 1000,100000,1000000
+
+Also counts SQL statements per page, which must stay at one regardless of
+page size: any page issuing more (e.g. a lazy load per row) fails the run.
+"""
+
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+
+from app.database import Base, Transaction
+from app.services import listing
+
+# One SELECT per page; more means rows are being loaded one by one
+MAX_STATEMENTS_PER_PAGE = 1
+
+def populate(engine, rows: int):
+    start = datetime(2015, 1, 1)
+    batch = []
+    with engine.begin() as conn:
+        for i in range(rows):
+            batch.append({
+                "user_id": "001",
+                "date": start + timedelta(minutes=random.randint(0, 10 * 365 * 24 * 60)),
+                "amount": -round(random.uniform(1, 500), 2),
+                "description": f"MERCHANT {random.randint(1, 5000)}",
+                "category_id": random.randint(1, 8),
+                "confidence_score": 0.9,
+                "file_source": "bench.csv",
+                "needs_review": random.random() < 0.01,
+                "content_hash": f"bench-{i}"
+            })
+            if len(batch) == 10000:
+                conn.execute(Transaction.__table__.insert(), batch)
+                batch = []
+        if batch:
+            conn.execute(Transaction.__table__.insert(), batch)
+
+def time_pages(db, filters, pages: int, limit: int, statements):
+    """Walk `pages` pages via next_cursor; returns per-page latency in ms and SQL statements per page"""
+    timings = []
+    counts = []
+    cursor = None
+    for _ in range(pages):
+        before = len(statements)
+        started = time.perf_counter()
+        query = listing.apply_filters(listing.transaction_rows(), "001", **filters)
+        query, page_limit = listing.keyset_page(query, cursor, limit)
+        rows = db.execute(query).all()
+        # Build the response the way the endpoints do
+        [(row.id, row.category_name or "Uncategorized") for row in rows]
+        timings.append((time.perf_counter() - started) * 1000)
+        counts.append(len(statements) - before)
+        cursor = listing.next_cursor(rows, page_limit)
+        if cursor is None:
+            break
+    return timings, counts
+
+def run(sizes, pages: int, limit: int):
+    results = []
+    for size in sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            engine = create_engine(f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+            Base.metadata.create_all(engine)
+            populate(engine, size)
+
+            statements = []
+            event.listen(engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+            db = sessionmaker(bind=engine)()
+
+            scenarios = {
+                "transactions": {},
+                "review_queue": {"needs_review": True},
+                "filtered": {"category_id": 3, "min_amount": -200.0, "max_amount": -50.0},
+            }
+            for name, filters in scenarios.items():
+                timings, counts = time_pages(db, filters, pages, limit, statements)
+                results.append({
+                    "rows": size,
+                    "scenario": name,
+                    "pages": len(timings),
+                    "first_page_ms": round(timings[0], 3),
+                    "median_page_ms": round(statistics.median(timings), 3),
+                    "max_page_ms": round(max(timings), 3),
+                    "max_statements_per_page": max(counts)
+                })
+            db.close()
+            engine.dispose()
+
+    over_budget = [result for result in results if result["max_statements_per_page"] > MAX_STATEMENTS_PER_PAGE]
+    if over_budget:
+        raise RuntimeError("Listing pages issued more than {} SQL statement(s): {}".format(
+            MAX_STATEMENTS_PER_PAGE,
+            ", ".join(f"{r['scenario']}/{r['rows']} ({r['max_statements_per_page']})" for r in over_budget)
+        ))
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", default="1000,100000,1000000")
+    parser.add_argument("--pages", type=int, default=20)
+    parser.add_argument("--limit", type=int, default=100)
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(",")]
+    print(json.dumps(run(sizes, args.pages, args.limit), indent=2))
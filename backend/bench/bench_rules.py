@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Rule matching benchmark: one batch of statement descriptions against a growing
+number of user rules, all compiled into a single matcher.
+
+    python -m bench.bench_rules --rows 100000 --rules 10,100,1000
+
+100k rows against 1k rules should match in well under a second.
+"""
+
+import argparse
+import json
+import os
+import random
+import string
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from app.services.rule_engine import RuleMatcher
+
+def merchant_names(count: int):
+    return ["".join(random.choices(string.ascii_uppercase, k=random.randint(4, 10))) for _ in range(count)]
+
+def make_rules(merchants, count: int):
+    return [
+        {
+            "id": i + 1,
+            "pattern": merchants[i],
+            "category_id": random.randint(1, 8),
+            # Some rules also carry an amount condition
+            "min_amount": -500.0 if i % 5 == 0 else None,
+            "max_amount": None,
+            "priority": random.randint(0, 2)
+        }
+        for i in range(count)
+    ]
+
+def make_rows(merchants, count: int):
+    descriptions = [
+        f"POS {random.choice(merchants)} #{random.randint(100, 9999)} {random.choice(['CA', 'NY', 'TX'])} {random.randint(1, 12)}/{random.randint(1, 28)}"
+        for _ in range(count)
+    ]
+    amounts = [-round(random.uniform(1, 1000), 2) for _ in range(count)]
+    return descriptions, amounts
+
+def run(rows: int, rule_counts):
+    merchants = merchant_names(max(rule_counts) * 3)
+    descriptions, amounts = make_rows(merchants, rows)
+
+    results = []
+    for count in rule_counts:
+        started = time.perf_counter()
+        matcher = RuleMatcher(make_rules(merchants, count))
+        compile_ms = (time.perf_counter() - started) * 1000
+
+        started = time.perf_counter()
+        matches = matcher.match(descriptions, amounts)
+        match_ms = (time.perf_counter() - started) * 1000
+
+        results.append({
+            "rows": rows,
+            "rules": count,
+            "compile_ms": round(compile_ms, 3),
+            "match_ms": round(match_ms, 3),
+            "matched_rows": sum(1 for match in matches if match is not None)
+        })
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--rules", default="10,100,1000")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    rule_counts = [int(count) for count in args.rules.split(",")]
+    print(json.dumps(run(args.rows, rule_counts), indent=2))
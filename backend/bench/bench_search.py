@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Search latency benchmark: ranked /api/transactions/search queries and
+listings filtered with q, on a table shared by several users that grows to
+each size, next to the LIKE scan the search index replaces.
+
+    python -m bench.bench_search --sizes 100000,1000000
+
+Runs against DATABASE_URL (a fresh temporary SQLite database by default).
+Queries for rare terms should stay in the low milliseconds as rows grow.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from bench.generators import transactions
+
+USERS = 10
+
+# Store numbers are 1 in 10000 rows, merchant names 1 in 20, short terms aren't indexed
+QUERIES = {
+    "rare": "#0042",
+    "merchant": "NETFLIX",
+    "merchant_city": "STARBUCKS SEATTLE",
+    "short_term": "UBER 42",
+}
+
+def populate(db, start: int, rows: int):
+    from app.services.transaction_store import insert_transactions
+
+    batch = []
+    for i, (day, description, amount) in enumerate(transactions(rows, seed=start), start):
+        batch.append({
+            "user_id": f"search{i % USERS}",
+            "date": day,
+            "amount": amount,
+            "description": description,
+            "category_id": i % 8 + 1,
+            "confidence_score": 0.9,
+            "file_source": "bench.csv",
+            "needs_review": False,
+            "content_hash": f"search-{i}"
+        })
+        if len(batch) == 10000:
+            insert_transactions(db, batch)
+            batch = []
+    insert_transactions(db, batch)
+    db.commit()
+
+def time_query(db, query, repeats: int) -> float:
+    """Median latency in ms"""
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        db.execute(query).all()
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
+
+def run(sizes, repeats: int = 5):
+    from sqlalchemy import select
+    from app.database import SessionLocal, Transaction, ensure_schema
+    from app.services import listing, search
+
+    ensure_schema()
+    db = SessionLocal()
+    results = []
+    rows = 0
+    try:
+        for size in sizes:
+            started = time.perf_counter()
+            populate(db, rows, size - rows)
+            insert_rate = (size - rows) / (time.perf_counter() - started)
+            rows = size
+
+            for name, q in QUERIES.items():
+                ranked, _ = search.search_query("search0", q)
+                filtered, _ = search.search_query("search0", q, category_id=3, min_amount=-100.0)
+                page, _ = listing.keyset_page(listing.apply_filters(listing.transaction_rows(), "search0", q=q), None, 100)
+                like = select(Transaction.id).where(Transaction.user_id == "search0")
+                for term in search.search_terms(q):
+                    like = like.where(Transaction.description.ilike(f"%{term}%"))
+                results.append({
+                    "rows": size,
+                    "scenario": name,
+                    "query": q,
+                    "insert_rows_per_sec": round(insert_rate, 1),
+                    "search_ms": round(time_query(db, ranked, repeats), 3),
+                    "filtered_search_ms": round(time_query(db, filtered, repeats), 3),
+                    "listing_ms": round(time_query(db, page, repeats), 3),
+                    "like_scan_ms": round(time_query(db, like, repeats), 3)
+                })
+    finally:
+        db.close()
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="100000,1000000")
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='smart-bud-search-'), 'bench.db')}")
+    print(json.dumps(run([int(size) for size in args.sizes.split(",")], args.repeats), indent=2))
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Multi-tenant load test: many users upload statements and read their dashboards
+at the same time, optionally alongside one user doing a large bulk import.
+
+    python -m bench.bench_tenants --users 20 --rows 50 --heavy-rows 3000
+
+Runs the app in-process against a temporary SQLite database and a fake LLM.
+Reports per-scenario latency percentiles for the light users and checks that
+every user only ever sees their own transactions.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from bench.harness import app_client, configure
+
+def statement(user_id: str, rows: int) -> str:
+    lines = ["Date,Description,Amount"]
+    for i in range(rows):
+        lines.append(f"2025-07-{i % 28 + 1:02d},{user_id.upper()} MERCHANT {i},-{i % 200 + 1}.25")
+    return "\n".join(lines)
+
+def percentile(values, pct: float) -> float:
+    ordered = sorted(values)
+    return round(ordered[min(len(ordered) - 1, int(len(ordered) * pct))], 3)
+
+async def light_user(client, user_id: str, rows: int):
+    """Upload one statement, then read the dashboard and the first page of transactions"""
+    headers = {"X-User-Id": user_id}
+    timings = {}
+
+    started = time.perf_counter()
+    response = await client.post(
+        "/api/upload",
+        headers=headers,
+        files={"file": (f"{user_id}.csv", statement(user_id, rows), "text/csv")}
+    )
+    response.raise_for_status()
+    timings["upload_s"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    (await client.get("/api/dashboard", headers=headers)).raise_for_status()
+    timings["dashboard_s"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    page = (await client.get("/api/transactions", headers=headers, params={"limit": 1000})).json()
+    timings["transactions_s"] = time.perf_counter() - started
+
+    # Isolation: every row returned belongs to this user's statement
+    timings["isolated"] = len(page["transactions"]) == min(rows, 1000) and all(
+        t["description"].startswith(user_id.upper()) for t in page["transactions"]
+    )
+    return timings
+
+async def scenario(client, name: str, users: int, rows: int, heavy_rows: int):
+    tasks = [light_user(client, f"{name}-user{i}", rows) for i in range(users)]
+    heavy = None
+    if heavy_rows:
+        heavy = asyncio.ensure_future(light_user(client, f"{name}-heavy", heavy_rows))
+
+    started = time.perf_counter()
+    results = await asyncio.gather(*tasks)
+    light_done = time.perf_counter() - started
+    heavy_result = await heavy if heavy is not None else None
+
+    summary = {
+        "scenario": name,
+        "users": users,
+        "rows_per_user": rows,
+        "heavy_rows": heavy_rows,
+        "light_users_done_s": round(light_done, 3),
+        "isolated": all(r["isolated"] for r in results) and (heavy_result is None or heavy_result["isolated"])
+    }
+    for metric in ("upload_s", "dashboard_s", "transactions_s"):
+        values = [r[metric] for r in results]
+        summary[metric] = {
+            "p50": percentile(values, 0.5),
+            "p95": percentile(values, 0.95),
+            "mean": round(statistics.mean(values), 3)
+        }
+    if heavy_result is not None:
+        summary["heavy_upload_s"] = round(heavy_result["upload_s"], 3)
+    return summary
+
+async def run_scenarios(client, users: int, rows: int, heavy_rows: int):
+    results = [await scenario(client, "light", users, rows, 0)]
+    if heavy_rows:
+        results.append(await scenario(client, "with_heavy", users, rows, heavy_rows))
+    return results
+
+async def run(users: int, rows: int, heavy_rows: int):
+    async with app_client() as client:
+        return await run_scenarios(client, users, rows, heavy_rows)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--rows", type=int, default=50)
+    parser.add_argument("--heavy-rows", type=int, default=3000)
+    parser.add_argument("--latency", type=float, default=0.05, help="Fake LLM latency per call (s)")
+    parser.add_argument("--rpm", type=int, default=600, help="Account-wide LLM requests per minute")
+    args = parser.parse_args()
+
+    fake = configure(latency=args.latency, rpm=args.rpm)
+    results = asyncio.run(run(args.users, args.rows, args.heavy_rows))
+    fake.stop()
+    print(json.dumps(results, indent=2))
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Multi-worker load test: starts the production server (run.py --workers N)
+for each worker count against a fresh SQLite database and the fake LLM,
+then measures upload and listing throughput over real HTTP.
+
+    python -m bench.bench_workers --workers 1,2,4 --users 32 --rows 500
+
+Each result records the machine's core count. The load generator runs on the
+same machine and needs CPU too, so more workers can only help while the
+worker count stays below the core count; on a small machine (one or two
+cores) the speedups stay near 1.0 and the run only shows that the
+multi-worker server works. Run it on a machine with more cores than the
+largest worker count before reading the speedups as scaling.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from bench.generators import csv_statement
+from bench.harness import configure
+
+BACKEND = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def start_server(workers: int, port: int) -> subprocess.Popen:
+    env = dict(
+        os.environ,
+        DATABASE_URL=f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='smart-bud-workers-'), 'bench.db')}",
+        ALLOW_USER_HEADER="true"
+    )
+    return subprocess.Popen(
+        [sys.executable, "run.py", "--workers", str(workers), "--host", "127.0.0.1", "--port", str(port)],
+        cwd=BACKEND, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+
+async def wait_ready(client, timeout: float = 60.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if (await client.get("/")).status_code == 200:
+                return
+        except Exception:
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError("Server did not start")
+
+async def measure(client, users: int, rows: int, requests: int):
+    async def upload(i: int):
+        response = await client.post(
+            "/api/upload",
+            headers={"X-User-Id": f"user{i}"},
+            files={"file": (f"user{i}.csv", csv_statement(rows, seed=i), "text/csv")}
+        )
+        response.raise_for_status()
+        return response.json()["inserted"]
+
+    started = time.perf_counter()
+    inserted = sum(await asyncio.gather(*(upload(i) for i in range(users))))
+    upload_s = time.perf_counter() - started
+
+    async def listing(i: int):
+        response = await client.get("/api/transactions", headers={"X-User-Id": f"user{i % users}"}, params={"limit": 100})
+        response.raise_for_status()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(listing(i) for i in range(requests)))
+    listing_s = time.perf_counter() - started
+
+    return {
+        "rows": inserted,
+        "upload_s": round(upload_s, 3),
+        "upload_rows_per_sec": round(inserted / upload_s, 1),
+        "listing_s": round(listing_s, 3),
+        "listing_requests_per_sec": round(requests / listing_s, 1)
+    }
+
+async def run_one(workers: int, users: int, rows: int, requests: int):
+    import httpx
+
+    port = free_port()
+    server = start_server(workers, port)
+    try:
+        limits = httpx.Limits(max_connections=64)
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", timeout=None, limits=limits) as client:
+            await wait_ready(client)
+            result = await measure(client, users, rows, requests)
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+    return {"scenario": "workers", "workers": workers, "cpus": os.cpu_count(), **result}
+
+def run(worker_counts, users: int, rows: int, requests: int):
+    if max(worker_counts) >= (os.cpu_count() or 1):
+        print(
+            f"bench_workers: {os.cpu_count()} cores for up to {max(worker_counts)} workers plus the load generator; "
+            "speedups will not show scaling",
+            file=sys.stderr
+        )
+    results = [asyncio.run(run_one(workers, users, rows, requests)) for workers in worker_counts]
+    baseline = results[0]
+    for result in results:
+        # Throughput relative to the first (smallest) worker count
+        result["upload_speedup"] = round(result["upload_rows_per_sec"] / baseline["upload_rows_per_sec"], 2)
+        result["listing_speedup"] = round(result["listing_requests_per_sec"] / baseline["listing_requests_per_sec"], 2)
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", default="1,2,4", help="Comma-separated worker counts")
+    parser.add_argument("--users", type=int, default=32)
+    parser.add_argument("--rows", type=int, default=500)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--latency", type=float, default=0.05)
+    args = parser.parse_args()
+
+    fake = configure(latency=args.latency, rpm=600000)
+    try:
+        results = run([int(n) for n in args.workers.split(",")], args.users, args.rows, args.requests)
+    finally:
+        fake.stop()
+    print(json.dumps(results, indent=2))
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Period grouping check: spending per ISO week and per month from the analytics
+service, against totals computed in Python from the same rows. The rows cross
+two year boundaries, where ISO weeks and calendar years disagree.
+
+    python -m bench.check_periods
+    DATABASE_URL=postgresql://... python -m bench.check_periods
+
+Runs against DATABASE_URL (a fresh temporary SQLite database by default), so
+running it on each backend shows they produce the same labels. Exits non-zero
+on any mismatch.
+"""
+
+import json
+import os
+import random
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+USER_ID = "periods"
+
+def make_rows(count: int, start: datetime, days: int):
+    rng = random.Random(0)
+    return [
+        {
+            "user_id": USER_ID,
+            "date": start + timedelta(days=rng.randrange(days), minutes=rng.randrange(24 * 60)),
+            "amount": round(rng.uniform(-300, 100), 2),
+            "description": f"CHECK {i}",
+            "category_id": None,
+            "confidence_score": 1.0,
+            "file_source": "check.csv",
+            "needs_review": False,
+            "content_hash": f"periods-{i}"
+        }
+        for i in range(count)
+    ]
+
+def expected_totals(rows, label, start_date=None, end_date=None):
+    totals = {}
+    for row in rows:
+        if (start_date and row["date"] < start_date) or (end_date and row["date"] >= end_date):
+            continue
+        spent, income, count = totals.get(label(row["date"]), (0.0, 0.0, 0))
+        totals[label(row["date"])] = (
+            spent + max(-row["amount"], 0.0),
+            income + max(row["amount"], 0.0),
+            count + 1
+        )
+    return [
+        {"period": period, "spent": round(spent, 2), "income": round(income, 2), "count": count}
+        for period, (spent, income, count) in sorted(totals.items())
+    ]
+
+def iso_label(value: datetime) -> str:
+    year, week, _ = value.isocalendar()
+    return f"{year}-W{week:02d}"
+
+def run():
+    from app.database import SessionLocal, ensure_schema
+    from app.services import analytics, rollups
+    from app.services.transaction_store import insert_transactions
+
+    ensure_schema()
+    rows = make_rows(5000, datetime(2024, 12, 1), 430)
+    db = SessionLocal()
+    try:
+        insert_transactions(db, rows)
+        rollups.add_rows(db, USER_ID, rows)
+        db.commit()
+
+        checks = {
+            "week": ("week", iso_label, None, None),
+            "week_range": ("week", iso_label, datetime(2024, 12, 30), datetime(2026, 1, 5)),
+            "month_rollup": ("month", lambda value: value.strftime("%Y-%m"), datetime(2025, 1, 1), datetime(2026, 1, 1)),
+            "month_raw": ("month", lambda value: value.strftime("%Y-%m"), datetime(2024, 12, 15), datetime(2025, 12, 15)),
+        }
+        results = []
+        for name, (period, label, start_date, end_date) in checks.items():
+            actual = analytics.spending_by_period(db, USER_ID, period, start_date, end_date)
+            expected = expected_totals(rows, label, start_date, end_date)
+            mismatches = [
+                {"expected": want, "actual": got}
+                for want, got in zip(expected, actual) if want != got
+            ]
+            results.append({
+                "check": name,
+                "dialect": db.get_bind().dialect.name,
+                "periods": len(actual),
+                "first": actual[0]["period"] if actual else None,
+                "ok": len(expected) == len(actual) and not mismatches,
+                "mismatches": mismatches[:5]
+            })
+    finally:
+        db.close()
+    return results
+
+if __name__ == "__main__":
+    os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='smart-bud-periods-'), 'check.db')}")
+    results = run()
+    print(json.dumps(results, indent=2))
+    sys.exit(0 if all(result["ok"] for result in results) else 1)
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Compare two bench.run_bench reports and flag regressions.
+
+    python -m bench.compare before.json after.json --threshold 0.1
+
+Timings (fields ending in _s or _ms, including nested percentiles) are
+compared result by result; lower is better. Exits non-zero when any timing
+got slower by more than the threshold, so it can gate CI.
+"""
+
+import argparse
+import json
+import sys
+
+def timings(result, prefix: str = ""):
+    """Flatten a result into {field: seconds-or-ms} for every timing it holds"""
+    flat = {}
+    for name, value in result.items():
+        if isinstance(value, dict):
+            for field, number in value.items():
+                if isinstance(number, (int, float)) and not isinstance(number, bool):
+                    flat[f"{prefix}{name}.{field}"] = number
+        elif isinstance(value, (int, float)) and not isinstance(value, bool) and name.endswith(("_s", "_ms")):
+            flat[prefix + name] = value
+    return flat
+
+def compare(before, after, threshold: float, min_delta: float):
+    baseline = {result["name"]: timings(result) for result in before["results"]}
+    rows = []
+    for result in after["results"]:
+        old = baseline.get(result["name"])
+        if old is None:
+            continue
+        for field, new_value in timings(result).items():
+            old_value = old.get(field)
+            if old_value is None:
+                continue
+            change = (new_value - old_value) / old_value if old_value else 0.0
+            # Tiny absolute differences are noise, whatever their ratio
+            scale = 1000 if field.endswith("_ms") else 1
+            regressed = change > threshold and (new_value - old_value) / scale > min_delta
+            rows.append((result["name"], field, old_value, new_value, change, regressed))
+    return rows
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("before")
+    parser.add_argument("after")
+    parser.add_argument("--threshold", type=float, default=0.1, help="Relative slowdown that counts as a regression")
+    parser.add_argument("--min-delta", type=float, default=0.005, help="Ignore slowdowns smaller than this many seconds")
+    args = parser.parse_args()
+
+    with open(args.before) as f:
+        before = json.load(f)
+    with open(args.after) as f:
+        after = json.load(f)
+
+    print(f"{before['meta']['commit']} -> {after['meta']['commit']}")
+    rows = compare(before, after, args.threshold, args.min_delta)
+    for name, field, old_value, new_value, change, regressed in rows:
+        flag = "  REGRESSION" if regressed else ""
+        print(f"{name:40} {field:24} {old_value:>12} -> {new_value:>12} {change:+7.1%}{flag}")
+
+    regressions = sum(1 for row in rows if row[-1])
+    print(f"{regressions} regression(s) over {args.threshold:.0%}")
+    sys.exit(1 if regressions else 0)
@@ -0,0 +1,191 @@
+"""
+Stand-in for the OpenAI chat completions API so benchmarks measure the app,
+not the network or a real model.
+
+Answers the app's three prompt kinds: statement extraction (rows of
+"date, description, amount"), packed categorization and single-row
+categorization, with categories picked deterministically from the
+description. Latency, error rate (429 / 500 with Retry-After), the share
+of merchants answered with low confidence (so they land in the review
+queue) and token accounting are configurable; answers longer than
+max_tokens are cut off with finish_reason "length" like the real API.
+
+    server = FakeLLM(latency=0.05, error_rate=0.01).start()
+    os.environ["OPENAI_BASE_URL"] = server.base_url
+
+Or standalone, to point a running server at it:
+
+    python -m bench.fake_llm --port 8765 --latency 0.2
+"""
+
+import argparse
+import json
+import random
+import re
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+PACKED_ROW = re.compile(r'^\s*\[(\d+)\] "(.*)" \$[\d.]+$', re.M)
+SINGLE_ROW = re.compile(r'Description: "(.*)"')
+CATEGORIES = re.compile(r"Available categories: (.*)")
+STORE_NUMBER = re.compile(r"[#\d]+")
+STATEMENT_ROW = re.compile(r"^\s*(\d{4}-\d{2}-\d{2})\s*,\s*(.+?)\s*,\s*(-?\d+(?:\.\d+)?)\s*$", re.M)
+
+def estimate_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+def pick_category(description: str, categories):
+    return categories[zlib.crc32(description.encode("utf-8")) % len(categories)]
+
+def confidence(description: str, review_rate: float) -> float:
+    """Low for a fixed share of merchants, whatever their store number"""
+    merchant = STORE_NUMBER.sub("", description).strip()
+    return 0.5 if zlib.crc32(merchant.encode("utf-8")) % 1000 < review_rate * 1000 else 0.92
+
+def answer(prompt: str, review_rate: float = 0.0):
+    """Response content for a prompt, and which kind of prompt it was"""
+    if "Extract all financial transactions" in prompt:
+        content = prompt.split("File content:", 1)[1].split("Return a JSON array", 1)[0]
+        return json.dumps([
+            {"date": date, "description": description, "amount": float(amount)}
+            for date, description, amount in STATEMENT_ROW.findall(content)
+        ]), "extract"
+
+    categories = [name.strip() for name in CATEGORIES.search(prompt).group(1).split(",")]
+    packed = PACKED_ROW.findall(prompt)
+    if packed:
+        return json.dumps([
+            {
+                "index": int(index),
+                "category": pick_category(description, categories),
+                "confidence": confidence(description, review_rate),
+                "reasoning": "fake"
+            }
+            for index, description in packed
+        ]), "packed"
+    match = SINGLE_ROW.search(prompt)
+    description = match.group(1) if match else ""
+    return json.dumps({
+        "category": pick_category(description, categories),
+        "confidence": confidence(description, review_rate),
+        "reasoning": "fake"
+    }), "single"
+
+class FakeLLM:
+    def __init__(self, latency: float = 0.0, port: int = 0, error_rate: float = 0.0, review_rate: float = 0.0, seed: int = 0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.review_rate = review_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.reset_stats()
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                # Counters, for runs against a standalone server
+                self._send(200, fake.snapshot())
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                prompt = body["messages"][-1]["content"]
+                if fake.latency:
+                    time.sleep(fake.latency)
+
+                with fake._lock:
+                    fake.stats["calls"] += 1
+                    failed = fake._random.random() < fake.error_rate
+                    status = 429 if fake._random.random() < 0.5 else 500
+                    if failed:
+                        fake.stats["errors"] += 1
+                if failed:
+                    self._send(status, {"error": {"message": "fake failure", "type": "fake"}}, {"Retry-After": "0"})
+                    return
+
+                content, kind = answer(prompt, fake.review_rate)
+                finish_reason = "stop"
+                max_tokens = body.get("max_tokens")
+                if max_tokens and estimate_tokens(content) > max_tokens:
+                    content = content[:max_tokens * 4]
+                    finish_reason = "length"
+
+                prompt_tokens = sum(estimate_tokens(message["content"]) for message in body["messages"])
+                completion_tokens = estimate_tokens(content)
+                with fake._lock:
+                    fake.stats[kind] += 1
+                    fake.stats["truncated"] += finish_reason == "length"
+                    fake.stats["prompt_tokens"] += prompt_tokens
+                    fake.stats["completion_tokens"] += completion_tokens
+
+                self._send(200, {
+                    "id": "fake",
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": body.get("model", "fake"),
+                    "choices": [{"index": 0, "finish_reason": finish_reason, "message": {"role": "assistant", "content": content}}],
+                    "usage": {
+                        "prompt_tokens": prompt_tokens,
+                        "completion_tokens": completion_tokens,
+                        "total_tokens": prompt_tokens + completion_tokens
+                    }
+                })
+
+            def _send(self, status: int, payload, headers=None):
+                data = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        self.server.daemon_threads = True
+
+    def reset_stats(self):
+        with self._lock:
+            self.stats = {
+                "calls": 0, "errors": 0, "extract": 0, "packed": 0, "single": 0,
+                "truncated": 0, "prompt_tokens": 0, "completion_tokens": 0
+            }
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.stats)
+
+    @property
+    def calls(self) -> int:
+        return self.stats["calls"]
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.server.server_address[1]}/v1"
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds per call")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of calls answered with 429/500")
+    parser.add_argument("--review-rate", type=float, default=0.0, help="Fraction of merchants answered with low confidence")
+    args = parser.parse_args()
+
+    fake = FakeLLM(latency=args.latency, port=args.port, error_rate=args.error_rate, review_rate=args.review_rate)
+    print(f"Fake LLM listening on {fake.base_url}")
+    try:
+        fake.server.serve_forever()
+    except KeyboardInterrupt:
+        fake.server.server_close()
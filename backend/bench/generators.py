@@ -0,0 +1,60 @@
+"""
+Synthetic bank statements for the benchmarks.
+
+CSV statements use a header the local statement parser recognizes, so they
+exercise the no-LLM extraction path; text statements have no known layout
+and go through LLM extraction (answered by the fake LLM). Both are
+deterministic for a given seed, and merchants repeat the way real spending
+does (up to 500 distinct merchants), so the merchant cache and local model
+see realistic hit rates.
+"""
+
+import random
+from datetime import date, timedelta
+
+MERCHANTS = [
+    "STARBUCKS", "WHOLE FOODS MARKET", "SHELL OIL", "NETFLIX.COM", "AMAZON MKTPLACE",
+    "UBER TRIP", "CVS PHARMACY", "COMCAST CABLE", "TRADER JOES", "CHIPOTLE",
+    "DELTA AIR LINES", "HOME DEPOT", "SPOTIFY USA", "PG&E UTILITY", "TARGET",
+    "LYFT RIDE", "WALGREENS", "COSTCO WHSE", "APPLE.COM/BILL", "PANERA BREAD"
+]
+
+CITIES = [
+    "SEATTLE", "PORTLAND", "BOSTON", "AUSTIN", "DENVER", "CHICAGO", "ATLANTA", "MIAMI",
+    "PHOENIX", "DALLAS", "OAKLAND", "TAMPA", "RALEIGH", "BOISE", "OMAHA", "TUCSON",
+    "FRESNO", "MESA", "TULSA", "RENO", "SALEM", "PROVO", "EUGENE", "YONKERS", "MADISON"
+]
+
+def transactions(rows: int, seed: int = 0, merchants: int = 500, start: date = date(2025, 1, 1)):
+    """(date, description, amount) rows; about 1 in 20 is income"""
+    rng = random.Random(seed)
+    for i in range(rows):
+        day = start + timedelta(days=i * 365 // max(rows, 1))
+        if rng.random() < 0.05:
+            yield day, "PAYROLL DEPOSIT ACME CORP", round(rng.uniform(1500, 4000), 2)
+            continue
+        # Distinct merchant names; the store number varies per row like on real statements
+        merchant = rng.randrange(merchants)
+        name = MERCHANTS[merchant % len(MERCHANTS)]
+        city = CITIES[merchant // len(MERCHANTS) % len(CITIES)]
+        description = f"{name} {city} #{rng.randrange(10000):04d}"
+        yield day, description, -round(rng.uniform(1, 300), 2)
+
+def csv_statement(rows: int, seed: int = 0, merchants: int = 500) -> str:
+    lines = ["Date,Description,Amount,Running Bal."]
+    balance = 10000.0
+    for day, description, amount in transactions(rows, seed, merchants):
+        balance += amount
+        lines.append(f"{day.isoformat()},{description},{amount:.2f},{balance:.2f}")
+    return "\n".join(lines) + "\n"
+
+def text_statement(rows: int, seed: int = 0, merchants: int = 500) -> str:
+    lines = ["ACME BANK - ACCOUNT STATEMENT", "Account ending 4821"]
+    for day, description, amount in transactions(rows, seed, merchants):
+        lines.append(f"{day.isoformat()}, {description}, {amount:.2f}")
+    return "\n".join(lines) + "\n"
+
+STATEMENTS = {
+    "csv": (csv_statement, "statement.csv", "text/csv"),
+    "txt": (text_statement, "statement.txt", "text/plain")
+}
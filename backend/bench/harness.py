@@ -0,0 +1,42 @@
+"""
+Shared setup for the in-process benchmarks: a fake LLM, a throwaway SQLite
+database and an httpx client talking to the app over ASGI.
+
+The app reads its configuration at import time, so configure() must run
+before anything imports app.main.
+"""
+
+import os
+import tempfile
+from contextlib import asynccontextmanager
+
+from bench.fake_llm import FakeLLM
+
+def configure(latency: float = 0.05, error_rate: float = 0.0, review_rate: float = 0.0, rpm: int = 600, tpm: int = 100000000) -> FakeLLM:
+    """Start the fake LLM and point the app's environment at it and a fresh database"""
+    fake = FakeLLM(latency=latency, error_rate=error_rate, review_rate=review_rate).start()
+    tmp = tempfile.mkdtemp(prefix="smart-bud-bench-")
+    os.environ.update({
+        "DATABASE_URL": f"sqlite:///{os.path.join(tmp, 'bench.db')}",
+        "OPENAI_API_KEY": "bench",
+        "OPENAI_BASE_URL": fake.base_url,
+        "CATEGORIZER_RPM": str(rpm),
+        "CATEGORIZER_TPM": str(tpm),
+        "INGEST_SPOOL_DIR": os.path.join(tmp, "uploads"),
+        # The benches act as many users through the X-User-Id header
+        "ALLOW_USER_HEADER": "true"
+    })
+    return fake
+
+@asynccontextmanager
+async def app_client():
+    import httpx
+    from app.main import app
+    from app.database import ensure_schema, init_default_data
+
+    ensure_schema()
+    init_default_data()
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        yield client
@@ -0,0 +1,358 @@
+#!/usr/bin/env python3
+"""
+Benchmark suite: runs every scenario against a fake LLM and a throwaway
+SQLite database and writes one JSON report, so runs on different commits
+can be compared with bench.compare.
+
+    python -m bench.run_bench --output before.json
+    git checkout my-branch
+    python -m bench.run_bench --output after.json
+    python -m bench.compare before.json after.json
+
+Scenarios:
+  upload      end-to-end upload per statement size and format, with the
+              pipeline's per-stage timings (decode, extract, categorize,
+              persist) and the LLM calls and tokens it used
+  listing     keyset pages of /api/transactions on tables of growing size
+  rules       rule matching throughput against growing rule sets
+  concurrent  many users uploading at once, with and without a bulk import
+  review      rows needing review on a first upload, the bulk resolution of
+              the queue (one correction per merchant, applied to similar
+              rows), and rows needing review on a later upload
+  startup     import time, startup time and peak memory of a fresh worker
+              process, on a new database and on an already migrated one
+  workers     upload and listing throughput of the production server
+              (run.py --workers N) over HTTP for growing worker counts;
+              speedups need more cores than workers to mean anything
+  normalize   date and amount normalization of a large statement, for
+              the local CSV parser and for rows as the LLM returns them
+  search      ranked description search and q-filtered listings on tables
+              of growing size, next to the LIKE scan they replace
+"""
+
+import argparse
+import asyncio
+import io
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from bench.generators import STATEMENTS, csv_statement
+from bench.harness import app_client, configure
+
+SCENARIOS = ("upload", "listing", "rules", "concurrent", "review", "startup", "workers", "normalize", "search")
+
+# Run in a fresh interpreter so imports and memory are measured from scratch
+STARTUP_PROBE = """
+import asyncio, json, resource, time
+started = time.perf_counter()
+import app.main
+imported = time.perf_counter()
+
+async def cycle():
+    await app.main.startup_event()
+    ready = time.perf_counter()
+    await app.main.shutdown_event()
+    return ready
+
+def peak_rss_mb():
+    # ru_maxrss survives exec on Linux, so it would report the parent's peak
+    try:
+        with open("/proc/self/status") as f:
+            return next(int(line.split()[1]) for line in f if line.startswith("VmHWM:")) // 1024
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss // 1024
+
+ready = asyncio.run(cycle())
+print(json.dumps({
+    "import_s": round(imported - started, 4),
+    "startup_s": round(ready - imported, 4),
+    "peak_rss_mb": peak_rss_mb()
+}))
+"""
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True, cwd=os.path.dirname(__file__)
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+def decode_seconds(data: bytes) -> float:
+    """Time to decode an upload the way /api/upload does, separately from extraction"""
+    started = time.perf_counter()
+    stream = io.TextIOWrapper(io.BytesIO(data), encoding="utf-8-sig", newline="")
+    for _ in stream:
+        pass
+    return time.perf_counter() - started
+
+async def upload_scenario(client, fake, sizes, formats, seed: int):
+    results = []
+    for file_format in formats:
+        generate, filename, content_type = STATEMENTS[file_format]
+        for size in sizes:
+            data = generate(size, seed).encode("utf-8")
+            # A fresh user per run, so nothing is deduplicated against earlier runs
+            headers = {"X-User-Id": f"upload-{file_format}-{size}"}
+
+            fake.reset_stats()
+            started = time.perf_counter()
+            response = await client.post("/api/upload", headers=headers, files={"file": (filename, data, content_type)})
+            elapsed = time.perf_counter() - started
+            response.raise_for_status()
+            body = response.json()
+            llm = fake.snapshot()
+
+            results.append({
+                "name": f"upload/{file_format}/{size}",
+                "scenario": "upload",
+                "format": file_format,
+                "rows": size,
+                "inserted": body["inserted"],
+                "e2e_s": round(elapsed, 4),
+                "decode_s": round(decode_seconds(data), 4),
+                **{stage: round(seconds, 4) for stage, seconds in body["timings"].items()},
+                "rows_per_sec": round(size / elapsed, 1),
+                "llm_calls": llm["calls"],
+                "llm_errors": llm["errors"],
+                "prompt_tokens": llm["prompt_tokens"],
+                "completion_tokens": llm["completion_tokens"]
+            })
+            print(f"upload {file_format} {size} rows: {elapsed:.2f}s", file=sys.stderr)
+    return results
+
+def listing_scenario(sizes, pages: int, limit: int, seed: int):
+    from bench import bench_listing
+
+    random.seed(seed)
+    results = bench_listing.run(sizes, pages, limit)
+    for result in results:
+        result["name"] = f"listing/{result['scenario']}/{result['rows']}"
+        result["scenario"] = "listing/" + result["scenario"]
+    return results
+
+def rules_scenario(rows: int, rule_counts, seed: int):
+    from bench import bench_rules
+
+    random.seed(seed)
+    results = bench_rules.run(rows, rule_counts)
+    for result in results:
+        result["name"] = f"rules/{result['rules']}"
+        result["scenario"] = "rules"
+    return results
+
+async def concurrent_scenario(client, users: int, rows: int, heavy_rows: int):
+    from bench import bench_tenants
+
+    results = await bench_tenants.run_scenarios(client, users, rows, heavy_rows)
+    for result in results:
+        result["name"] = f"concurrent/{result['scenario']}"
+        result["scenario"] = "concurrent/" + result["scenario"]
+    return results
+
+async def review_scenario(client, rows: int):
+    from app.services.category_cache import normalize_description
+
+    headers = {"X-User-Id": "review"}
+
+    async def upload(seed: int):
+        response = await client.post("/api/upload", headers=headers, files={"file": (f"review-{seed}.csv", csv_statement(rows, seed), "text/csv")})
+        response.raise_for_status()
+        return response.json()["needs_review"]
+
+    first_review = await upload(1)
+
+    queue = []
+    cursor = None
+    while True:
+        params = {"limit": 1000, **({"cursor": cursor} if cursor else {})}
+        page = (await client.get("/api/review-queue", headers=headers, params=params)).json()
+        queue += page["transactions"]
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+
+    # The user fixes one row per merchant and lets it apply to the rest
+    categories = (await client.get("/api/categories", headers=headers)).json()["categories"]
+    corrections = {}
+    for transaction in queue:
+        corrections.setdefault(normalize_description(transaction["description"]), {
+            "id": transaction["id"],
+            "category_id": categories[0]["id"]
+        })
+
+    started = time.perf_counter()
+    response = await client.post("/api/review-queue/resolve", headers=headers, json={
+        "corrections": list(corrections.values()),
+        "apply_to_similar": True
+    })
+    resolve_s = time.perf_counter() - started
+    response.raise_for_status()
+    resolved = response.json()
+
+    return [{
+        "name": f"review/{rows}",
+        "scenario": "review",
+        "rows": rows,
+        "first_upload_review": first_review,
+        "corrections": len(corrections),
+        "resolved": resolved["updated"],
+        "resolve_s": round(resolve_s, 4),
+        "second_upload_review": await upload(2)
+    }]
+
+async def app_scenarios(fake, scenarios, args):
+    """The scenarios that go through the app share one event loop, client and database"""
+    results = []
+    async with app_client() as client:
+        if "upload" in scenarios:
+            formats = [name for name in args.formats.split(",") if name]
+            results += await upload_scenario(client, fake, args.upload_sizes, formats, args.seed)
+        if "concurrent" in scenarios:
+            results += await concurrent_scenario(client, args.users, args.rows, args.heavy_rows)
+        if "review" in scenarios:
+            results += await review_scenario(client, args.review_rows)
+    return results
+
+def startup_scenario():
+    backend = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+    env = dict(os.environ, DATABASE_URL=f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='smart-bud-startup-'), 'startup.db')}")
+    results = []
+    # The second start finds the schema already migrated and the defaults seeded
+    for database in ("new_db", "existing_db"):
+        probe = subprocess.run([sys.executable, "-c", STARTUP_PROBE], capture_output=True, text=True, check=True, cwd=backend, env=env)
+        results.append({
+            "name": f"startup/{database}",
+            "scenario": "startup",
+            **json.loads(probe.stdout.strip().splitlines()[-1])
+        })
+    return results
+
+def workers_scenario(worker_counts, users: int, rows: int, requests: int):
+    from bench import bench_workers
+
+    results = bench_workers.run(worker_counts, users, rows, requests)
+    for result in results:
+        result["name"] = f"workers/{result['workers']}"
+    return results
+
+def normalize_scenario(rows: int, seed: int):
+    from bench.generators import transactions
+    from app.services.normalizer import normalize_rows
+    from app.services.statement_parser import StatementParser
+
+    statement = csv_statement(rows, seed)
+    started = time.perf_counter()
+    parsed = StatementParser().parse(statement, "CSV")
+    csv_s = time.perf_counter() - started
+
+    # Strings in a different date format, as an LLM might answer
+    extracted = [
+        {"date": day.strftime("%m/%d/%Y"), "amount": f"{amount:,.2f}", "description": description}
+        for day, description, amount in transactions(rows, seed)
+    ]
+    started = time.perf_counter()
+    normalized = normalize_rows(extracted, [])
+    llm_s = time.perf_counter() - started
+
+    assert len(parsed) == len(normalized) == rows
+    return [
+        {"name": f"normalize/csv/{rows}", "scenario": "normalize", "rows": rows, "normalize_s": round(csv_s, 3), "rows_per_sec": round(rows / csv_s, 1)},
+        {"name": f"normalize/llm_rows/{rows}", "scenario": "normalize", "rows": rows, "normalize_s": round(llm_s, 3), "rows_per_sec": round(rows / llm_s, 1)}
+    ]
+
+def search_scenario(sizes):
+    from bench import bench_search
+
+    results = bench_search.run(sizes)
+    for result in results:
+        result["name"] = f"search/{result['scenario']}/{result['rows']}"
+        result["scenario"] = "search/" + result["scenario"]
+    return results
+
+def sizes_arg(value: str):
+    return [int(size) for size in value.split(",") if size]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--latency", type=float, default=0.05, help="Fake LLM latency per call (s)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of fake LLM calls that fail with 429/500")
+    parser.add_argument("--rpm", type=int, default=6000, help="Account-wide LLM requests per minute")
+    parser.add_argument("--upload-sizes", type=sizes_arg, default=[10, 1000, 10000, 100000])
+    parser.add_argument("--formats", default="csv,txt", help="Statement formats: csv (parsed locally), txt (LLM extraction)")
+    parser.add_argument("--listing-sizes", type=sizes_arg, default=[1000, 100000])
+    parser.add_argument("--pages", type=int, default=20)
+    parser.add_argument("--limit", type=int, default=100)
+    parser.add_argument("--rule-rows", type=int, default=100000)
+    parser.add_argument("--rule-counts", type=sizes_arg, default=[10, 100, 1000])
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--rows", type=int, default=50)
+    parser.add_argument("--heavy-rows", type=int, default=3000)
+    parser.add_argument("--review-rows", type=int, default=2000)
+    parser.add_argument("--review-rate", type=float, default=0.1, help="Fraction of merchants the fake LLM is unsure about")
+    parser.add_argument("--worker-counts", type=sizes_arg, default=[1, 2, 4])
+    parser.add_argument("--worker-users", type=int, default=16)
+    parser.add_argument("--worker-rows", type=int, default=200)
+    parser.add_argument("--worker-requests", type=int, default=500)
+    parser.add_argument("--normalize-rows", type=int, default=100000)
+    parser.add_argument("--search-sizes", type=sizes_arg, default=[100000, 1000000])
+    args = parser.parse_args()
+
+    scenarios = [name for name in args.scenarios.split(",") if name]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+    # Before anything imports the app, which reads its configuration at import time
+    fake = configure(latency=args.latency, error_rate=args.error_rate, review_rate=args.review_rate, rpm=args.rpm)
+    started = time.perf_counter()
+    results = []
+    try:
+        if {"upload", "concurrent", "review"} & set(scenarios):
+            results += asyncio.run(app_scenarios(fake, scenarios, args))
+        if "listing" in scenarios:
+            results += listing_scenario(args.listing_sizes, args.pages, args.limit, args.seed)
+        if "rules" in scenarios:
+            results += rules_scenario(args.rule_rows, args.rule_counts, args.seed)
+        if "startup" in scenarios:
+            results += startup_scenario()
+        if "workers" in scenarios:
+            results += workers_scenario(args.worker_counts, args.worker_users, args.worker_rows, args.worker_requests)
+        if "normalize" in scenarios:
+            results += normalize_scenario(args.normalize_rows, args.seed)
+        if "search" in scenarios:
+            results += search_scenario(args.search_sizes)
+    finally:
+        fake.stop()
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "duration_s": round(time.perf_counter() - started, 2),
+            "params": {name: value for name, value in vars(args).items() if name != "output"}
+        },
+        "results": results
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+        print(f"Wrote {len(results)} results to {args.output}", file=sys.stderr)
+    else:
+        print(output)
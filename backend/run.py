@@ -2,8 +2,13 @@
 """
 Smart Budget Companion - Backend Server
 Run this script to start the FastAPI server
+    
+    python run.py               development server with auto-reload
+    python run.py --workers 4   production: 4 worker processes, no reload
+    python run.py --workers auto
 """
 
+import argparse
 import uvicorn
 import os
 from dotenv import load_dotenv
@@ -11,7 +16,18 @@ from dotenv import load_dotenv
 # Load environment variables
 load_dotenv()
 
+def workers_arg(value: str) -> int:
+    if value == "auto":
+        return os.cpu_count() or 1
+    return max(1, int(value))
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Start the Smart Budget Companion API")
+    parser.add_argument("--workers", type=workers_arg, help="Worker processes, or 'auto' for one per core; enables production mode")
+    parser.add_argument("--host", default=os.getenv("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "8000")))
+    args = parser.parse_args()
+    
     print("🚀 Starting Smart Budget Companion Backend...")
     print("📊 Make sure to set your OPENAI_API_KEY in backend/.env")
     print("🌐 Frontend will be available at: http://localhost:8000 (after opening frontend/index.html)")
@@ -23,10 +39,22 @@ if __name__ == "__main__":
         print("⚠️  WARNING: OpenAI API key not set! Please update backend/.env with your API key.")
         print()
     
-    uvicorn.run(
-        "app.main:app",
-        host="0.0.0.0",
-        port=8000,
-        reload=True,
-        log_level="info"
-    )
+    if args.workers is None:
+        uvicorn.run(
+            "app.main:app",
+            host=args.host,
+            port=args.port,
+            reload=True,
+            log_level="info"
+        )
+    else:
+        print(f"⚙️  Production mode: {args.workers} worker processes")
+        # Workers read this to split account-wide limits (e.g. the LLM rate limit) between them
+        os.environ["WEB_CONCURRENCY"] = str(args.workers)
+        uvicorn.run(
+            "app.main:app",
+            host=args.host,
+            port=args.port,
+            workers=args.workers,
+            log_level="info"
+        )
@@ -21,7 +21,7 @@ class Dashboard {
             const data = await API.getDashboardData();
             
             this.updateStats(data);
-            this.renderCategories(data.categories);
+            this.renderCategories(data.budget.categories);
             
         } catch (error) {
             console.error('Error loading dashboard:', error);
@@ -30,37 +30,19 @@ class Dashboard {
     }
 
     updateStats(data) {
-        const { transactions, reviewQueue } = data;
-        
         // Total transactions
-        this.totalTransactionsEl.textContent = transactions.length;
+        this.totalTransactionsEl.textContent = data.total_transactions;
         
         // Review count
-        this.reviewCountEl.textContent = reviewQueue.length;
+        this.reviewCountEl.textContent = data.needs_review;
         
         // This month spending
-        const thisMonthSpending = this.calculateMonthSpending(transactions);
-        this.monthSpendingEl.textContent = `$${Math.abs(thisMonthSpending).toFixed(0)}`;
+        this.monthSpendingEl.textContent = `$${Math.abs(data.month_spending).toFixed(0)}`;
         
         // Category count
         this.categoryCountEl.textContent = data.categories.length;
     }
 
-    calculateMonthSpending(transactions) {
-        const now = new Date();
-        const currentMonth = now.getMonth();
-        const currentYear = now.getFullYear();
-        
-        return transactions
-            .filter(t => {
-                const transDate = new Date(t.date);
-                return transDate.getMonth() === currentMonth && 
-                       transDate.getFullYear() === currentYear &&
-                       t.amount < 0; // Only expenses
-            })
-            .reduce((sum, t) => sum + t.amount, 0);
-    }
-
     renderCategories(categories) {
         if (categories.length === 0) {
             this.categoriesListEl.innerHTML = `
@@ -76,7 +58,7 @@ class Dashboard {
                 <div class="category-color" style="background-color: ${category.color}"></div>
                 <div class="category-name">${category.name}</div>
                 <div class="category-type">
-                    ${category.is_custom ? 'Custom' : 'Default'}
+                    $${category.spent.toFixed(0)}${category.budget_limit ? ` / $${category.budget_limit.toFixed(0)}` : ''} this month
                 </div>
             </div>
         `).join('');
@@ -2,18 +2,57 @@
 const API_BASE_URL = 'http://localhost:8000';
 
 class API {
+    // Credentials for the backend: an API token (Authorization: Bearer) when one is
+    // stored, otherwise the household id, which the backend only trusts with
+    // ALLOW_USER_HEADER=true; with neither it serves its default user
+    static userHeaders() {
+        const token = localStorage.getItem('apiToken');
+        if (token) {
+            return { 'Authorization': `Bearer ${token}` };
+        }
+        const userId = localStorage.getItem('userId');
+        return userId ? { 'X-User-Id': userId } : {};
+    }
+
+    // Ask for an API token after a 401; returns whether one was entered
+    static askForToken() {
+        const token = window.prompt('This server requires an API token. Enter your token:');
+        if (!token || !token.trim()) {
+            return false;
+        }
+        localStorage.setItem('apiToken', token.trim());
+        return true;
+    }
+
+    // fetch() with the credentials headers, asking for a token once if the server refuses them
+    static async authorizedFetch(url, options = {}) {
+        const send = () => fetch(url, {
+            ...options,
+            headers: { ...options.headers, ...API.userHeaders() },
+        });
+
+        let response = await send();
+        if (response.status === 401) {
+            localStorage.removeItem('apiToken');
+            if (API.askForToken()) {
+                response = await send();
+            }
+        }
+        return response;
+    }
+
     static async request(endpoint, options = {}) {
         const url = `${API_BASE_URL}${endpoint}`;
         const config = {
+            ...options,
             headers: {
                 'Content-Type': 'application/json',
                 ...options.headers,
             },
-            ...options,
         };
 
         try {
-            const response = await fetch(url, config);
+            const response = await API.authorizedFetch(url, config);
             
             if (!response.ok) {
                 throw new Error(`HTTP error! status: ${response.status}`);
@@ -30,7 +69,7 @@ class API {
         const formData = new FormData();
         formData.append('file', file);
 
-        const response = await fetch(`${API_BASE_URL}/api/upload`, {
+        const response = await API.authorizedFetch(`${API_BASE_URL}/api/upload`, {
             method: 'POST',
             body: formData,
         });
@@ -46,7 +85,14 @@ class API {
         const params = new URLSearchParams();
         
         if (filters.limit) params.append('limit', filters.limit);
+        if (filters.cursor) params.append('cursor', filters.cursor);
         if (filters.needs_review !== undefined) params.append('needs_review', filters.needs_review);
+        if (filters.start_date) params.append('start_date', filters.start_date);
+        if (filters.end_date) params.append('end_date', filters.end_date);
+        if (filters.category_id) params.append('category_id', filters.category_id);
+        if (filters.min_amount !== undefined) params.append('min_amount', filters.min_amount);
+        if (filters.max_amount !== undefined) params.append('max_amount', filters.max_amount);
+        if (filters.q) params.append('q', filters.q);
         
         const queryString = params.toString();
         const endpoint = `/api/transactions${queryString ? '?' + queryString : ''}`;
@@ -63,18 +109,8 @@ class API {
     }
 
     static async getDashboardData() {
-        // Get all data needed for dashboard
-        const [transactions, categories, reviewQueue] = await Promise.all([
-            this.getTransactions({ limit: 1000 }),
-            this.getCategories(),
-            this.getReviewQueue()
-        ]);
-
-        return {
-            transactions: transactions.transactions || [],
-            categories: categories.categories || [],
-            reviewQueue: reviewQueue.transactions || []
-        };
+        // Totals and aggregates are computed server-side in a single request
+        return await this.request('/api/dashboard');
     }
 }
 